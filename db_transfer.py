@@ -0,0 +1,48 @@
+import argparse
+import logging
+import os
+
+from project.src.server.database import DroneDB
+from project.src.server.transfer import (FORMATS, export_metrics, export_missions, import_metrics,
+                                         import_missions, parse_timestamp)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Export or import drone telemetry and missions')
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('table', choices=['metrics', 'missions'])
+    parser.add_argument('path', help="File, archive directory, or '-' for stdout/stdin")
+    parser.add_argument('--format', choices=FORMATS,
+                        help='Defaults to columnar for directories, else the file extension')
+    parser.add_argument('--start', help='Export metrics from this ISO time (UTC) or epoch ms')
+    parser.add_argument('--end', help='Export metrics before this ISO time (UTC) or epoch ms')
+    parser.add_argument('--fields', help='Comma-separated metrics fields to export')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Rows per import transaction')
+    parser.add_argument('--db', default=os.path.join(os.getcwd(), "project", "database", "drone.db"))
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # No retention, so the archive job never runs during a transfer
+    db = DroneDB(args.db, retention_days=None)
+    try:
+        if args.action == 'export' and args.table == 'metrics':
+            fields = [f for f in (args.fields or '').split(',') if f] or None
+            export_metrics(db, args.path, args.format, parse_timestamp(args.start),
+                           parse_timestamp(args.end), fields)
+        elif args.action == 'export':
+            export_missions(db, args.path, args.format)
+        elif args.table == 'metrics':
+            count = import_metrics(db, args.path, args.format, args.batch_size)
+            logger.info(f"Imported {count} metrics rows from {args.path}")
+        else:
+            count = import_missions(db, args.path, args.format)
+            logger.info(f"Imported {count} missions from {args.path}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+MAVLink Link Quality
+Measures packet loss, round-trip latency and traffic rates per vehicle so a
+bad radio link can be told apart from a slow ground station.
+"""
+
+import time
+import logging
+from typing import Dict, Tuple
+
+from project.src.server.monitoring import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the smoothed round-trip time
+RTT_SMOOTHING = 0.2
+
+# A sequence number up to this far behind the last one is a duplicate or reordered packet, not loss
+REORDER_WINDOW = 128
+# Out-of-order packets in a row after which the sender is assumed to have restarted its sequence
+RESYNC_AFTER = 3
+
+LOST = Counter('mavlink_messages_lost', 'MAVLink messages lost, from sequence gaps', ['system_id'])
+LOSS = Gauge('mavlink_link_loss_percent', 'Link loss over the last update interval', ['system_id'])
+RATE = Gauge('mavlink_link_message_rate', 'Messages per second over the last update interval', ['system_id'])
+RTT = Gauge('mavlink_link_rtt_seconds', 'Smoothed TIMESYNC round-trip time', ['system_id'])
+
+
+class LinkStats:
+    """Traffic counters for one system id."""
+    def __init__(self):
+        self.received = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.bytes = 0
+        self.rtt_ms = None
+        # Values at the previous update, for per-interval rates
+        self._last = (0, 0, 0)
+        self.msg_rate = 0.0
+        self.byte_rate = 0.0
+        self.loss_percent = 0.0
+        # Nothing was received during the last update interval
+        self.stale = False
+
+    def to_dict(self) -> dict:
+        return {
+            'received': self.received,
+            'lost': self.lost,
+            'duplicates': self.duplicates,
+            'bytes': self.bytes,
+            'msg_rate': round(self.msg_rate, 1),
+            'byte_rate': round(self.byte_rate, 1),
+            'loss_percent': round(self.loss_percent, 2),
+            'rtt_ms': None if self.rtt_ms is None else round(self.rtt_ms, 1),
+            'stale': self.stale,
+        }
+
+
+class LinkQuality:
+    """Derives loss, latency and rates from the incoming MAVLink stream.
+
+    ``observe`` runs for every message on the reader thread and only does
+    counter arithmetic; rates are computed once per ``update`` call.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.systems: Dict[int, LinkStats] = {}
+        self._last_seq: Dict[Tuple[int, int], int] = {}
+        # Consecutive out-of-order packets per component
+        self._out_of_order: Dict[Tuple[int, int], int] = {}
+        self._last_update = time.monotonic()
+
+    def observe(self, msg):
+        """Count a received message and any sequence numbers skipped before it.
+
+        Packets up to REORDER_WINDOW behind the newest one, such as copies
+        from a redundant link, count as duplicates rather than 255 losses.
+        A run of them means the sender restarted, e.g. after a reboot or a
+        tlog replay looping, and counting resumes from the new sequence.
+        """
+        system_id = msg.get_srcSystem()
+        stats = self.systems.get(system_id)
+        if stats is None:
+            stats = self.systems[system_id] = LinkStats()
+        stats.received += 1
+        stats.bytes += len(msg.get_msgbuf())
+
+        # Sequence numbers are per component
+        key = (system_id, msg.get_srcComponent())
+        seq = msg.get_seq()
+        last = self._last_seq.get(key)
+        if last is not None:
+            gap = (seq - last) % 256
+            if gap == 0 or gap > 256 - REORDER_WINDOW:
+                behind = self._out_of_order.get(key, 0) + 1
+                if behind < RESYNC_AFTER:
+                    self._out_of_order[key] = behind
+                    stats.duplicates += 1
+                    return
+                # The run started a new sequence rather than repeating the old one
+                stats.duplicates -= behind - 1
+            else:
+                stats.lost += gap - 1
+        self._out_of_order[key] = 0
+        self._last_seq[key] = seq
+
+    def handle_timesync(self, msg):
+        """Answer vehicle TIMESYNC requests and time replies to our own."""
+        now_ns = time.monotonic_ns()
+        if msg.tc1 == 0:
+            self.connection.mav.timesync_send(now_ns, msg.ts1)
+            return
+        # Reply to a request we sent: ts1 carries our send time
+        rtt_ms = (now_ns - msg.ts1) / 1e6
+        if not 0 <= rtt_ms < 60000:
+            return
+        stats = self.systems.get(msg.get_srcSystem())
+        if stats is None:
+            return
+        if stats.rtt_ms is None:
+            stats.rtt_ms = rtt_ms
+        else:
+            stats.rtt_ms += RTT_SMOOTHING * (rtt_ms - stats.rtt_ms)
+
+    def update(self, vehicles):
+        """Recompute rates, publish them to vehicle state and send a TIMESYNC probe."""
+        now = time.monotonic()
+        elapsed = max(now - self._last_update, 1e-6)
+        self._last_update = now
+
+        for system_id, stats in self.systems.items():
+            received, lost, total_bytes = stats.received, stats.lost, stats.bytes
+            last_received, last_lost, last_bytes = stats._last
+            stats._last = (received, lost, total_bytes)
+            stats.msg_rate = (received - last_received) / elapsed
+            stats.byte_rate = (total_bytes - last_bytes) / elapsed
+            window_received = received - last_received
+            window_lost = lost - last_lost
+            # A silent link is reported as fully lost, not left at its last value
+            stats.stale = window_received == 0
+            if stats.stale:
+                stats.loss_percent = 100.0
+            else:
+                stats.loss_percent = 100.0 * window_lost / (window_received + window_lost)
+            LOST.labels(system_id).inc(window_lost)
+            LOSS.labels(system_id).set(stats.loss_percent)
+            RATE.labels(system_id).set(stats.msg_rate)
+            if stats.rtt_ms is not None:
+                RTT.labels(system_id).set(stats.rtt_ms / 1000)
+
+            vehicle = vehicles.get(system_id)
+            if vehicle is not None:
+                vehicle.state.update({
+                    'Signal': round(100 - stats.loss_percent),
+                    'LinkLoss': round(stats.loss_percent, 2),
+                    'LinkLatency': None if stats.rtt_ms is None else round(stats.rtt_ms, 1),
+                    'LinkRate': round(stats.msg_rate, 1),
+                })
+
+        try:
+            self.connection.mav.timesync_send(0, time.monotonic_ns())
+        except Exception as e:
+            logger.error(f"Failed to send TIMESYNC: {e}")
+
+    def snapshot(self) -> Dict[int, dict]:
+        """Link statistics per system id."""
+        return {system_id: stats.to_dict() for system_id, stats in list(self.systems.items())}
@@ -0,0 +1,160 @@
+"""
+MAVLink Command Layer
+Sends COMMAND_LONG messages, tracks COMMAND_ACK replies and retransmits
+commands that are not acknowledged in time.
+"""
+
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from pymavlink import mavutil
+
+logger = logging.getLogger(__name__)
+
+
+class CommandTimeout(Exception):
+    """Raised when a command is not acknowledged after all retries."""
+
+
+class PendingCommand:
+    """A command waiting for its COMMAND_ACK."""
+    def __init__(self, command: int, params: tuple, target_system: int,
+                 target_component: int, timeout: float, retries: int):
+        self.command = command
+        self.params = params
+        self.target_system = target_system
+        self.target_component = target_component
+        self.timeout = timeout
+        self.retries = retries
+        self.confirmation = 0
+        self.deadline = 0.0
+        self.future = Future()
+
+
+class CommandManager:
+    """Issues commands to the vehicle and resolves a future per command."""
+    def __init__(self, connection, timeout: float = 1.5, retries: int = 3):
+        self.connection = connection
+        self.timeout = timeout
+        self.retries = retries
+        # In-flight commands keyed by (target_system, target_component, command id)
+        self._pending: Dict[tuple, PendingCommand] = {}
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._thread = threading.Thread(target=self._retry_loop, name='mavlink-commands', daemon=True)
+        self._thread.start()
+
+    def send(self, command: int, *params: float,
+             target_system: Optional[int] = None,
+             target_component: Optional[int] = None,
+             timeout: Optional[float] = None,
+             retries: Optional[int] = None) -> Future:
+        """Send a COMMAND_LONG and return a future resolved with the MAV_RESULT.
+
+        If the same command is already in flight to the same target with the
+        same parameters, its future is returned instead of sending it again.
+        """
+        params = tuple(float(p) for p in params) + (0.0,) * (7 - len(params))
+        if target_system is None:
+            target_system = self.connection.target_system
+        if target_component is None:
+            target_component = self.connection.target_component
+        key = (target_system, target_component, command)
+
+        with self._condition:
+            pending = self._pending.get(key)
+            if pending and not pending.future.done():
+                if pending.params == params:
+                    return pending.future
+                # Superseded by a command with different parameters
+                pending.future.set_exception(CommandTimeout(f"Command {command} superseded"))
+
+            pending = PendingCommand(
+                command, params, target_system, target_component,
+                self.timeout if timeout is None else timeout,
+                self.retries if retries is None else retries)
+            self._pending[key] = pending
+            self._transmit(pending)
+            self._condition.notify()
+        return pending.future
+
+    def handle_ack(self, msg):
+        """Resolve the matching in-flight command from a COMMAND_ACK."""
+        key = (msg.get_srcSystem(), msg.get_srcComponent(), msg.command)
+        with self._condition:
+            pending = self._pending.get(key)
+            if pending is None:
+                # Fall back to the command id alone for routers that rewrite the component
+                for candidate_key, candidate in self._pending.items():
+                    if candidate.command == msg.command and candidate.target_system == key[0]:
+                        key, pending = candidate_key, candidate
+                        break
+            if pending is None:
+                return
+
+            if msg.result == mavutil.mavlink.MAV_RESULT_IN_PROGRESS:
+                # Long-running command: keep waiting without retransmitting
+                pending.deadline = time.monotonic() + pending.timeout
+                return
+
+            del self._pending[key]
+        if not pending.future.done():
+            pending.future.set_result(msg.result)
+
+    def close(self):
+        """Stop the retry thread and fail every in-flight command."""
+        with self._condition:
+            self._shutdown = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._condition.notify()
+        for command in pending:
+            if not command.future.done():
+                command.future.set_exception(CommandTimeout("Connection closed"))
+        self._thread.join(2)
+
+    def in_flight(self) -> int:
+        """Number of commands still waiting for an acknowledgement."""
+        with self._condition:
+            return len(self._pending)
+
+    def _transmit(self, pending: PendingCommand):
+        """Send a command; the confirmation field counts retransmissions."""
+        self.connection.mav.command_long_send(
+            pending.target_system,
+            pending.target_component,
+            pending.command,
+            pending.confirmation,
+            *pending.params)
+        pending.deadline = time.monotonic() + pending.timeout
+
+    def _retry_loop(self):
+        """Retransmit expired commands and time out those out of retries."""
+        with self._condition:
+            while not self._shutdown:
+                now = time.monotonic()
+                for key, pending in list(self._pending.items()):
+                    if pending.deadline > now:
+                        continue
+                    if pending.confirmation >= pending.retries:
+                        del self._pending[key]
+                        pending.future.set_exception(CommandTimeout(
+                            f"No COMMAND_ACK for command {pending.command} "
+                            f"after {pending.confirmation + 1} attempts"))
+                        continue
+                    pending.confirmation += 1
+                    logger.warning(f"Retrying command {pending.command} "
+                                   f"(attempt {pending.confirmation + 1})")
+                    try:
+                        self._transmit(pending)
+                    except Exception as e:
+                        logger.error(f"Failed to resend command {pending.command}: {e}")
+
+                if self._pending:
+                    wait = min(p.deadline for p in self._pending.values()) - time.monotonic()
+                    self._condition.wait(max(wait, 0.01))
+                else:
+                    self._condition.wait()
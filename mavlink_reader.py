@@ -0,0 +1,237 @@
+"""
+MAVLink Telemetry Reader
+Reads the MAVLink stream on a dedicated thread and decodes it into the
+telemetry state of each vehicle on the link.
+"""
+
+import math
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+from pymavlink import mavutil
+
+from link_quality import LinkQuality
+from project.src.server.monitoring import Counter
+from vehicles import Vehicle, VehicleRegistry
+
+logger = logging.getLogger(__name__)
+
+# Telemetry messages requested from the autopilot and their stream rates in Hz.
+# HEARTBEAT is always sent at 1 Hz by the autopilot, so it is not requested.
+DEFAULT_MESSAGE_RATES = {
+    'GLOBAL_POSITION_INT': 10,
+    'SYS_STATUS': 2,
+    'VFR_HUD': 10,
+    'ATTITUDE': 20,
+}
+
+# Seconds without a vehicle heartbeat before the link is reported as lost
+HEARTBEAT_TIMEOUT = 5
+
+MESSAGES = Counter('mavlink_messages', 'MAVLink messages received', ['type'])
+ERRORS = Counter('mavlink_errors', 'MAVLink read and decode errors')
+
+
+class MavlinkReader:
+    """Decodes MAVLink telemetry into per-vehicle state on a background thread.
+
+    ``state`` is used for the vehicle the connection locked onto; every
+    other vehicle on the link gets its own state in ``vehicles``.
+    """
+    def __init__(self, connection, state: dict,
+                 message_rates: Optional[Dict[str, float]] = None,
+                 timeout: float = 0.5):
+        self.connection = connection
+        self.state = state
+        self.vehicles = VehicleRegistry(state, on_register=self._on_new_vehicle)
+        self.message_rates = dict(DEFAULT_MESSAGE_RATES if message_rates is None else message_rates)
+        self.timeout = timeout
+        # Allow-list of message types decoded into vehicle state
+        self.decoders = {
+            'GLOBAL_POSITION_INT': self._on_global_position_int,
+            'SYS_STATUS': self._on_sys_status,
+            'VFR_HUD': self._on_vfr_hud,
+            'ATTITUDE': self._on_attitude,
+            'HEARTBEAT': self._on_heartbeat,
+        }
+        self.link = LinkQuality(connection)
+        # Additional per-type listeners, e.g. COMMAND_ACK tracking
+        self.handlers = {'TIMESYNC': self.link.handle_timesync}
+        self.counters = {
+            'received': 0,
+            'decoded': 0,
+            'ignored': 0,
+            'bad_data': 0,
+            'errors': 0,
+        }
+        # Optional TlogRecorder receiving every valid message
+        self.recorder = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the reader thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        if self.connection.target_system:
+            # Its first heartbeat was consumed while connecting
+            self.vehicles.register(self.connection.target_system,
+                                   self.connection.target_component,
+                                   self.connection.target_system)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='mavlink-reader', daemon=True)
+        self._thread.start()
+        logger.info("MAVLink reader started")
+
+    def stop(self, timeout: float = 2):
+        """Stop the reader thread and wait for it to exit."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("MAVLink reader stopped")
+
+    def add_handler(self, msg_type: str, handler):
+        """Route messages of the given type to an additional handler."""
+        self.handlers[msg_type] = handler
+
+    def request_message_intervals(self, target_system: Optional[int] = None,
+                                  target_component: Optional[int] = None):
+        """Ask an autopilot to stream each telemetry message at its configured rate."""
+        if target_system is None:
+            target_system = self.connection.target_system
+            target_component = self.connection.target_component
+        for name, rate_hz in self.message_rates.items():
+            message_id = getattr(mavutil.mavlink, f'MAVLINK_MSG_ID_{name}')
+            interval_us = int(1e6 / rate_hz) if rate_hz > 0 else -1
+            self.connection.mav.command_long_send(
+                target_system,
+                target_component,
+                mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+                0, message_id, interval_us, 0, 0, 0, 0, 0)
+            logger.info(f"Requested {name} at {rate_hz} Hz from system {target_system}")
+
+    def get_stats(self) -> dict:
+        """Return message counters, including messages lost on the link."""
+        stats = dict(self.counters)
+        stats['dropped'] = getattr(self.connection, 'mav_loss', 0)
+        stats['vehicles'] = len(self.vehicles)
+        stats['link'] = self.link.snapshot()
+        return stats
+
+    def _run(self):
+        """Reader loop: block on the link and dispatch every message."""
+        next_check = time.monotonic() + 1
+        while not self._stop_event.is_set():
+            try:
+                msg = self.connection.recv_match(blocking=True, timeout=self.timeout)
+            except Exception as e:
+                self.counters['errors'] += 1
+                ERRORS.inc()
+                logger.error(f"MAVLink read error: {e}")
+                self._stop_event.wait(1)
+                continue
+
+            if msg is not None:
+                self.dispatch(msg)
+            if time.monotonic() >= next_check:
+                self._check_heartbeats()
+                self.link.update(self.vehicles)
+                next_check = time.monotonic() + 1
+
+    def dispatch(self, msg):
+        """Decode a single message into the state of the vehicle that sent it."""
+        self.counters['received'] += 1
+        msg_type = msg.get_type()
+        MESSAGES.labels(msg_type).inc()
+        if msg_type == 'BAD_DATA':
+            self.counters['bad_data'] += 1
+            return
+        self.link.observe(msg)
+        if self.recorder:
+            self.recorder.write(msg)
+
+        decoder = self.decoders.get(msg_type)
+        handler = self.handlers.get(msg_type)
+        if decoder is None and handler is None:
+            self.counters['ignored'] += 1
+            return
+
+        try:
+            if handler:
+                handler(msg)
+            if decoder:
+                vehicle = self.vehicles.route(msg, self.connection.target_system)
+                if vehicle is None:
+                    # Not from a known vehicle and not an autopilot heartbeat
+                    self.counters['ignored'] += 1
+                    return
+                decoder(msg, vehicle)
+            self.counters['decoded'] += 1
+        except Exception as e:
+            self.counters['errors'] += 1
+            ERRORS.inc()
+            logger.error(f"Failed to decode {msg_type}: {e}")
+
+    def _on_new_vehicle(self, vehicle: Vehicle):
+        """Configure telemetry streaming for a newly seen vehicle."""
+        try:
+            self.request_message_intervals(vehicle.system_id, vehicle.component_id)
+        except Exception as e:
+            logger.error(f"Failed to request telemetry from system {vehicle.system_id}: {e}")
+
+    def _check_heartbeats(self):
+        """Mark vehicles disconnected when their heartbeats stop arriving."""
+        now = time.monotonic()
+        for vehicle in self.vehicles.all():
+            if vehicle.last_heartbeat and now - vehicle.last_heartbeat > HEARTBEAT_TIMEOUT:
+                if vehicle.state.get('Status') != 'Disconnected':
+                    logger.warning(f"Heartbeat lost from system {vehicle.system_id}")
+                vehicle.state['Status'] = 'Disconnected'
+
+    def _on_global_position_int(self, msg, vehicle: Vehicle):
+        update = {
+            'Location': [msg.lat / 1e7, msg.lon / 1e7],
+            'Altitude': round(msg.relative_alt / 1000.0, 2),
+            'Speed': round(math.hypot(msg.vx, msg.vy) / 100.0, 2),
+        }
+        if msg.hdg != 65535:
+            update['Heading'] = round(msg.hdg / 100.0)
+        vehicle.state.update(update)
+
+    def _on_sys_status(self, msg, vehicle: Vehicle):
+        update = {'Voltage': round(msg.voltage_battery / 1000.0, 2)}
+        if msg.battery_remaining >= 0:
+            update['Battery'] = msg.battery_remaining
+        vehicle.state.update(update)
+
+    def _on_vfr_hud(self, msg, vehicle: Vehicle):
+        vehicle.state.update({
+            'Speed': round(msg.groundspeed, 2),
+            'Heading': msg.heading,
+            'Climb': round(msg.climb, 2),
+            'Throttle': msg.throttle,
+        })
+
+    def _on_attitude(self, msg, vehicle: Vehicle):
+        vehicle.state.update({
+            'Roll': round(math.degrees(msg.roll), 1),
+            'Pitch': round(math.degrees(msg.pitch), 1),
+        })
+
+    def _on_heartbeat(self, msg, vehicle: Vehicle):
+        # Companion components of a vehicle also send heartbeats
+        if msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID:
+            return
+        if not vehicle.component_id:
+            vehicle.component_id = msg.get_srcComponent()
+        elif msg.get_srcComponent() != vehicle.component_id:
+            return
+        vehicle.last_heartbeat = time.monotonic()
+        vehicle.state.update({
+            'Status': 'Connected',
+            'Armed': bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED),
+            'Mode': mavutil.mode_string_v10(msg),
+        })
@@ -0,0 +1,325 @@
+"""
+Mission Upload
+Compiles stored missions into MAVLink mission items and uploads them with
+the MAVLink mission protocol, skipping vehicles that already hold the
+same mission.
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+import logging
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from pymavlink import mavutil
+
+from project.src.server.missions import WaypointAction
+
+logger = logging.getLogger(__name__)
+
+MISSION_TYPE = mavutil.mavlink.MAV_MISSION_TYPE_MISSION
+FRAME_RELATIVE_ALT = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+
+ACTION_COMMANDS = {
+    'waypoint': mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+    'takeoff': mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+    'land': mavutil.mavlink.MAV_CMD_NAV_LAND,
+    'loiter': mavutil.mavlink.MAV_CMD_NAV_LOITER_TIME,
+    'rtl': mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH,
+}
+
+
+class MissionUploadError(Exception):
+    """Raised when the vehicle rejects or never completes a mission upload."""
+
+
+class MissionItem(NamedTuple):
+    """Fields of a MISSION_ITEM_INT, excluding the target ids."""
+    seq: int
+    frame: int
+    command: int
+    current: int
+    autocontinue: int
+    param1: float
+    param2: float
+    param3: float
+    param4: float
+    x: int
+    y: int
+    z: float
+
+
+class CompiledMission(NamedTuple):
+    """Mission items together with the content hash they were compiled from."""
+    mission_hash: str
+    items: Tuple[MissionItem, ...]
+
+
+@lru_cache(maxsize=64)
+def compile_mission(waypoints_json: str) -> CompiledMission:
+    """Compile a mission's JSON waypoint list into MAVLink mission items.
+
+    Results are cached by content hash, so recompiling an unchanged mission
+    is a dictionary lookup.
+    """
+    waypoints = json.loads(waypoints_json or '[]')
+    canonical = json.dumps(waypoints, sort_keys=True, separators=(',', ':'))
+    return _compile_canonical(canonical)
+
+
+@lru_cache(maxsize=64)
+def _compile_canonical(canonical: str) -> CompiledMission:
+    waypoints = json.loads(canonical)
+    if not waypoints:
+        raise ValueError("Mission has no waypoints")
+
+    items: List[MissionItem] = []
+    for waypoint in waypoints:
+        lat, lng = _waypoint_position(waypoint)
+        action = WaypointAction(
+            action_type=waypoint.get('action', 'waypoint'),
+            altitude=_waypoint_altitude(waypoint),
+            duration=waypoint.get('duration'))
+        if not items:
+            # Sequence 0 is the home position on ArduPilot
+            items.append(_item(0, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, lat, lng, 0,
+                               frame=mavutil.mavlink.MAV_FRAME_GLOBAL_INT))
+
+        param1 = action.duration if action.action_type == 'loiter' else 0
+        if action.action_type == 'rtl':
+            lat = lng = 0
+        items.append(_item(len(items), ACTION_COMMANDS[action.action_type],
+                           lat, lng, action.altitude, param1=param1))
+
+    mission_hash = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return CompiledMission(mission_hash, tuple(items))
+
+
+def _waypoint_position(waypoint: dict) -> Tuple[float, float]:
+    """Accept both the stored {lat, lng} form and the planner's position pair."""
+    if 'position' in waypoint:
+        lat, lng = waypoint['position']
+    else:
+        lat, lng = waypoint.get('lat', 0), waypoint.get('lng', waypoint.get('lon', 0))
+    return float(lat), float(lng)
+
+
+def _waypoint_altitude(waypoint: dict) -> float:
+    """Altitude in meters; the planner stores height in feet."""
+    if 'alt' in waypoint:
+        return float(waypoint['alt'])
+    return float(waypoint.get('height', 0)) * 0.3048
+
+
+def same_items(ours: Tuple[MissionItem, ...], theirs: List[MissionItem]) -> bool:
+    """Whether items downloaded from a vehicle are the mission we compiled.
+
+    The home item (seq 0) is rewritten by the vehicle and ``current``
+    marks its progress, so neither is compared; the vehicle holds params
+    and altitude as float32.
+    """
+    if len(ours) != len(theirs):
+        return False
+    for a, b in zip(ours[1:], theirs[1:]):
+        if (a.frame, a.command, a.autocontinue, a.x, a.y) != (b.frame, b.command, b.autocontinue, b.x, b.y):
+            return False
+        if not all(math.isclose(p, q, rel_tol=1e-6, abs_tol=1e-3)
+                   for p, q in zip((a.param1, a.param2, a.param3, a.param4, a.z),
+                                   (b.param1, b.param2, b.param3, b.param4, b.z))):
+            return False
+    return True
+
+
+def _item(seq: int, command: int, lat: float, lng: float, alt: float,
+          param1: float = 0, frame: int = FRAME_RELATIVE_ALT) -> MissionItem:
+    return MissionItem(seq, frame, command, 0, 1, float(param1), 0.0, 0.0, 0.0,
+                       int(round(lat * 1e7)), int(round(lng * 1e7)), float(alt))
+
+
+class _Transfer:
+    """State of one mission protocol exchange with a vehicle."""
+    def __init__(self, target_component: int, items: Tuple[MissionItem, ...] = ()):
+        self.target_component = target_component
+        self.items = items
+        self.requested = -1
+        self.done = threading.Event()
+        self.count = None
+        self.opaque_id = 0
+        self.error = None
+        # Items read back from the vehicle, for a download
+        self.downloaded: Optional[List[MissionItem]] = None
+
+
+class MissionUploader:
+    """Runs the MAVLink mission upload protocol on top of MavlinkReader.
+
+    Item requests are answered directly on the reader thread as they
+    arrive, so the transfer is limited by the link rather than by polling.
+    """
+    def __init__(self, connection, reader, timeout: float = 1.5, retries: int = 5):
+        self.connection = connection
+        self.timeout = timeout
+        self.retries = retries
+        self._transfers: Dict[int, _Transfer] = {}
+        self._lock = threading.Lock()
+        reader.add_handler('MISSION_REQUEST_INT', self._on_request)
+        reader.add_handler('MISSION_REQUEST', self._on_request)
+        reader.add_handler('MISSION_ACK', self._on_ack)
+        reader.add_handler('MISSION_COUNT', self._on_count)
+        reader.add_handler('MISSION_ITEM_INT', self._on_item)
+
+    def upload(self, mission: CompiledMission, target_system: int, target_component: int,
+               last_upload: Optional[dict] = None, force: bool = False) -> dict:
+        """Upload a compiled mission unless the vehicle already holds it.
+
+        ``last_upload`` is the stored record of the previous upload to this
+        vehicle. The upload is skipped when that record has the same hash,
+        the vehicle reports the same item count, and the vehicle's mission
+        opaque id is the one recorded. Vehicles without opaque ids may hold
+        a different mission with the same count, edited on the vehicle or
+        sent by another ground station, so their items are downloaded and
+        compared instead.
+        """
+        start = time.monotonic()
+        item_count = len(mission.items)
+        if not force and last_upload and last_upload['mission_hash'] == mission.mission_hash:
+            count, opaque_id = self.query_count(target_system, target_component)
+            if count != item_count:
+                held = False
+            elif opaque_id:
+                held = opaque_id == last_upload['opaque_id']
+            else:
+                held = same_items(mission.items, self.download(target_system, target_component, count))
+            if held:
+                logger.info(f"System {target_system} already holds mission {mission.mission_hash[:12]}")
+                return {'skipped': True, 'items': item_count, 'opaque_id': opaque_id,
+                        'seconds': round(time.monotonic() - start, 3)}
+
+        transfer = self._begin(target_system, _Transfer(target_component, mission.items))
+        try:
+            send_count = lambda: self.connection.mav.mission_count_send(
+                target_system, target_component, item_count, MISSION_TYPE)
+            self._wait(transfer, send_count, target_system)
+        finally:
+            self._end(target_system)
+
+        elapsed = time.monotonic() - start
+        logger.info(f"Uploaded {item_count} mission items to system {target_system} in {elapsed:.2f}s")
+        return {'skipped': False, 'items': item_count, 'opaque_id': transfer.opaque_id,
+                'seconds': round(elapsed, 3)}
+
+    def query_count(self, target_system: int, target_component: int) -> Tuple[int, int]:
+        """Ask the vehicle how many mission items it holds and its mission id."""
+        transfer = self._begin(target_system, _Transfer(target_component))
+        try:
+            request_list = lambda: self.connection.mav.mission_request_list_send(
+                target_system, target_component, MISSION_TYPE)
+            self._wait(transfer, request_list, target_system)
+        finally:
+            self._end(target_system)
+        return transfer.count, transfer.opaque_id
+
+    def download(self, target_system: int, target_component: int, count: int) -> List[MissionItem]:
+        """Read ``count`` mission items back from the vehicle, one request at a time."""
+        transfer = self._begin(target_system, _Transfer(target_component))
+        transfer.downloaded = []
+        try:
+            for seq in range(count):
+                transfer.done.clear()
+                request_item = lambda seq=seq: self.connection.mav.mission_request_int_send(
+                    target_system, target_component, seq, MISSION_TYPE)
+                self._wait(transfer, request_item, target_system)
+            self.connection.mav.mission_ack_send(
+                target_system, target_component, mavutil.mavlink.MAV_MISSION_ACCEPTED, MISSION_TYPE)
+        finally:
+            self._end(target_system)
+        return transfer.downloaded
+
+    def _begin(self, target_system: int, transfer: _Transfer) -> _Transfer:
+        with self._lock:
+            if target_system in self._transfers:
+                raise MissionUploadError(f"Mission transfer already in progress for system {target_system}")
+            self._transfers[target_system] = transfer
+        return transfer
+
+    def _end(self, target_system: int):
+        with self._lock:
+            self._transfers.pop(target_system, None)
+
+    def _wait(self, transfer: _Transfer, send_initial, target_system: int):
+        """Send the opening message and resend it until the vehicle responds."""
+        send_initial()
+        attempts = 0
+        last_progress = transfer.requested
+        while not transfer.done.wait(self.timeout):
+            if transfer.requested != last_progress:
+                # Items are still flowing; only a stalled transfer counts as a retry
+                last_progress = transfer.requested
+                attempts = 0
+                continue
+            attempts += 1
+            if attempts > self.retries:
+                raise MissionUploadError(f"Mission transfer to system {target_system} timed out")
+            if transfer.requested < 0:
+                send_initial()
+            else:
+                self._send_item(transfer, target_system, transfer.requested)
+        if transfer.error:
+            raise MissionUploadError(transfer.error)
+
+    def _send_item(self, transfer: _Transfer, target_system: int, seq: int):
+        item = transfer.items[seq]
+        self.connection.mav.mission_item_int_send(
+            target_system, transfer.target_component, *item, MISSION_TYPE)
+
+    def _on_request(self, msg):
+        """Answer an item request from the vehicle immediately."""
+        transfer = self._transfers.get(msg.get_srcSystem())
+        if transfer is None or not transfer.items:
+            return
+        if getattr(msg, 'mission_type', MISSION_TYPE) != MISSION_TYPE:
+            return
+        if msg.seq >= len(transfer.items):
+            return
+        transfer.requested = msg.seq
+        self._send_item(transfer, msg.get_srcSystem(), msg.seq)
+
+    def _on_ack(self, msg):
+        transfer = self._transfers.get(msg.get_srcSystem())
+        if transfer is None or not transfer.items:
+            return
+        if getattr(msg, 'mission_type', MISSION_TYPE) != MISSION_TYPE:
+            return
+        if msg.type != mavutil.mavlink.MAV_MISSION_ACCEPTED:
+            # An unknown code still rejects the upload, rather than raising on the reader thread
+            entry = mavutil.mavlink.enums['MAV_MISSION_RESULT'].get(msg.type)
+            transfer.error = f"Vehicle rejected mission: {entry.name if entry else msg.type}"
+        transfer.opaque_id = getattr(msg, 'opaque_id', 0)
+        transfer.done.set()
+
+    def _on_count(self, msg):
+        transfer = self._transfers.get(msg.get_srcSystem())
+        if transfer is None or transfer.items or transfer.downloaded is not None:
+            return
+        if getattr(msg, 'mission_type', MISSION_TYPE) != MISSION_TYPE:
+            return
+        transfer.count = msg.count
+        transfer.opaque_id = getattr(msg, 'opaque_id', 0)
+        transfer.done.set()
+
+    def _on_item(self, msg):
+        """Collect an item the vehicle sent back for a download."""
+        transfer = self._transfers.get(msg.get_srcSystem())
+        if transfer is None or transfer.downloaded is None:
+            return
+        if getattr(msg, 'mission_type', MISSION_TYPE) != MISSION_TYPE:
+            return
+        if msg.seq != len(transfer.downloaded):
+            return
+        transfer.downloaded.append(MissionItem(
+            msg.seq, msg.frame, msg.command, msg.current, msg.autocontinue,
+            msg.param1, msg.param2, msg.param3, msg.param4, msg.x, msg.y, msg.z))
+        transfer.done.set()
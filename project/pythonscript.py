@@ -14,19 +14,13 @@ import logging
 import asyncio
 import websockets
 import json
-import random
+import argparse
 from typing import Optional
 from flask import Flask
+from src.server.clock import SimClock
+from src.server.log_config import add_logging_arguments, setup_logging
 
-# Logging configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('drone.log'),
-        logging.StreamHandler()
-    ]
-)
+# Logging is configured by setup_logging() in main()
 logger = logging.getLogger(__name__)
 
 # Global state variables
@@ -56,17 +50,18 @@ class InternetMonitor:
         except (subprocess.TimeoutExpired, subprocess.SubprocessError):
             return False
 
-async def update_drone_state():
-    """Update drone state with random values"""
+async def update_drone_state(clock: SimClock):
+    """Update drone state with random values, paced by the clock"""
+    rng = clock.random
     while True:
-        DRONE_STATE['Battery'] = max(0, min(100, DRONE_STATE['Battery'] + random.randint(-5, 3)))
-        DRONE_STATE['Altitude'] = max(0, min(100, DRONE_STATE['Altitude'] + random.randint(-2, 2)))
-        DRONE_STATE['Signal'] = max(0, min(100, DRONE_STATE['Signal'] + random.randint(-10, 10)))
-        DRONE_STATE['Speed'] = max(0, min(30, DRONE_STATE['Speed'] + random.randint(-3, 3)))
-        DRONE_STATE['Heading'] = (DRONE_STATE['Heading'] + random.randint(-10, 10)) % 360
-        DRONE_STATE['Location']['lat'] += random.uniform(-0.0001, 0.0001)
-        DRONE_STATE['Location']['lng'] += random.uniform(-0.0001, 0.0001)
-        await asyncio.sleep(1)
+        DRONE_STATE['Battery'] = max(0, min(100, DRONE_STATE['Battery'] + rng.randint(-5, 3)))
+        DRONE_STATE['Altitude'] = max(0, min(100, DRONE_STATE['Altitude'] + rng.randint(-2, 2)))
+        DRONE_STATE['Signal'] = max(0, min(100, DRONE_STATE['Signal'] + rng.randint(-10, 10)))
+        DRONE_STATE['Speed'] = max(0, min(30, DRONE_STATE['Speed'] + rng.randint(-3, 3)))
+        DRONE_STATE['Heading'] = (DRONE_STATE['Heading'] + rng.randint(-10, 10)) % 360
+        DRONE_STATE['Location']['lat'] += rng.uniform(-0.0001, 0.0001)
+        DRONE_STATE['Location']['lng'] += rng.uniform(-0.0001, 0.0001)
+        await clock.asleep(1)
 
 async def websocket_handler(websocket):
     """Handle WebSocket connections"""
@@ -83,7 +78,8 @@ async def websocket_handler(websocket):
 
 class DroneSystem:
     """Main system to manage drone operations."""
-    def __init__(self):
+    def __init__(self, clock: Optional[SimClock] = None):
+        self.clock = clock or SimClock()
         self.internet_monitor = InternetMonitor()
         self._shutdown_flag = False
         self.web_app_process = None
@@ -167,7 +163,7 @@ class DroneSystem:
                 return
 
             # Start the state update task
-            asyncio.create_task(update_drone_state())
+            asyncio.create_task(update_drone_state(self.clock))
             
             # Start WebSocket server
             async with websockets.serve(websocket_handler, "localhost", self.websocket_port):
@@ -186,9 +182,20 @@ class DroneSystem:
             logger.error(f"Unexpected error: {e}")
             self.shutdown()
 
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='Drone Control System')
+    parser.add_argument('--seed', type=int, help='Random seed, for reproducible runs')
+    parser.add_argument('--speed', type=float,
+                        help='Run on a virtual clock at this multiple of real time (0 = as fast as possible)')
+    add_logging_arguments(parser)
+    return parser.parse_args()
+
 def main():
     """Application entry point."""
-    drone_system = DroneSystem()
+    args = parse_args()
+    setup_logging(args.log_file, args.log_level, args.log_json, args.log_rotate)
+    drone_system = DroneSystem(SimClock(args.speed, args.seed))
     asyncio.run(drone_system.run())
 
 if __name__ == "__main__":
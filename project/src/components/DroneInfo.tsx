@@ -29,8 +29,8 @@ const DroneInfo: React.FC<DroneInfoProps> = ({ info }) => {
     LandingStation: 'Closed'
   });
 
-  // Replace localhost with your computer's IP address
-  const WS_URL = `ws://${window.location.hostname}:8765`;
+  // The server accepts WebSocket upgrades on the same port as the page
+  const WS_URL = `ws://${window.location.host}/ws`;
 
   // WebSocket connection for real-time updates
   useEffect(() => {
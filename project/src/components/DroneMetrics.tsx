@@ -24,7 +24,7 @@ const DroneMetrics: React.FC = () => {
   const RETRY_INTERVAL = 3000;
 
   const connectWebSocket = useCallback(() => {
-    const ws = new WebSocket('ws://localhost:8765');
+    const ws = new WebSocket(`ws://${window.location.host}/ws`);
     
     ws.onopen = () => {
       console.log('WebSocket Connected');
@@ -7,12 +7,12 @@ const CameraView: React.FC = () => {
   const [retryCount, setRetryCount] = useState(0);
 
   const getStreamUrl = () => {
-    return `http://${window.location.hostname}:5000/video_feed?t=${Date.now()}`;
+    return `/video_feed?t=${Date.now()}`;
   };
 
   const checkServer = async () => {
     try {
-      const response = await fetch(`http://${window.location.hostname}:5000/health`);
+      const response = await fetch('/health');
       return response.ok;
     } catch {
       return false;
@@ -14,7 +14,7 @@ const router = createBrowserRouter(
   }
 );
 
-const WS_URL = import.meta.env.VITE_WS_URL || 'ws://localhost:8765';
+const WS_URL = import.meta.env.VITE_WS_URL || `ws://${window.location.host}/ws`;
 
 const [wsStatus, setWsStatus] = useState<'connecting' | 'connected' | 'disconnected'>('connecting');
 
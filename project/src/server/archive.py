@@ -0,0 +1,369 @@
+import logging
+import os
+import shutil
+from itertools import islice
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Columns stored as fixed-width strings; everything else is float64 with NaN for missing
+TEXT_FIELDS = {'arm_status', 'landing_station', 'mission_status', 'current_mission'}
+
+
+# Days archived before timestamps moved to milliseconds hold epoch seconds
+LEGACY_SECONDS_LIMIT = 10 ** 11
+
+# Rows converted to arrays, or copied into a day's files, at a time by DayWriter
+WRITE_CHUNK = 10000
+
+
+def _day(timestamp_ms):
+    return str(np.datetime64(int(timestamp_ms), 'ms').astype('datetime64[D]'))
+
+
+def _column(field, values):
+    """Array for one field of a list of values, with '' or NaN for missing ones"""
+    if field in TEXT_FIELDS:
+        return np.array(['' if value is None else str(value) for value in values], dtype=str)
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def _missing(field, count):
+    """``count`` missing values of a field, without allocating them"""
+    return np.broadcast_to(np.array('' if field in TEXT_FIELDS else np.nan), (count,))
+
+
+def _gather(sources, index):
+    """Values at ``index`` of the concatenation of ``sources``, without concatenating them"""
+    starts = np.cumsum([0] + [len(source) for source in sources])
+    which = np.searchsorted(starts, index, 'right') - 1
+    values = np.empty(len(index), dtype=np.result_type(*sources))
+    for i, source in enumerate(sources):
+        mask = which == i
+        if mask.any():
+            values[mask] = source[index[mask] - starts[i]]
+    return values
+
+
+def _to_python(values, field):
+    """Array slice to a list with None for missing values"""
+    if field in TEXT_FIELDS:
+        return [value or None for value in values.tolist()]
+    return [None if value != value else value for value in values.tolist()]
+
+
+class MetricsArchive:
+    """Per-day columnar archive of drone_metrics rows.
+
+    Each day is a directory holding one ``.npy`` array per column, sorted by
+    (timestamp, id), with ``timestamp`` as epoch milliseconds. Reads memory-map
+    the arrays, so range queries and analytics never load a whole day.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._recover()
+
+    def _recover(self):
+        """Undo or finish day writes interrupted by a crash"""
+        for name in os.listdir(self.root):
+            day, suffix = os.path.splitext(name)
+            path = os.path.join(self.root, name)
+            if suffix in ('.new', '.tmp'):
+                shutil.rmtree(path, ignore_errors=True)
+            elif suffix == '.old':
+                if os.path.isdir(os.path.join(self.root, day)):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    # The day was moved aside but its replacement never moved in
+                    os.replace(path, os.path.join(self.root, day))
+                    logger.warning(f"Restored archive day {day} after an interrupted write")
+
+    def days(self):
+        return sorted(name for name in os.listdir(self.root)
+                      if len(name) == 10 and os.path.isdir(os.path.join(self.root, name)))
+
+    def load_day(self, day, fields=None):
+        """Memory-mapped column arrays for one day, including id and timestamp"""
+        path = os.path.join(self.root, day)
+        names = ['id', 'timestamp'] + list(fields if fields is not None else
+                                           [f[:-4] for f in os.listdir(path) if f.endswith('.npy')])
+        columns = {}
+        for name in dict.fromkeys(names):
+            file = os.path.join(path, f'{name}.npy')
+            if os.path.exists(file):
+                columns[name] = np.load(file, mmap_mode='r')
+        # Days written with float keys are read back as integers, so cursors stay valid
+        for name in ('id', 'timestamp'):
+            if name in columns and columns[name].dtype.kind == 'f':
+                columns[name] = columns[name].astype(np.int64)
+        timestamps = columns.get('timestamp')
+        if timestamps is not None and len(timestamps) and timestamps[-1] < LEGACY_SECONDS_LIMIT:
+            columns['timestamp'] = timestamps * 1000
+        return columns
+
+    def writer(self, day, fields):
+        """A DayWriter adding rows with ``fields`` to one day"""
+        return DayWriter(self, day, fields)
+
+    def append(self, day, rows, fields):
+        """Add metrics rows from one day, merging with any already archived; returns how many were new"""
+        with self.writer(day, fields) as writer:
+            writer.write(rows)
+        return writer.added
+
+    def _swap(self, day, tmp):
+        """Move a fully written ``tmp`` directory into place as ``day``.
+
+        A crash between the two renames leaves only ``<day>.old``, which
+        ``_recover`` moves back on the next start.
+        """
+        path = os.path.join(self.root, day)
+        old = path + '.old'
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.isdir(path):
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def iter_days(self, start=None, end=None, fields=None, after=None, descending=False, primary_only=False):
+        """Yield (day, columns) with each column sliced to the requested range.
+
+        ``start`` and ``end`` are epoch milliseconds, ``after`` a (timestamp, id)
+        keyset position; slices are views on the memory-mapped files.
+        ``primary_only`` drops other vehicles' rows, which copies the slices.
+        """
+        days = self.days()
+        if descending:
+            days.reverse()
+        first_day = _day(start) if start is not None else None
+        last_day = _day(end) if end is not None else None
+        for day in days:
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            names = fields
+            if primary_only and fields is not None:
+                names = list(fields) + ['system_id']
+            columns = self.load_day(day, names)
+            timestamps, ids = columns['timestamp'], columns['id']
+            lo, hi = 0, len(timestamps)
+            if start is not None:
+                lo = int(np.searchsorted(timestamps, start, 'left'))
+            if end is not None:
+                hi = int(np.searchsorted(timestamps, end, 'left'))
+            if after is not None:
+                first = int(np.searchsorted(timestamps, after[0], 'left'))
+                last = int(np.searchsorted(timestamps, after[0], 'right'))
+                # Rows sharing the cursor's timestamp are ordered by id
+                if descending:
+                    hi = min(hi, first + int(np.searchsorted(ids[first:last], after[1], 'left')))
+                else:
+                    lo = max(lo, first + int(np.searchsorted(ids[first:last], after[1], 'right')))
+            if lo >= hi:
+                continue
+            columns = {name: values[lo:hi] for name, values in columns.items()}
+            # Days archived before system_id existed only hold the primary vehicle
+            if primary_only and 'system_id' in columns:
+                keep = np.isnan(columns['system_id'])
+                if fields is not None and 'system_id' not in fields:
+                    del columns['system_id']
+                if not keep.all():
+                    columns = {name: values[keep] for name, values in columns.items()}
+                if not keep.any():
+                    continue
+            yield day, columns
+
+    def iter_rows(self, start=None, end=None, fields=(), after=None, descending=False, chunk_size=1000,
+                  primary_only=False):
+        """Yield archived rows as dictionaries in the same shape as SQLite rows"""
+        for day, columns in self.iter_days(start, end, fields, after, descending, primary_only):
+            count = len(columns['id'])
+            chunks = range(0, count, chunk_size)
+            for lo in (reversed(chunks) if descending else chunks):
+                hi = min(lo + chunk_size, count)
+                values = [columns['id'][lo:hi].tolist(), columns['timestamp'][lo:hi].tolist()]
+                for field in fields:
+                    if field in columns:
+                        values.append(_to_python(columns[field][lo:hi], field))
+                    else:
+                        values.append([None] * (hi - lo))
+                rows = zip(*values)
+                for row in (reversed(list(rows)) if descending else rows):
+                    yield dict(zip(['id', 'timestamp', *fields], row))
+
+    def points_in_bbox(self, min_lat, min_lon, max_lat, max_lon, start=None, end=None, max_points=None):
+        """Archived (id, timestamp, latitude, longitude, altitude) rows inside a box, and whether any were dropped.
+
+        Filtering is a vectorised mask over the memory-mapped columns. With
+        ``max_points`` set and exceeded, only the latest row per
+        ``grid_cells`` cell is kept and the second value is True.
+        """
+        ids, epochs, lats, lons, alts = [], [], [], [], []
+        for day, columns in self.iter_days(start, end, ['latitude', 'longitude', 'altitude']):
+            if 'latitude' not in columns or 'longitude' not in columns:
+                continue
+            lat, lon = columns['latitude'], columns['longitude']
+            index = np.flatnonzero((lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon))
+            if not len(index):
+                continue
+            ids.append(columns['id'][index])
+            epochs.append(columns['timestamp'][index])
+            lats.append(lat[index])
+            lons.append(lon[index])
+            alts.append(columns['altitude'][index] if 'altitude' in columns else np.full(len(index), np.nan))
+        if not ids:
+            return [], False
+        ids, epochs, lats, lons, alts = map(np.concatenate, (ids, epochs, lats, lons, alts))
+        decimated = bool(max_points) and len(ids) > max_points
+        if decimated:
+            cells = grid_cells(lats, lons, min_lat, min_lon, max_lat, max_lon, max_points)
+            # Days are read oldest first, so the last index per cell is the latest row
+            _, last = np.unique(cells[::-1], return_index=True)
+            keep = np.sort(len(cells) - 1 - last)
+            ids, epochs, lats, lons, alts = (a[keep] for a in (ids, epochs, lats, lons, alts))
+        points = [dict(zip(('id', 'timestamp', 'latitude', 'longitude', 'altitude'), row))
+                  for row in zip(ids.tolist(), epochs.tolist(), lats.tolist(), lons.tolist(),
+                                 _to_python(alts, 'altitude'))]
+        return points, decimated
+
+
+class DayWriter:
+    """Streams rows for one archive day to disk and merges them into the day once.
+
+    ``write`` converts rows to typed arrays a chunk at a time and appends
+    them to raw per-column files in a staging directory, so memory stays
+    at one chunk however many rows are written. Leaving the ``with`` block
+    merges the staged rows with those already archived for the day,
+    skipping ids already present, and swaps the new directory into place;
+    ``added`` is then the number of new rows. An exception discards them.
+    """
+    def __init__(self, archive, day, fields):
+        self.archive = archive
+        self.day = day
+        self.fields = list(fields)
+        self.count = 0
+        self.added = 0
+        self.staging = os.path.join(archive.root, day + '.new')
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+        # Column name -> [(dtype, rows)] of each chunk appended to its raw file
+        self._chunks = {name: [] for name in ['id', 'timestamp'] + self.fields}
+        # Last (timestamp, id) written, and whether rows came in that order
+        self._last = None
+        self._ordered = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self.added = self._merge()
+        finally:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+    def write(self, rows):
+        """Stage metrics row dictionaries with ``id`` and ``timestamp``"""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, WRITE_CHUNK))
+            if not chunk:
+                return
+            columns = {
+                'id': np.array([row['id'] for row in chunk], dtype=np.int64),
+                'timestamp': np.array([row['timestamp'] for row in chunk], dtype=np.int64),
+            }
+            for field in self.fields:
+                columns[field] = _column(field, [row.get(field) for row in chunk])
+            self.write_columns(columns)
+
+    def write_columns(self, columns):
+        """Stage a chunk of rows given as arrays; fields left out are stored as missing"""
+        ids = np.asarray(columns['id'], dtype=np.int64)
+        timestamps = np.asarray(columns['timestamp'], dtype=np.int64)
+        count = len(ids)
+        if not count:
+            return
+        if self._ordered:
+            later = (timestamps[1:] > timestamps[:-1]) | ((timestamps[1:] == timestamps[:-1]) & (ids[1:] > ids[:-1]))
+            self._ordered = bool(later.all()) and (self._last is None or self._last < (timestamps[0], ids[0]))
+        self._last = (int(timestamps[-1]), int(ids[-1]))
+        for name, chunks in self._chunks.items():
+            if name in ('id', 'timestamp'):
+                values = ids if name == 'id' else timestamps
+            else:
+                values = columns.get(name)
+                values = _missing(name, count) if values is None else np.asarray(values)
+            values = np.ascontiguousarray(values)
+            with open(os.path.join(self.staging, f'{name}.raw'), 'ab') as file:
+                values.tofile(file)
+            chunks.append((values.dtype, count))
+        self.count += count
+
+    def _staged(self, name):
+        """Memory-mapped arrays of one staged column, one per run of chunks with the same dtype"""
+        path = os.path.join(self.staging, f'{name}.raw')
+        runs, offset = [], 0
+        for dtype, count in self._chunks[name]:
+            if runs and runs[-1][0] == dtype:
+                runs[-1][1] += count
+            else:
+                runs.append([dtype, count, offset])
+            offset += dtype.itemsize * count
+        return [np.memmap(path, dtype, 'r', start, (count,)) for dtype, count, start in runs]
+
+    def _merge(self):
+        """Write the day with the staged rows added and swap it in; returns the number added"""
+        if not self.count:
+            return 0
+        path = os.path.join(self.archive.root, self.day)
+        existing = self.archive.load_day(self.day) if os.path.isdir(path) else {}
+        before = len(existing['id']) if existing else 0
+        ids, timestamps = self._staged('id'), self._staged('timestamp')
+        first = (int(timestamps[0][0]), int(ids[0][0]))
+        if self._ordered and (not before or (int(existing['timestamp'][-1]), int(existing['id'][-1])) < first):
+            # The usual case, rows newer than the whole day: copy both in order
+            order = None
+            total = before + self.count
+        else:
+            # Overlapping or unordered rows need a sort, with index arrays the size of the day
+            all_ids = np.concatenate([existing.get('id', np.empty(0, np.int64))] + ids)
+            all_timestamps = np.concatenate([existing.get('timestamp', np.empty(0, np.int64))] + timestamps)
+            _, unique = np.unique(all_ids, return_index=True)
+            order = unique[np.lexsort((all_ids[unique], all_timestamps[unique]))]
+            del all_ids, all_timestamps
+            total = len(order)
+
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in dict.fromkeys(list(existing) + list(self._chunks)):
+            old = existing.get(name)
+            # A new day has nothing before the staged rows; a placeholder would widen the dtype
+            sources = [old] if old is not None else [_missing(name, before)] if before else []
+            sources += self._staged(name) if name in self._chunks else [_missing(name, self.count)]
+            dtype = np.int64 if name in ('id', 'timestamp') else np.result_type(*sources)
+            out = np.lib.format.open_memmap(os.path.join(tmp, f'{name}.npy'), 'w+', dtype, (total,))
+            for lo in range(0, total, WRITE_CHUNK):
+                hi = min(lo + WRITE_CHUNK, total)
+                out[lo:hi] = _gather(sources, np.arange(lo, hi) if order is None else order[lo:hi])
+            out.flush()
+            del out, sources, old
+        # Drop the maps of the old files before they are moved aside
+        existing.clear()
+        self.archive._swap(self.day, tmp)
+        return total - before
+
+
+def grid_size(max_points):
+    """Cells per side of the decimation grid for at most ``max_points`` points"""
+    return max(1, int(max_points ** 0.5))
+
+
+def grid_cells(lats, lons, min_lat, min_lon, max_lat, max_lon, max_points):
+    """Decimation grid cell index of each point in a bounding box"""
+    grid = grid_size(max_points)
+    row = np.minimum(((np.asarray(lats) - min_lat) * grid / max(max_lat - min_lat, 1e-9)).astype(np.int64), grid - 1)
+    col = np.minimum(((np.asarray(lons) - min_lon) * grid / max(max_lon - min_lon, 1e-9)).astype(np.int64), grid - 1)
+    return row * grid + col
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .database import DroneDB
+
+logger = logging.getLogger(__name__)
+
+class AsyncDroneDB:
+    """Non-blocking DroneDB access for asyncio code.
+
+    Writes are handed to a dedicated writer thread through a bounded queue
+    and never block the event loop; if the disk stalls long enough to fill
+    the queue, new writes are dropped and counted instead. Reads run on a
+    small thread pool, each worker with its own SQLite connection.
+    """
+    def __init__(self, db=None, readers=2, max_pending=10000):
+        self.db = db or DroneDB()
+        self.dropped_writes = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='drone-db-read')
+        self._writer = threading.Thread(target=self._write_loop, name='drone-db-write', daemon=True)
+        self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args = item
+            try:
+                result = func(*args)
+                if future:
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Database write failed: {e}")
+                if future:
+                    future.set_exception(e)
+
+    def submit_write(self, func, *args, wait=False):
+        """Queue a write for the writer thread; returns a future when ``wait`` is set"""
+        future = Future() if wait else None
+        try:
+            self._queue.put_nowait((future, func, args))
+        except queue.Full:
+            self.dropped_writes += 1
+            if self.dropped_writes % 1000 == 1:
+                logger.warning(f"Database write queue full, dropped {self.dropped_writes} writes")
+            if future:
+                future.set_exception(RuntimeError("Database write queue full"))
+        return future
+
+    def update_metrics(self, metrics):
+        """Queue a metrics row without waiting for it to be stored"""
+        # Copy so later changes to the live state don't leak into this row
+        self.submit_write(self.db.update_metrics, dict(metrics))
+
+    def update_metrics_many(self, rows):
+        """Queue a batch of metrics rows, such as one fleet tick, as a single write"""
+        self.submit_write(self.db.update_metrics_many, rows)
+
+    async def update_mission_status(self, name, status):
+        await asyncio.wrap_future(self.submit_write(self.db.update_mission_status, name, status, wait=True))
+
+    async def _read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, func, *args)
+
+    async def get_latest_metrics(self):
+        return await self._read(self.db.get_latest_metrics)
+
+    async def get_metrics_history(self, limit=100):
+        return await self._read(self.db.get_metrics_history, limit)
+
+    async def get_metrics_series(self, start, end, points=500, fields=None):
+        return await self._read(self.db.get_metrics_series, start, end, points, fields)
+
+    async def get_flights(self, limit=50, before=None):
+        return await self._read(self.db.get_flights, limit, before)
+
+    async def get_telemetry_in_bbox(self, min_lat, min_lon, max_lat, max_lon, start=None, end=None,
+                                    max_points=2000):
+        return await self._read(self.db.get_telemetry_in_bbox, min_lat, min_lon, max_lat, max_lon,
+                                start, end, max_points)
+
+    async def get_missions_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        return await self._read(self.db.get_missions_in_bbox, min_lat, min_lon, max_lat, max_lon)
+
+    async def get_mission(self, mission_id):
+        return await self._read(self.db.get_mission, mission_id)
+
+    def pending_writes(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Drain queued writes, then close the underlying database"""
+        self._queue.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        self.db.close()
@@ -0,0 +1,61 @@
+import asyncio
+import random
+import threading
+import time
+
+# Where virtual clocks start unless told otherwise: 2026-01-01 00:00:00 UTC
+DEFAULT_START = 1767225600.0
+
+
+class SimClock:
+    """Time, sleeping and randomness shared by the simulators.
+
+    With ``speed`` None this is the wall clock. Otherwise time is virtual:
+    it starts at ``start`` and only moves when something sleeps, each sleep
+    taking ``seconds / speed`` of real time, or none at all when ``speed``
+    is 0. With a ``seed`` as well, a run produces the same timestamps and
+    values every time, however fast it goes. Every sleep advances the shared
+    time, so a virtual clock should be driven by a single loop.
+    """
+    def __init__(self, speed=None, seed=None, start=DEFAULT_START):
+        self.speed = speed
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._now = start
+        self._lock = threading.Lock()
+
+    @property
+    def virtual(self):
+        return self.speed is not None
+
+    def time(self):
+        """Current time in epoch seconds"""
+        return self._now if self.virtual else time.time()
+
+    def time_ms(self):
+        return int(round(self.time() * 1000))
+
+    def _advance(self, seconds):
+        with self._lock:
+            self._now += seconds
+        return seconds / self.speed if self.speed else 0
+
+    def sleep(self, seconds):
+        if not self.virtual:
+            time.sleep(seconds)
+            return
+        delay = self._advance(seconds)
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self, seconds):
+        if not self.virtual:
+            await asyncio.sleep(seconds)
+            return
+        # Yield to the event loop even when running as fast as possible
+        await asyncio.sleep(self._advance(seconds))
+
+    def __repr__(self):
+        if not self.virtual:
+            return 'SimClock(real time)'
+        return f"SimClock({'max' if not self.speed else f'{self.speed}x'} speed, seed={self.seed})"
@@ -1,139 +1,1009 @@
 import sqlite3
-from datetime import datetime
+import atexit
 import logging
 import os
 import random
+import threading
+import time
+from functools import lru_cache
+from itertools import chain, groupby, islice
+
+from .monitoring import Counter, Histogram
+from .schema import (ENUMS, NOW_MS, ROLLUP_FIELDS, ROLLUPS, RTREE_EPOCH, decode_enum, defer_metric_indexes,
+                     encode_enum, migrate, restore_metric_indexes)
+
+# The archive and flight modules need numpy, so they are imported where
+# first used and a telemetry-only process starts without loading it.
 
 logger = logging.getLogger(__name__)
 
+# Metric fields accepted and returned by DroneDB, with enums as names and
+# the mission as its name; system_id is None for the primary vehicle
+METRIC_COLUMNS = [
+    'latitude', 'longitude', 'speed', 'signal', 'arm_status', 'battery',
+    'landing_station', 'heading', 'altitude', 'mission_status', 'current_mission', 'system_id'
+]
+
+# Columns stored for each drone_metrics row, in insert order
+STORED_COLUMNS = ['mission_id' if c == 'current_mission' else c for c in METRIC_COLUMNS] + ['timestamp']
+
+# SQL reading each metric field; the mission name comes from its foreign key
+METRIC_SELECT = dict({field: field for field in METRIC_COLUMNS},
+                     current_mission='(SELECT name FROM missions WHERE missions.id = mission_id)')
+
+INSERT_METRICS_SQL = (f"INSERT INTO drone_metrics ({', '.join(STORED_COLUMNS)}) "
+                      f"VALUES ({', '.join('?' for _ in STORED_COLUMNS)})")
+
+# Seconds between runs of the archive job, and before the first run
+ARCHIVE_INTERVAL = 3600
+ARCHIVE_DELAY = 60
+# Rows read from SQLite and handed to the archive at a time
+ARCHIVE_CHUNK = 5000
+# Seconds between flight segmentation runs
+FLIGHT_INTERVAL = 10
+
+DB_FLUSH_LATENCY = Histogram('drone_db_flush_seconds', 'Time to commit a batch of queued writes')
+DB_BATCH_SIZE = Histogram('drone_db_batch_size', 'Writes committed per batch',
+                          buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+DB_WRITE_ERRORS = Counter('drone_db_write_errors', 'Batches that failed to commit')
+DB_WRITES_DROPPED = Counter('drone_db_writes_dropped', 'Queued writes given up on after failing')
+
+# Queued writes kept for retry while the database is busy or failing; the oldest are dropped past this
+MAX_PENDING = 100000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def day_of(timestamp_ms):
+    """UTC 'YYYY-MM-DD' day of an epoch-millisecond timestamp"""
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp_ms / 1000))
+
+
+def encode_cursor(row):
+    """Keyset cursor for resuming after a metrics row"""
+    return f"{row['timestamp']}|{row['id']}"
+
+
+def decode_cursor(cursor):
+    timestamp, _, row_id = cursor.partition('|')
+    try:
+        return int(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}") from None
+
+
+def decode_metrics(row):
+    """Replace enum codes in a metrics row dictionary with their names"""
+    for field in ENUMS:
+        if field in row:
+            row[field] = decode_enum(field, row[field])
+    return row
+
+
+def _to_float(value):
+    try:
+        return None if value is None else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _merge_stats(acc, stats):
+    """Merge a later [min, max, sum, n, last] aggregate into ``acc``"""
+    if not stats or not stats[3]:
+        return acc
+    if not acc or not acc[3]:
+        return list(stats)
+    acc[0] = min(acc[0], stats[0])
+    acc[1] = max(acc[1], stats[1])
+    acc[2] += stats[2]
+    acc[3] += stats[3]
+    acc[4] = stats[4]
+    return acc
+
+
+def _bucket_rows(rows, step, origin=0):
+    """Group time-ordered (epoch, count, {field: stats}) rows into ``step``-second buckets counted from ``origin``"""
+    buckets = {}
+    for epoch, count, stats in rows:
+        bucket = origin + (epoch - origin) // step * step
+        entry = buckets.get(bucket)
+        if entry is None:
+            entry = buckets[bucket] = [0, {}]
+        entry[0] += count
+        for field, value in stats.items():
+            entry[1][field] = _merge_stats(entry[1].get(field), value)
+    return buckets
+
+
+def _raw_stats(metrics):
+    """Rollup aggregates for a single metrics row"""
+    stats = {}
+    for field in ROLLUP_FIELDS:
+        value = _to_float(metrics.get(field))
+        if value is not None:
+            stats[field] = (value, value, value, 1, value)
+    return stats
+
+
+@lru_cache(maxsize=None)
+def _rollup_upsert_sql(name):
+    """Upsert merging a batch aggregate into an existing rollup bucket"""
+    columns = ['bucket', 'count']
+    updates = ['count = count + excluded.count']
+    for field in ROLLUP_FIELDS:
+        columns += [f'{field}_min', f'{field}_max', f'{field}_sum', f'{field}_n', f'{field}_last']
+        updates += [
+            f'{field}_min = CASE WHEN {field}_min IS NULL OR excluded.{field}_min < {field}_min '
+            f'THEN excluded.{field}_min ELSE {field}_min END',
+            f'{field}_max = CASE WHEN {field}_max IS NULL OR excluded.{field}_max > {field}_max '
+            f'THEN excluded.{field}_max ELSE {field}_max END',
+            f'{field}_sum = coalesce({field}_sum, 0) + coalesce(excluded.{field}_sum, 0)',
+            f'{field}_n = {field}_n + excluded.{field}_n',
+            f'{field}_last = coalesce(excluded.{field}_last, {field}_last)',
+        ]
+    return (f"INSERT INTO drone_metrics_{name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT(bucket) DO UPDATE SET {', '.join(updates)}")
+
+
+def _rollup_params(bucket, entry):
+    count, stats = entry
+    params = [bucket, count]
+    for field in ROLLUP_FIELDS:
+        params += stats.get(field) or (None, None, None, 0, None)
+    return params
+
+
 class DroneDB:
-    def __init__(self, db_path=os.path.join(os.getcwd(), "project", "database", "drone.db")):
+    """SQLite access for drone telemetry and missions.
+
+    Uses one long-lived writer connection and one reader connection per
+    thread, all in WAL mode. Metric inserts go to a write-behind buffer that
+    is committed in a single transaction once ``batch_size`` rows are queued
+    or ``flush_interval`` seconds have passed. Metrics older than
+    ``retention_days`` are moved to a columnar archive next to the database
+    and read back transparently by the history queries.
+    """
+    def __init__(self, db_path=os.path.join(os.getcwd(), "project", "database", "drone.db"),
+                 batch_size=50, flush_interval=1.0, retention_days=30, archive_dir=None, clock=None):
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        # A SimClock drives timestamps and random metrics in simulations
+        self.clock = clock
+        self.random = clock.random if clock else random
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(db_path), "archive")
+        self._archive = None
+        self._archive_lock = threading.Lock()
+        self._writer = self._connect()
+        self._write_lock = threading.Lock()
+        self._readers = threading.local()
+        # Pending (sql, params, rollup) statements, committed together in order; rollup is the
+        # (epoch seconds, metrics) a primary-vehicle row adds to the rollups, or None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        # After a failed flush, queueing doesn't trigger another attempt before this monotonic time
+        self._retry_at = 0.0
+        self._last_metrics = None
+        # Mission name to id, for the drone_metrics foreign key
+        self._mission_ids = {}
+        self._closed = threading.Event()
         self.init_db()
+        self._backfill_rollups()
+        self._flusher = threading.Thread(target=self._flush_loop, name='drone-db-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    @property
+    def archive(self):
+        """The MetricsArchive, opened on first use"""
+        if self._archive is None:
+            with self._archive_lock:
+                if self._archive is None:
+                    from .archive import MetricsArchive
+                    self._archive = MetricsArchive(self.archive_dir)
+        return self._archive
+
+    def now_ms(self):
+        """Current time in epoch ms, from the clock when one is set"""
+        return self.clock.time_ms() if self.clock else now_ms()
+
+    def _connect(self):
+        """Open a connection configured for concurrent WAL access"""
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode NORMAL only syncs at checkpoints, not on every commit
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _reader(self):
+        """Connection for reads on the calling thread"""
+        conn = getattr(self._readers, 'conn', None)
+        if conn is None:
+            conn = self._readers.conn = self._connect()
+        return conn
 
     def init_db(self):
-        """Initialize database with required tables"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Create drone_metrics table if it doesn't exist
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS drone_metrics (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        latitude REAL,
-                        longitude REAL,
-                        speed REAL,
-                        signal INTEGER,
-                        arm_status TEXT CHECK(arm_status IN ('Armed', 'Disarmed')),
-                        battery INTEGER,
-                        landing_station TEXT CHECK(landing_station IN ('Open', 'Closed')),
-                        heading INTEGER,
-                        altitude REAL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                conn.commit()
-                logger.info("Database initialized successfully")
+        """Create or migrate the database to the current schema version"""
+        try:
+            with self._write_lock:
+                migrate(self._writer)
+                # Repairs indexes left deferred by an interrupted bulk import
+                with self._writer as conn:
+                    restore_metric_indexes(conn)
+            logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Database initialization failed: {e}")
 
     def generate_random_metrics(self):
         """Generate random metrics for simulation"""
         return {
-            'latitude': random.uniform(45.0, 45.1),
-            'longitude': random.uniform(-93.0, -93.1),
-            'speed': random.uniform(0, 15),
-            'signal': random.randint(80, 100),
-            'arm_status': random.choice(['Armed', 'Disarmed']),
-            'battery': random.randint(80, 100),
-            'landing_station': random.choice(['Open', 'Closed']),
-            'heading': random.randint(0, 359),
-            'altitude': random.uniform(0, 100)
+            'latitude': self.random.uniform(45.0, 45.1),
+            'longitude': self.random.uniform(-93.0, -93.1),
+            'speed': self.random.uniform(0, 15),
+            'signal': self.random.randint(80, 100),
+            'arm_status': self.random.choice(['Armed', 'Disarmed']),
+            'battery': self.random.randint(80, 100),
+            'landing_station': self.random.choice(['Open', 'Closed']),
+            'heading': self.random.randint(0, 359),
+            'altitude': self.random.uniform(0, 100)
+        }
+
+    @staticmethod
+    def metrics_from_state(state):
+        """Convert a DRONE_STATE dictionary into drone_metrics columns"""
+        location = state.get('Location') or [None, None]
+        landing_station = str(state.get('LandingStation', 'Closed')).capitalize()
+        return {
+            'latitude': location[0],
+            'longitude': location[1],
+            'speed': state.get('Speed'),
+            'signal': state.get('Signal'),
+            'arm_status': 'Armed' if state.get('Armed') else 'Disarmed',
+            'battery': state.get('Battery'),
+            'landing_station': landing_station if landing_station in ('Open', 'Closed') else 'Closed',
+            'heading': state.get('Heading'),
+            'altitude': state.get('Altitude')
         }
 
-    def update_metrics(self):
-        """Update drone metrics with random values"""
-        try:
-            metrics = self.generate_random_metrics()
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO drone_metrics 
-                    (latitude, longitude, speed, signal, arm_status, battery, 
-                     landing_station, heading, altitude)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    metrics['latitude'],
-                    metrics['longitude'],
-                    metrics['speed'],
-                    metrics['signal'],
-                    metrics['arm_status'],
-                    metrics['battery'],
-                    metrics['landing_station'],
-                    metrics['heading'],
-                    metrics['altitude']
-                ))
-                conn.commit()
-                return metrics
+    def update_metrics(self, metrics=None):
+        """Queue a metrics row for the next batch commit.
+
+        ``metrics`` may use drone_metrics column names or be a DRONE_STATE
+        dictionary; random values are generated when it is omitted.
+        """
+        try:
+            if metrics is None:
+                metrics = self.generate_random_metrics()
+            elif 'Battery' in metrics:
+                metrics = self.metrics_from_state(metrics)
+            # Stamp rows when queued rather than when the batch commits
+            timestamp = self.now_ms()
+            # The rollup entry travels with its row, so it's committed or dropped with it
+            self._queue(INSERT_METRICS_SQL, self._stored_row(metrics, timestamp), (timestamp // 1000, metrics))
+            self._last_metrics = dict(metrics, timestamp=timestamp)
+            return metrics
+        except Exception as e:
+            logger.error(f"Failed to update metrics in database: {e}")
+            return None
+
+    def update_metrics_many(self, rows):
+        """Queue many metrics rows, such as one tick of a simulated fleet, under one timestamp.
+
+        These rows belong to other vehicles, so they are left out of the
+        rollups and never create missions.
+        """
+        try:
+            timestamp = self.now_ms()
+            statements = [(INSERT_METRICS_SQL, self._stored_row(metrics, timestamp, create_mission=False), None)
+                          for metrics in rows]
+            with self._pending_lock:
+                self._pending.extend(statements)
+                full = len(self._pending) >= self.batch_size
+            if full and time.monotonic() >= self._retry_at:
+                self.flush()
+            return len(statements)
         except Exception as e:
             logger.error(f"Failed to update metrics in database: {e}")
+            return 0
+
+    def _stored_row(self, metrics, timestamp, create_mission=True):
+        """drone_metrics parameters for STORED_COLUMNS from a metrics dictionary"""
+        values = dict(metrics, timestamp=timestamp)
+        for field in ENUMS:
+            values[field] = encode_enum(field, values.get(field))
+        if values.get('mission_id') is None:
+            values['mission_id'] = self._mission_id(values.get('current_mission'), create_mission)
+        return tuple(values.get(column) for column in STORED_COLUMNS)
+
+    def import_metrics(self, rows, batch_size=50000):
+        """Bulk insert metrics rows, such as those from ``iter_metrics``.
+
+        Each row needs a ``timestamp`` in epoch ms; rows get new ids. Batches
+        are committed with executemany while the timestamp index and R*Tree
+        trigger are dropped, and both are rebuilt once at the end. Returns
+        the number of rows imported.
+        """
+        self.flush()
+        rows = iter(rows)
+        imported = 0
+        try:
+            with self._write_lock, self._writer as conn:
+                defer_metric_indexes(conn)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                # Mission ids are looked up by name, never copied from another database
+                params = [self._stored_row({field: row.get(field) for field in METRIC_COLUMNS},
+                                           int(row['timestamp'])) for row in batch]
+                with self._write_lock, self._writer as conn:
+                    conn.executemany(INSERT_METRICS_SQL, params)
+                    self._apply_rollups(conn, [(int(row['timestamp']) // 1000, row) for row in batch
+                                               if row.get('system_id') is None])
+                imported += len(batch)
+                logger.info(f"Imported {imported} metrics rows")
+        finally:
+            with self._write_lock, self._writer as conn:
+                restore_metric_indexes(conn)
+        return imported
+
+    def iter_missions(self, page_size=500):
+        """Iterate over all missions in id order, one page at a time"""
+        columns = ['id', 'name', 'status', 'start_time', 'end_time', 'waypoints', 'created_at']
+        last_id = 0
+        while True:
+            rows = self._reader().execute(f'''
+                SELECT {', '.join(columns)} FROM missions
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, page_size)).fetchall()
+            for row in rows:
+                mission = dict(zip(columns, row))
+                mission['status'] = decode_enum('mission_status', mission['status'])
+                yield mission
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def import_missions(self, missions, batch_size=5000):
+        """Bulk upsert missions, such as those from ``iter_missions``; returns the count.
+
+        Each mission updates, in order of preference, the row with its
+        exported id and name, the row with its name and ``created_at``, or a
+        placeholder with its name (no waypoints or times) that
+        ``import_metrics`` created for a mission it referenced. Otherwise it
+        is inserted, keeping its exported id when that is free. This lets
+        missions and metrics be imported in either order, and importing a
+        file twice changes nothing.
+        """
+        columns = ['name', 'status', 'start_time', 'end_time', 'waypoints', 'created_at']
+        insert_sql = f'''
+            INSERT INTO missions (id, {', '.join(columns)})
+            VALUES ((SELECT ? WHERE ? NOT IN (SELECT id FROM missions)), ?, ?, ?, ?, ?, coalesce(?, {NOW_MS}))
+        '''
+        update_sql = f'''
+            UPDATE missions SET {', '.join(f'{c} = ?' for c in columns[1:-1])},
+                created_at = coalesce(?, created_at)
+            WHERE id = ?
+        '''
+        idle = encode_enum('mission_status', 'Idle')
+        imported = 0
+        # Rows already written by this import, so two missions never land on one row
+        matched = set()
+        missions = iter(missions)
+        while True:
+            batch = list(islice(missions, batch_size))
+            if not batch:
+                break
+            with self._write_lock, self._writer as conn:
+                for m in batch:
+                    values = [encode_enum('mission_status', m.get('status') or 'Idle'),
+                              m.get('start_time'), m.get('end_time'), m.get('waypoints'), m.get('created_at')]
+                    exported_id = int(m['id']) if m.get('id') is not None else None
+                    candidates = [row for row in conn.execute('''
+                        SELECT id, created_at,
+                               waypoints IS NULL AND start_time IS NULL AND end_time IS NULL AND status = ?
+                        FROM missions WHERE name = ? ORDER BY id
+                    ''', (idle, m['name'])) if row[0] not in matched]
+                    match = (next((row[0] for row in candidates if row[0] == exported_id), None)
+                             or next((row[0] for row in candidates if row[1] == m.get('created_at')), None)
+                             or next((row[0] for row in candidates if row[2]), None))
+                    if match is None:
+                        match = conn.execute(insert_sql, [exported_id, exported_id, m['name']] + values).lastrowid
+                    else:
+                        conn.execute(update_sql, values + [match])
+                    matched.add(match)
+            imported += len(batch)
+        # Inserted ids can be lower than the cached ones for a name
+        self._mission_ids.clear()
+        return imported
+
+    def _mission_id(self, name, create=True):
+        """Id of the mission with this name, creating the mission if needed and ``create`` is set"""
+        if not name:
             return None
+        mission_id = self._mission_ids.get(name)
+        if mission_id is None:
+            row = self._reader().execute('SELECT min(id) FROM missions WHERE name = ?', (name,)).fetchone()
+            mission_id = row[0]
+            if mission_id is None:
+                if not create:
+                    return None
+                mission_id = self.create_mission(name)
+            self._mission_ids[name] = mission_id
+        return mission_id
+
+    def create_mission(self, name, waypoints=None, status='Idle'):
+        """Insert a mission; ``waypoints`` is its JSON waypoint list"""
+        with self._write_lock, self._writer as conn:
+            cursor = conn.execute('INSERT INTO missions (name, status, waypoints, created_at) VALUES (?, ?, ?, ?)',
+                                  (name, encode_enum('mission_status', status), waypoints, self.now_ms()))
+        self._mission_ids.setdefault(name, cursor.lastrowid)
+        return cursor.lastrowid
+
+    def update_mission_status(self, name, status):
+        """Queue a mission status change, recording start and end times"""
+        code = encode_enum('mission_status', status)
+        timestamp = self.now_ms()
+        self._queue('''
+            UPDATE missions
+            SET status = ?,
+                start_time = CASE WHEN ? = 1 THEN ? ELSE start_time END,
+                end_time = CASE WHEN ? IN (2, 3) THEN ? ELSE end_time END
+            WHERE name = ?
+        ''', (code, code, timestamp, code, timestamp, name))
+
+    def _queue(self, sql, params, rollup=None):
+        with self._pending_lock:
+            self._pending.append((sql, params, rollup))
+            full = len(self._pending) >= self.batch_size
+        if full and time.monotonic() >= self._retry_at:
+            self.flush()
+
+    def flush(self):
+        """Commit every queued write in a single transaction.
+
+        If the database is busy or failing, the batch goes back to the
+        front of the queue for the next flush. Any other error retries the
+        batch one statement at a time, so only the statements that fail on
+        their own are dropped.
+        """
+        # Holding the write lock while taking the batch keeps batches in order
+        with self._write_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            DB_BATCH_SIZE.observe(len(pending))
+            try:
+                with DB_FLUSH_LATENCY.time(), self._writer as conn:
+                    # Consecutive statements with the same SQL go through executemany
+                    start = 0
+                    for i in range(1, len(pending) + 1):
+                        if i == len(pending) or pending[i][0] != pending[start][0]:
+                            conn.executemany(pending[start][0], [params for _, params, _ in pending[start:i]])
+                            start = i
+                    # Rollups commit in the same transaction as the rows they summarise
+                    self._apply_rollups(conn, [rollup for _, _, rollup in pending if rollup])
+                self._retry_at = 0.0
+                return len(pending)
+            except sqlite3.OperationalError as e:
+                return self._retry_later(pending, e)
+            except Exception as e:
+                DB_WRITE_ERRORS.inc()
+                logger.error(f"Failed to flush {len(pending)} database writes, retrying one at a time: {e}")
+            try:
+                return self._flush_each(pending)
+            except sqlite3.OperationalError as e:
+                return self._retry_later(pending, e)
+
+    def _flush_each(self, pending):
+        """Commit a failed batch statement by statement, dropping those that fail on their own"""
+        written = 0
+        # Only rows that were stored count towards the rollups
+        rollup = []
+        with self._writer as conn:
+            for sql, params, row_rollup in pending:
+                try:
+                    conn.execute(sql, params)
+                    written += 1
+                    if row_rollup:
+                        rollup.append(row_rollup)
+                except sqlite3.OperationalError:
+                    raise
+                except Exception as e:
+                    DB_WRITES_DROPPED.inc()
+                    logger.error(f"Dropped a database write that failed on its own: {e}")
+            try:
+                self._apply_rollups(conn, rollup)
+            except sqlite3.OperationalError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to update metrics rollups: {e}")
+        return written
+
+    def _retry_later(self, pending, error):
+        """Put a batch that failed on a busy, locked, full or failing database back at the front of the queue.
+
+        Writes queued meanwhile stay behind it, and past MAX_PENDING the
+        oldest are dropped. Returns 0, the number of writes committed.
+        """
+        DB_WRITE_ERRORS.inc()
+        self._retry_at = time.monotonic() + self.flush_interval
+        with self._pending_lock:
+            self._pending = pending + self._pending
+            excess = len(self._pending) - MAX_PENDING
+            if excess > 0:
+                # Each row's rollup entry goes with it
+                del self._pending[:excess]
+        logger.error(f"Failed to flush {len(pending)} database writes, will retry: {error}")
+        if excess > 0:
+            DB_WRITES_DROPPED.inc(excess)
+            logger.error(f"Dropped the {excess} oldest queued database writes, the queue is full")
+        return 0
+
+    def _apply_rollups(self, conn, rows):
+        """Fold newly inserted (epoch, metrics) rows into every rollup table"""
+        if not rows:
+            return
+        rows = [(epoch, 1, _raw_stats(metrics)) for epoch, metrics in rows]
+        for name, step in ROLLUPS.items():
+            buckets = _bucket_rows(rows, step)
+            conn.executemany(_rollup_upsert_sql(name),
+                             [_rollup_params(bucket, entry) for bucket, entry in buckets.items()])
+
+    def _backfill_rollups(self):
+        """Build the rollups from existing rows when the tables are new"""
+        try:
+            with self._write_lock:
+                conn = self._writer
+                if conn.execute('SELECT 1 FROM drone_metrics_1m LIMIT 1').fetchone():
+                    return
+                if not conn.execute('SELECT 1 FROM drone_metrics LIMIT 1').fetchone():
+                    return
+                logger.info("Building drone_metrics rollups from existing rows")
+                # Rollups summarise the primary vehicle only
+                # One transaction, so an interrupted backfill leaves the tables empty and reruns
+                with conn:
+                    cursor = conn.execute(f"SELECT timestamp, {', '.join(ROLLUP_FIELDS)} FROM drone_metrics "
+                                          f"WHERE system_id IS NULL ORDER BY id")
+                    while True:
+                        chunk = cursor.fetchmany(10000)
+                        if not chunk:
+                            break
+                        # The upsert merges buckets split across chunks
+                        self._apply_rollups(conn, [(row[0] // 1000, dict(zip(ROLLUP_FIELDS, row[1:])))
+                                                   for row in chunk])
+        except Exception as e:
+            logger.error(f"Failed to build metrics rollups: {e}")
+
+    def _flush_loop(self):
+        next_archive = time.monotonic() + ARCHIVE_DELAY
+        next_flights = time.monotonic()
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() >= next_flights:
+                next_flights = time.monotonic() + FLIGHT_INTERVAL
+                self.update_flights()
+            if self.retention_days and time.monotonic() >= next_archive:
+                next_archive = time.monotonic() + ARCHIVE_INTERVAL
+                self.archive_metrics()
+
+    def archive_metrics(self, retention_days=None):
+        """Move metrics older than ``retention_days`` into the columnar archive"""
+        retention_days = retention_days or self.retention_days
+        cutoff = self.now_ms() - retention_days * 86400000
+        archived, max_id = 0, None
+        try:
+            # Checked first so the archive, and numpy with it, is only loaded when there is work
+            if not self._reader().execute('SELECT 1 FROM drone_metrics WHERE timestamp < ? LIMIT 1',
+                                          (cutoff,)).fetchone():
+                return 0
+            # Rows must be segmented into flights before they leave SQLite
+            self.update_flights()
+            rows = self._iter_metric_pages(None, cutoff, METRIC_COLUMNS, None, None, False, ARCHIVE_CHUNK)
+            # Each day is streamed to disk in chunks and merged into the archive once
+            for day, day_rows in groupby(rows, key=lambda row: day_of(row['timestamp'])):
+                with self.archive.writer(day, METRIC_COLUMNS) as writer:
+                    for chunk in iter(lambda: list(islice(day_rows, ARCHIVE_CHUNK)), []):
+                        writer.write(chunk)
+                        max_id = max(max_id or 0, max(row['id'] for row in chunk))
+                archived += writer.added
+            if max_id is None:
+                return 0
+            with self._write_lock:
+                with self._writer as conn:
+                    conn.execute('DELETE FROM drone_metrics WHERE timestamp < ? AND id <= ?', (cutoff, max_id))
+                # Fold the WAL back in so freed pages are reused by new inserts
+                self._writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            logger.info(f"Archived {archived} metrics rows older than {day_of(cutoff)}")
+            return archived
+        except Exception as e:
+            logger.error(f"Failed to archive metrics: {e}")
+            return 0
+
+    def close(self):
+        """Flush pending writes and close the writer connection"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.flush()
+        with self._write_lock:
+            self._writer.close()
+
+    def update_flights(self, batch_size=50000):
+        """Segment metrics rows added since the last run into flights"""
+        updated = 0
+        try:
+            self.flush()
+            reader = self._reader()
+            newest = reader.execute('SELECT max(id) FROM drone_metrics').fetchone()[0] or 0
+            while True:
+                row = reader.execute("SELECT last_id FROM job_cursors WHERE name = 'flights'").fetchone()
+                last_id = row[0] if row else 0
+                if last_id >= newest:
+                    return updated
+                # Only the primary vehicle's rows form one continuous stream to segment
+                if not reader.execute('''
+                    SELECT 1 FROM drone_metrics WHERE id > ? AND id <= ? AND system_id IS NULL LIMIT 1
+                ''', (last_id, newest)).fetchone():
+                    # Nothing to segment; numpy is only loaded once there is
+                    with self._write_lock, self._writer as conn:
+                        conn.execute('INSERT OR REPLACE INTO job_cursors (name, last_id) VALUES (?, ?)',
+                                     ('flights', newest))
+                    return updated
+                from .flights import (FLIGHT_COLUMNS, SEGMENT_COLUMNS, columns_from_rows, flight_from_row,
+                                      segment_flights)
+
+                rows = reader.execute(f'''
+                    SELECT {', '.join(SEGMENT_COLUMNS)} FROM drone_metrics
+                    WHERE id > ? AND id <= ? AND system_id IS NULL ORDER BY id LIMIT ?
+                ''', (last_id, newest, batch_size)).fetchall()
+                flights = []
+                if rows:
+                    row = reader.execute(f'''
+                        SELECT id, {', '.join(FLIGHT_COLUMNS)} FROM flights
+                        WHERE in_progress = 1 ORDER BY id DESC LIMIT 1
+                    ''').fetchone()
+                    flights = segment_flights(columns_from_rows(rows), flight_from_row(row) if row else None)
+                with self._write_lock, self._writer as conn:
+                    for flight in flights:
+                        values = [flight[c] for c in FLIGHT_COLUMNS]
+                        if flight['id'] is None:
+                            conn.execute(f'''
+                                INSERT INTO flights ({', '.join(FLIGHT_COLUMNS)})
+                                VALUES ({', '.join('?' for _ in FLIGHT_COLUMNS)})
+                            ''', values)
+                        else:
+                            conn.execute(f'''
+                                UPDATE flights SET {', '.join(f'{c} = ?' for c in FLIGHT_COLUMNS)}
+                                WHERE id = ?
+                            ''', values + [flight['id']])
+                    # A short batch covered everything up to newest, including skipped rows
+                    conn.execute('INSERT OR REPLACE INTO job_cursors (name, last_id) VALUES (?, ?)',
+                                 ('flights', rows[-1][0] if len(rows) == batch_size else newest))
+                updated += len(flights)
+                if len(rows) < batch_size:
+                    return updated
+        except Exception as e:
+            logger.error(f"Failed to update flights: {e}")
+            return updated
+
+    def get_flights(self, limit=50, before=None):
+        """Flight summaries, newest first; ``before`` is an epoch-ms start_time to page from"""
+        from .flights import SUMMARY_COLUMNS
+
+        try:
+            where, params = ('WHERE f.start_time < ?', [before]) if before else ('', [])
+            rows = self._reader().execute(f'''
+                SELECT f.id, {', '.join(f'f.{c}' for c in SUMMARY_COLUMNS)}, m.name
+                FROM flights f LEFT JOIN missions m ON m.id = f.mission_id
+                {where}
+                ORDER BY f.start_time DESC
+                LIMIT ?
+            ''', params + [limit]).fetchall()
+            return [dict(zip(['id'] + SUMMARY_COLUMNS + ['mission'], row)) for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to get flights: {e}")
+            return []
+
+    def get_telemetry_in_bbox(self, min_lat, min_lon, max_lat, max_lon, start=None, end=None,
+                              max_points=2000):
+        """Telemetry points inside a bounding box and optional epoch time range.
+
+        Live rows are found through the R*Tree and archived days by a
+        vectorised scan. When more than ``max_points`` match, the box is
+        split into a grid and only the latest point in each cell is kept.
+        """
+        from .archive import grid_cells, grid_size
+
+        try:
+            conditions = ['r.max_lat >= ?', 'r.min_lat <= ?', 'r.max_lon >= ?', 'r.min_lon <= ?']
+            params = [min_lat, max_lat, min_lon, max_lon]
+            # R*Tree boxes are float32, rounded outwards; checking the row itself makes them exact
+            exact = ['m.latitude BETWEEN ? AND ?', 'm.longitude BETWEEN ? AND ?']
+            exact_params = [min_lat, max_lat, min_lon, max_lon]
+            if start is not None:
+                conditions.append('r.max_t >= ?')
+                params.append(start - RTREE_EPOCH)
+                exact.append('m.timestamp >= ?')
+                exact_params.append(int(start * 1000))
+            if end is not None:
+                conditions.append('r.min_t <= ?')
+                params.append(end - RTREE_EPOCH)
+                exact.append('m.timestamp < ?')
+                exact_params.append(int(end * 1000))
+            where = ' AND '.join(conditions)
+            exact = ''.join(f' AND {condition}' for condition in exact)
+            columns = ['id', 'timestamp', 'latitude', 'longitude', 'altitude']
+            select = ', '.join(f'm.{column}' for column in columns)
+            reader = self._reader()
+
+            rows = reader.execute(f'''
+                SELECT {select} FROM telemetry_rtree r JOIN drone_metrics m ON m.id = r.id
+                WHERE {where}{exact}
+                LIMIT ?
+            ''', params + exact_params + [max_points + 1]).fetchall()
+            decimated = len(rows) > max_points
+            if decimated:
+                grid = grid_size(max_points)
+                cell = (f"min(CAST((m.latitude - ?) * ? AS INTEGER), {grid - 1}) * {grid}"
+                        f" + min(CAST((m.longitude - ?) * ? AS INTEGER), {grid - 1})")
+                cell_params = [min_lat, grid / max(max_lat - min_lat, 1e-9),
+                               min_lon, grid / max(max_lon - min_lon, 1e-9)]
+                # Rows are filtered exactly before max() picks each cell's latest, then only winners are fetched
+                rows = reader.execute(f'''
+                    SELECT {select} FROM drone_metrics m
+                    WHERE m.id IN (
+                        SELECT max(m.id) FROM telemetry_rtree r JOIN drone_metrics m ON m.id = r.id
+                        WHERE {where}{exact}
+                        GROUP BY {cell}
+                    )
+                ''', params + exact_params + cell_params).fetchall()
+            points = [dict(zip(columns, row)) for row in rows]
+
+            archived, archive_decimated = self.archive.points_in_bbox(
+                min_lat, min_lon, max_lat, max_lon,
+                int(start * 1000) if start is not None else None,
+                int(end * 1000) if end is not None else None, max_points)
+            decimated = decimated or archive_decimated
+            points = archived + sorted(points, key=lambda point: point['id'])
+            if len(points) > max_points:
+                decimated = True
+                cells = grid_cells([p['latitude'] for p in points], [p['longitude'] for p in points],
+                                   min_lat, min_lon, max_lat, max_lon, max_points).tolist()
+                # Later (newer) points replace older ones in the same cell
+                latest = dict(zip(cells, points))
+                points = sorted(latest.values(), key=lambda point: point['id'])
+            return {'decimated': decimated, 'points': points}
+        except Exception as e:
+            logger.error(f"Failed to query telemetry in bounding box: {e}")
+            return None
+
+    def get_missions_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Missions whose waypoint bounding box overlaps the given box"""
+        try:
+            rows = self._reader().execute('''
+                SELECT m.id, m.name, m.status, m.waypoints, r.min_lat, r.min_lon, r.max_lat, r.max_lon
+                FROM mission_rtree r JOIN missions m ON m.id = r.id
+                WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+            ''', (min_lat, max_lat, min_lon, max_lon)).fetchall()
+            return [{
+                'id': row[0],
+                'name': row[1],
+                'status': decode_enum('mission_status', row[2]),
+                'waypoints': row[3],
+                'bbox': list(row[4:8])
+            } for row in rows]
+        except Exception as e:
+            logger.error(f"Failed to query missions in bounding box: {e}")
+            return []
 
     def get_latest_metrics(self):
-        """Get the most recent metrics from database"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT latitude, longitude, speed, signal, arm_status, 
-                           battery, landing_station, heading, altitude, timestamp
-                    FROM drone_metrics
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                ''')
-                result = cursor.fetchone()
-                if result:
-                    return {
-                        'latitude': result[0],
-                        'longitude': result[1],
-                        'speed': result[2],
-                        'signal': result[3],
-                        'arm_status': result[4],
-                        'battery': result[5],
-                        'landing_station': result[6],
-                        'heading': result[7],
-                        'altitude': result[8],
-                        'timestamp': result[9]
-                    }
-                return None
+        """Get the most recent metrics, including rows not yet committed"""
+        with self._pending_lock:
+            if self._pending and self._last_metrics:
+                return dict(self._last_metrics)
+        try:
+            columns = ['id', 'timestamp'] + METRIC_COLUMNS + ['mission_id']
+            row = self._reader().execute(f'''
+                SELECT id, timestamp, {', '.join(METRIC_SELECT[c] for c in METRIC_COLUMNS)}, mission_id
+                FROM drone_metrics
+                WHERE system_id IS NULL
+                ORDER BY id DESC
+                LIMIT 1
+            ''').fetchone()
+            return decode_metrics(dict(zip(columns, row))) if row else None
         except Exception as e:
             logger.error(f"Failed to get latest metrics: {e}")
             return None
 
     def get_metrics_history(self, limit=100):
-        """Get historical metrics data"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT battery, status, altitude, signal, speed, heading, timestamp
-                    FROM drone_metrics
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (limit,))
-                results = cursor.fetchall()
-                return [{
-                    'Battery': row[0],
-                    'Status': row[1],
-                    'Altitude': row[2],
-                    'Signal': row[3],
-                    'Speed': row[4],
-                    'Heading': row[5],
-                    'timestamp': row[6]
-                } for row in results]
+        """Get the most recent metrics rows, newest first"""
+        try:
+            fields = ['battery', 'mission_status', 'altitude', 'signal', 'speed', 'heading']
+            return [{
+                'Battery': row.get('battery'),
+                'Status': row.get('mission_status'),
+                'Altitude': row.get('altitude'),
+                'Signal': row.get('signal'),
+                'Speed': row.get('speed'),
+                'Heading': row.get('heading'),
+                'timestamp': row['timestamp']
+            } for row in self.iter_metrics(fields=fields, limit=limit, descending=True, primary_only=True)]
         except Exception as e:
             logger.error(f"Failed to get metrics history: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def iter_metrics(self, start=None, end=None, fields=None, cursor=None, limit=None,
+                     descending=False, page_size=1000, primary_only=False):
+        """Iterate over metrics rows in (timestamp, id) order.
+
+        ``start`` and ``end`` are epoch milliseconds, ``cursor`` comes from
+        ``encode_cursor`` for the last row already seen. Archived rows come
+        first, then live rows read one indexed page at a time, so memory stays
+        flat for any range size. ``primary_only`` skips other vehicles' rows.
+        """
+        fields = list(fields or METRIC_COLUMNS)
+        unknown = set(fields) - set(METRIC_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown metrics fields: {', '.join(sorted(unknown))}")
+        after = decode_cursor(cursor) if cursor else None
+        live = self._iter_metric_pages(start, end, fields, after, limit, descending, page_size, primary_only)
+        archived = self.archive.iter_rows(start, end, fields, after, descending, page_size, primary_only)
+        rows = chain(live, archived) if descending else chain(archived, live)
+        return rows if limit is None else islice(rows, limit)
+
+    def _iter_metric_pages(self, start, end, fields, after, limit, descending, page_size, primary_only=False):
+        columns = ['id', 'timestamp'] + fields
+        order = 'DESC' if descending else 'ASC'
+        remaining = limit
+        while remaining is None or remaining > 0:
+            conditions, params = ['system_id IS NULL'] if primary_only else [], []
+            if start is not None:
+                conditions.append('timestamp >= ?')
+                params.append(start)
+            if end is not None:
+                conditions.append('timestamp < ?')
+                params.append(end)
+            if after:
+                conditions.append(f"(timestamp, id) {'<' if descending else '>'} (?, ?)")
+                params.extend(after)
+            size = page_size if remaining is None else min(page_size, remaining)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            rows = self._reader().execute(f'''
+                SELECT id, timestamp, {', '.join(METRIC_SELECT[field] for field in fields)}
+                FROM drone_metrics
+                {where}
+                ORDER BY timestamp {order}, id {order}
+                LIMIT ?
+            ''', params + [size]).fetchall()
+            for row in rows:
+                yield decode_metrics(dict(zip(columns, row)))
+            if len(rows) < size:
+                return
+            after = (rows[-1][1], rows[-1][0])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def get_metrics_series(self, start, end, points=500, fields=None):
+        """Metrics between two epoch times, reduced to about ``points`` buckets.
+
+        Reads the coarsest rollup that still gives ``points`` buckets over the
+        range and only falls back to raw rows for short ranges. Points are
+        ``(end - start) / points`` seconds apart from ``start``, not rounded to
+        the rollup size: each rollup bucket goes wholly to the point its start
+        falls in, so points hold a whole number of buckets, which may differ
+        by one between neighbours. Each point has the min, max, mean and last
+        value of every requested field.
+        """
+        fields = list(fields or ROLLUP_FIELDS)
+        unknown = set(fields) - set(ROLLUP_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown metrics fields: {', '.join(sorted(unknown))}")
+        points = max(1, int(points))
+        # Raw rows are bucketed by whole seconds, so a shorter step would leave points empty
+        step = max(1, (end - start) / points)
+        resolution, size = 'raw', 1
+        for name, seconds in ROLLUPS.items():
+            if seconds <= step:
+                resolution, size = name, seconds
+                break
+        try:
+            # A raw row in start's second, or a rollup bucket straddling start, belongs to the first point
+            if resolution == 'raw':
+                rows = ((max(row['timestamp'] // 1000, start), 1, _raw_stats(row))
+                        for row in self.iter_metrics(int(start * 1000), int(end * 1000), fields,
+                                                     primary_only=True))
+            else:
+                cursor = self._reader().cursor()
+                columns = ', '.join(f'{field}_min, {field}_max, {field}_sum, {field}_n, {field}_last'
+                                    for field in fields)
+                cursor.execute(f'''
+                    SELECT bucket, count, {columns}
+                    FROM drone_metrics_{resolution}
+                    WHERE bucket >= ? AND bucket < ?
+                    ORDER BY bucket
+                ''', (int(start // size * size), end))
+                rows = ((max(row[0], start), row[1],
+                         {field: row[2 + 5 * i:7 + 5 * i] for i, field in enumerate(fields)})
+                        for row in cursor)
+
+            series = []
+            for bucket, (count, stats) in _bucket_rows(rows, step, start).items():
+                point = {'timestamp': bucket, 'count': count}
+                for field in fields:
+                    value = stats.get(field)
+                    point[field] = {
+                        'min': value[0], 'max': value[1], 'mean': value[2] / value[3], 'last': value[4]
+                    } if value else None
+                series.append(point)
+            return {'resolution': resolution, 'step': step, 'points': series}
+        except Exception as e:
+            logger.error(f"Failed to get metrics series: {e}")
+            return None
+
+    def get_mission(self, mission_id):
+        """Get a mission by id"""
+        try:
+            cursor = self._reader().cursor()
+            cursor.execute('''
+                SELECT id, name, status, waypoints, start_time, end_time
+                FROM missions
+                WHERE id = ?
+            ''', (mission_id,))
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'id': row[0],
+                    'name': row[1],
+                    'status': decode_enum('mission_status', row[2]),
+                    'waypoints': row[3],
+                    'start_time': row[4],
+                    'end_time': row[5]
+                }
+            return None
+        except Exception as e:
+            logger.error(f"Failed to get mission {mission_id}: {e}")
+            return None
+
+    def get_mission_upload(self, system_id):
+        """Get the last mission uploaded to a vehicle"""
+        try:
+            cursor = self._reader().cursor()
+            cursor.execute('''
+                SELECT mission_hash, item_count, opaque_id, uploaded_at
+                FROM mission_uploads
+                WHERE system_id = ?
+            ''', (system_id,))
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'mission_hash': row[0],
+                    'item_count': row[1],
+                    'opaque_id': row[2],
+                    'uploaded_at': row[3]
+                }
+            return None
+        except Exception as e:
+            logger.error(f"Failed to get mission upload for system {system_id}: {e}")
+            return None
+
+    def record_mission_upload(self, system_id, mission_hash, item_count, opaque_id=0):
+        """Remember which mission a vehicle holds"""
+        try:
+            with self._write_lock, self._writer as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO mission_uploads
+                    (system_id, mission_hash, item_count, opaque_id, uploaded_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (system_id, mission_hash, item_count, opaque_id, self.now_ms()))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to record mission upload for system {system_id}: {e}")
+            return False
@@ -0,0 +1,203 @@
+import json
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOME = [31.482080, 74.302944]
+
+METERS_PER_DEGREE = 111320.0
+
+# Mission phases, advanced for every drone at once by FleetSimulator.step
+IDLE, TAKEOFF, ENROUTE, RETURN, LANDING = range(5)
+
+# Battery percentage below which an airborne drone abandons its mission
+RETURN_BATTERY = 20.0
+
+
+def parse_waypoints(waypoints):
+    """(lat, lng) pairs from a missions.waypoints JSON list in either stored form"""
+    points = []
+    for point in json.loads(waypoints or '[]'):
+        if not isinstance(point, dict):
+            continue
+        position = point.get('position') or [None, None]
+        lat = point.get('lat', position[0])
+        lng = point.get('lng', point.get('lon', position[1]))
+        if lat is not None and lng is not None:
+            points.append((float(lat), float(lng)))
+    return points
+
+
+def load_missions(db):
+    """(name, waypoints) for every mission in a DroneDB that has usable waypoints"""
+    missions = []
+    for mission in db.iter_missions():
+        try:
+            points = parse_waypoints(mission['waypoints'])
+        except (ValueError, TypeError):
+            continue
+        if points:
+            missions.append((mission['name'], points))
+    return missions
+
+
+def random_routes(rng, home, count=8, spread=2000.0):
+    """Routes of 3-6 waypoints within ``spread`` meters of home, for databases without missions"""
+    routes = []
+    for _ in range(count):
+        offsets = rng.uniform(-spread, spread, size=(rng.integers(3, 7), 2)) / METERS_PER_DEGREE
+        offsets[:, 1] /= math.cos(math.radians(home[0]))
+        routes.append([(home[0] + lat, home[1] + lng) for lat, lng in offsets])
+    return routes
+
+
+class FleetSimulator:
+    """Many simulated drones advanced together as NumPy arrays.
+
+    Each drone waits at its landing station, takes off, flies the waypoints
+    of one of ``missions`` (name and (lat, lng) list pairs), returns and
+    lands, recharging before the next mission. Speed, signal and position
+    follow random walks, and a low battery aborts the mission. One ``step``
+    costs a handful of array operations whatever the fleet size.
+    """
+    def __init__(self, count, missions=None, home=DEFAULT_HOME, first_id=1, seed=None):
+        self.count = count
+        self.rng = np.random.default_rng(seed)
+        rng = self.rng
+        missions = [(name, points) for name, points in (missions or []) if points]
+        if not missions:
+            missions = [(f'Fleet Route {i + 1}', points)
+                        for i, points in enumerate(random_routes(rng, home))]
+        self.mission_names = [name for name, _ in missions]
+        # Routes padded to one array; route_len says how many points are real
+        self.route_len = np.array([len(points) for _, points in missions])
+        self.routes = np.zeros((len(missions), self.route_len.max(), 2))
+        for i, (_, points) in enumerate(missions):
+            self.routes[i, :len(points)] = points
+
+        self.system_ids = np.arange(first_id, first_id + count)
+        # Landing stations scattered within about 500 m of home
+        self.home = np.array(home) + rng.normal(0, 500 / METERS_PER_DEGREE, size=(count, 2))
+        self.lat, self.lon = self.home[:, 0].copy(), self.home[:, 1].copy()
+        self.altitude = np.zeros(count)
+        self.speed = np.zeros(count)
+        self.heading = rng.uniform(0, 360, count)
+        self.signal = np.full(count, 100.0)
+        self.battery = rng.uniform(60, 100, count)
+        self.cruise_speed = rng.uniform(8, 15, count)
+        self.cruise_altitude = rng.uniform(40, 120, count)
+        self.phase = np.full(count, IDLE, dtype=np.int8)
+        self.mission = rng.integers(0, len(missions), count)
+        self.waypoint = np.zeros(count, dtype=np.int64)
+        self.timer = rng.uniform(0, 30, count)
+        # Outcome of the last mission: 0 none, 2 completed, 3 failed (mission_status codes)
+        self.outcome = np.zeros(count, dtype=np.int8)
+        self.ticks = 0
+        self._message = None
+
+    def step(self, dt=1.0):
+        """Advance every drone by ``dt`` seconds"""
+        rng, phase = self.rng, self.phase
+        idle, takeoff, enroute = phase == IDLE, phase == TAKEOFF, phase == ENROUTE
+        returning, landing = phase == RETURN, phase == LANDING
+
+        # Idle drones recharge and launch once their timer runs out
+        self.battery[idle] = np.minimum(100.0, self.battery[idle] + 0.5 * dt)
+        self.timer[idle] -= dt
+        launch = idle & (self.timer <= 0) & (self.battery >= 90)
+        phase[launch] = TAKEOFF
+        self.mission[launch] = rng.integers(0, len(self.route_len), int(launch.sum()))
+        self.waypoint[launch] = 0
+        self.outcome[launch] = 0
+
+        self.altitude[takeoff] += 3.0 * dt
+        climbed = takeoff & (self.altitude >= self.cruise_altitude)
+        self.altitude[climbed] = self.cruise_altitude[climbed]
+        phase[climbed] = ENROUTE
+
+        # Fly towards the current waypoint, or home when returning
+        flying = enroute | returning
+        target = np.where(enroute[:, None], self.routes[self.mission, self.waypoint], self.home)
+        north = (target[:, 0] - self.lat) * METERS_PER_DEGREE
+        east = (target[:, 1] - self.lon) * METERS_PER_DEGREE * np.cos(np.radians(self.lat))
+        distance = np.hypot(north, east)
+        self.speed = np.where(flying, np.clip(self.speed + rng.normal(0, 0.5, self.count),
+                                              0.7 * self.cruise_speed, 1.3 * self.cruise_speed), 0.0)
+        travel = np.minimum(self.speed * dt, distance)
+        scale = np.divide(travel, distance, out=np.zeros(self.count), where=distance > 0)
+        # Gusts push drones off their track by a metre or so
+        gust = rng.normal(0, 1.0, size=(self.count, 2)) * flying[:, None]
+        self.lat += (north * scale + gust[:, 0]) / METERS_PER_DEGREE
+        self.lon += (east * scale + gust[:, 1]) / (METERS_PER_DEGREE * np.cos(np.radians(self.lat)))
+        self.heading = np.where(flying & (distance > 1), np.degrees(np.arctan2(east, north)) % 360,
+                                self.heading)
+        arrived = flying & (distance - travel < np.maximum(5.0, self.speed * dt))
+
+        next_waypoint = arrived & enroute
+        self.waypoint[next_waypoint] += 1
+        finished = next_waypoint & (self.waypoint >= self.route_len[self.mission])
+        self.waypoint[finished] = 0
+        phase[finished] = RETURN
+        self.outcome[finished] = 2
+        home = arrived & returning
+        phase[home] = LANDING
+        self.lat[home], self.lon[home] = self.home[home, 0], self.home[home, 1]
+
+        self.altitude[landing] = np.maximum(0.0, self.altitude[landing] - 2.0 * dt)
+        landed = landing & (self.altitude <= 0)
+        phase[landed] = IDLE
+        self.timer[landed] = rng.uniform(5, 30, int(landed.sum()))
+
+        airborne = ~idle
+        self.battery[airborne] -= (0.03 + 0.002 * self.speed[airborne]) * dt
+        self.battery = np.maximum(self.battery, 0.0)
+        abort = (takeoff | enroute) & (self.battery < RETURN_BATTERY)
+        phase[abort] = RETURN
+        self.outcome[abort] = 3
+
+        from_home = np.hypot((self.lat - self.home[:, 0]) * METERS_PER_DEGREE,
+                             (self.lon - self.home[:, 1]) * METERS_PER_DEGREE)
+        self.signal = np.clip(100 - from_home / 100 + rng.normal(0, 2, self.count), 0, 100)
+        self.ticks += 1
+        self._message = None
+
+    def mission_status(self):
+        """mission_status codes: running while out, then the outcome until the next launch"""
+        return np.where((self.phase == TAKEOFF) | (self.phase == ENROUTE), 1, self.outcome)
+
+    def rows(self):
+        """drone_metrics rows for the current tick, for DroneDB.update_metrics_many"""
+        status = self.mission_status()
+        armed = self.phase != IDLE
+        station = (self.phase == TAKEOFF) | (self.phase == LANDING)
+        return [{
+            'latitude': lat, 'longitude': lon, 'speed': speed, 'signal': signal,
+            'arm_status': int(arm), 'battery': battery, 'landing_station': int(open_),
+            'heading': heading, 'altitude': altitude, 'mission_status': code,
+            'current_mission': self.mission_names[mission] if code else None, 'system_id': system_id,
+        } for lat, lon, speed, signal, arm, battery, open_, heading, altitude, code, mission, system_id in zip(
+            self.lat.tolist(), self.lon.tolist(), self.speed.round(2).tolist(), self.signal.round().astype(int).tolist(),
+            armed.tolist(), self.battery.round(1).tolist(), station.tolist(), self.heading.round().astype(int).tolist(),
+            self.altitude.round(1).tolist(), status.tolist(), self.mission.tolist(), self.system_ids.tolist())]
+
+    def snapshot(self):
+        """Per-vehicle state in the DRONE_STATE shape, keyed by system id"""
+        statuses = ('Idle', 'Running', 'Completed', 'Failed')
+        return {system_id: {
+            'Battery': round(battery, 1), 'Status': 'Connected', 'Altitude': round(altitude, 1),
+            'Signal': round(signal), 'Speed': round(speed, 2), 'Heading': round(heading),
+            'Location': [lat, lon], 'HomeLocation': [home_lat, home_lon], 'Armed': phase != IDLE,
+            'MissionStatus': statuses[code],
+        } for system_id, battery, altitude, signal, speed, heading, lat, lon, home_lat, home_lon, phase, code in zip(
+            self.system_ids.tolist(), self.battery.tolist(), self.altitude.tolist(), self.signal.tolist(),
+            self.speed.tolist(), self.heading.tolist(), self.lat.tolist(), self.lon.tolist(),
+            self.home[:, 0].tolist(), self.home[:, 1].tolist(), self.phase.tolist(), self.mission_status().tolist())}
+
+    def message(self):
+        """``snapshot`` encoded once per tick and shared by every WebSocket client"""
+        if self._message is None:
+            self._message = json.dumps(self.snapshot())
+        return self._message
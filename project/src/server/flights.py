@@ -0,0 +1,140 @@
+import numpy as np
+
+from .schema import encode_enum
+
+EARTH_RADIUS = 6371000.0
+
+ARMED = encode_enum('arm_status', 'Armed')
+
+# drone_metrics columns read for flight segmentation, in query order
+SEGMENT_COLUMNS = ['id', 'timestamp', 'arm_status', 'latitude', 'longitude',
+                   'altitude', 'battery', 'speed', 'mission_id']
+
+# Per-flight summary columns returned to clients
+SUMMARY_COLUMNS = [
+    'start_time', 'end_time', 'first_metric_id', 'last_metric_id', 'samples', 'duration',
+    'distance', 'max_altitude', 'battery_start', 'battery_end', 'battery_used', 'avg_speed',
+    'mission_id', 'in_progress'
+]
+
+# Every stored column; the extra ones carry running state between batches
+FLIGHT_COLUMNS = SUMMARY_COLUMNS + ['speed_sum', 'speed_samples', 'last_latitude', 'last_longitude']
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between points given in degrees"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def columns_from_rows(rows):
+    """Arrays for SEGMENT_COLUMNS from drone_metrics row tuples"""
+    values = list(zip(*rows)) if rows else [()] * len(SEGMENT_COLUMNS)
+    columns = dict(zip(SEGMENT_COLUMNS, values))
+    return {
+        'id': np.array(columns['id'], dtype=np.int64),
+        'timestamp': np.array(columns['timestamp'], dtype=np.int64),
+        'armed': np.array(columns['arm_status']) == ARMED,
+        'latitude': np.array(columns['latitude'], dtype=float),
+        'longitude': np.array(columns['longitude'], dtype=float),
+        'altitude': np.array(columns['altitude'], dtype=float),
+        'battery': np.array(columns['battery'], dtype=float),
+        'speed': np.array(columns['speed'], dtype=float),
+        'mission_id': list(columns['mission_id']),
+    }
+
+
+def flight_from_row(row):
+    """Summary dictionary for a stored (id, *FLIGHT_COLUMNS) flights row"""
+    return dict(zip(['id'] + FLIGHT_COLUMNS, row))
+
+
+def segment_flights(columns, open_flight=None):
+    """Fold a batch of metrics rows, in id order, into flight summaries.
+
+    A flight is a run of armed rows. ``open_flight`` is the summary left in
+    progress by the previous batch and is extended when the batch starts
+    armed. Returns every flight this batch touched; only a flight reaching
+    the end of the batch stays in progress.
+    """
+    armed = columns['armed']
+    count = len(armed)
+    flights = []
+    if open_flight and (count == 0 or not armed[0]):
+        open_flight['in_progress'] = 0
+        flights.append(open_flight)
+        open_flight = None
+    if count == 0:
+        return flights
+
+    edges = np.flatnonzero(np.diff(armed.astype(np.int8))) + 1
+    for lo, hi in zip(np.concatenate(([0], edges)), np.concatenate((edges, [count]))):
+        if not armed[lo]:
+            continue
+        flight = open_flight if lo == 0 and open_flight else _new_flight(columns, lo)
+        _accumulate(flight, columns, lo, hi)
+        flight['in_progress'] = int(hi == count)
+        flights.append(flight)
+    return flights
+
+
+def _new_flight(columns, index):
+    flight = dict.fromkeys(FLIGHT_COLUMNS)
+    flight.update({
+        'id': None,
+        'start_time': int(columns['timestamp'][index]),
+        'first_metric_id': int(columns['id'][index]),
+        'samples': 0, 'distance': 0.0, 'speed_sum': 0.0, 'speed_samples': 0,
+    })
+    return flight
+
+
+def _first_and_last(values):
+    valid = values[~np.isnan(values)]
+    return (float(valid[0]), float(valid[-1])) if len(valid) else (None, None)
+
+
+def _accumulate(flight, columns, lo, hi):
+    """Add rows ``lo:hi`` of a batch to a flight's running aggregates"""
+    lat, lon = columns['latitude'][lo:hi], columns['longitude'][lo:hi]
+    # Rows without a fix report NaN or 0, 0
+    fix = ~(np.isnan(lat) | np.isnan(lon)) & ((lat != 0) | (lon != 0))
+    lat, lon = lat[fix], lon[fix]
+    if flight['last_latitude'] is not None:
+        lat = np.concatenate(([flight['last_latitude']], lat))
+        lon = np.concatenate(([flight['last_longitude']], lon))
+    if len(lat) > 1:
+        flight['distance'] += float(haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+    if len(lat):
+        flight['last_latitude'], flight['last_longitude'] = float(lat[-1]), float(lon[-1])
+
+    altitude = columns['altitude'][lo:hi]
+    altitude = altitude[~np.isnan(altitude)]
+    if len(altitude):
+        top = float(altitude.max())
+        flight['max_altitude'] = top if flight['max_altitude'] is None else max(flight['max_altitude'], top)
+
+    first_battery, last_battery = _first_and_last(columns['battery'][lo:hi])
+    if flight['battery_start'] is None:
+        flight['battery_start'] = first_battery
+    if last_battery is not None:
+        flight['battery_end'] = last_battery
+    if flight['battery_start'] is not None and flight['battery_end'] is not None:
+        flight['battery_used'] = flight['battery_start'] - flight['battery_end']
+
+    speed = columns['speed'][lo:hi]
+    speed = speed[~np.isnan(speed)]
+    flight['speed_sum'] += float(speed.sum())
+    flight['speed_samples'] += len(speed)
+    if flight['speed_samples']:
+        flight['avg_speed'] = flight['speed_sum'] / flight['speed_samples']
+
+    missions = [m for m in columns['mission_id'][lo:hi] if m is not None]
+    if missions:
+        flight['mission_id'] = missions[-1]
+    flight['samples'] += int(hi - lo)
+    flight['end_time'] = int(columns['timestamp'][hi - 1])
+    flight['last_metric_id'] = int(columns['id'][hi - 1])
+    flight['duration'] = (flight['end_time'] - flight['start_time']) / 1000
@@ -0,0 +1,537 @@
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote
+
+from .monitoring import Counter, Gauge, Histogram
+from .static_server import cache_control, content_type, make_etag, not_modified, select_variant
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_BODY_SIZE = 16 * 1024 * 1024
+MAX_MESSAGE_SIZE = 1024 * 1024
+# A streamed WSGI body is read in batches of up to this many bytes, or for this long, per call to its thread
+WSGI_BATCH_BYTES = 64 * 1024
+WSGI_BATCH_SECONDS = 0.02
+
+HTTP_REQUESTS = Counter('http_requests', 'HTTP requests answered', ['method', 'status'])
+# Until the response head is ready, so streamed bodies such as MJPEG don't count their whole lifetime
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Time to produce an HTTP response', ['handler'])
+WS_CONNECTIONS = Counter('websocket_connections', 'WebSocket connections accepted')
+WS_CLIENTS = Gauge('websocket_clients', 'Open WebSocket connections')
+WS_MESSAGES = Counter('websocket_messages_sent', 'WebSocket messages sent')
+WS_BYTES = Counter('websocket_bytes_sent', 'WebSocket message payload bytes sent')
+WS_SEND_ERRORS = Counter('websocket_send_errors', 'WebSocket sends that failed on a closed connection')
+
+# Paths below these are never pages of the single-page app, so a miss there is a real 404
+NON_PAGE_PREFIXES = ('/api/', '/admin/')
+
+# WebSocket opcodes
+CONTINUATION, TEXT, BINARY, CLOSE, PING, PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+class ConnectionClosed(Exception):
+    """Raised by WebSocket.send and recv once the connection is closed"""
+
+
+class Headers(dict):
+    """Request headers with case-insensitive lookup"""
+    def __getitem__(self, key):
+        return super().__getitem__(key.lower())
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+    def __contains__(self, key):
+        return super().__contains__(key.lower())
+
+
+class Request:
+    def __init__(self, method, target, version, headers, body, remote_address):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.path, _, self.query_string = target.partition('?')
+        self.query = {key: values[-1] for key, values in parse_qs(self.query_string).items()}
+        self.headers = headers
+        self.body = body
+        self.remote_address = remote_address
+        self.handler = None
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('Connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+class Response:
+    """An HTTP response. ``body`` is bytes, an open file, or an async iterator of bytes to stream.
+
+    ``headers`` is a dict or a list of (name, value) pairs; a list keeps
+    repeated headers such as Set-Cookie.
+    """
+    def __init__(self, body=b'', status=200, headers=None, content_type='text/plain; charset=utf-8'):
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.status = status
+        self.headers = list(headers.items() if isinstance(headers, dict) else headers or [])
+        if content_type and not self.has_header('Content-Type'):
+            self.headers.append(('Content-Type', content_type))
+
+    def has_header(self, name):
+        name = name.lower()
+        return any(header.lower() == name for header, _ in self.headers)
+
+
+class WebSocket:
+    """Server side of an RFC 6455 connection on a stream already upgraded by AsyncHTTPServer.
+
+    Offers the subset of the ``websockets`` connection API the handlers
+    use: ``send``, ``recv``, ``close``, ``path`` and ``remote_address``.
+    Pings are answered as they arrive.
+    """
+    def __init__(self, reader, writer, request):
+        self.reader = reader
+        self.writer = writer
+        self.path = request.path
+        self.request_headers = request.headers
+        self.remote_address = request.remote_address
+        self.closed = False
+        self._messages = asyncio.Queue()
+        self._reading = asyncio.create_task(self._read_frames())
+
+    async def send(self, message):
+        if self.closed:
+            WS_SEND_ERRORS.inc()
+            raise ConnectionClosed()
+        payload = message.encode('utf-8') if isinstance(message, str) else bytes(message)
+        try:
+            await self._send_frame(TEXT if isinstance(message, str) else BINARY, payload)
+        except ConnectionClosed:
+            WS_SEND_ERRORS.inc()
+            raise
+        WS_MESSAGES.inc()
+        WS_BYTES.inc(len(payload))
+
+    async def recv(self):
+        message = await self._messages.get()
+        if message is None:
+            raise ConnectionClosed()
+        return message
+
+    async def __aiter__(self):
+        """Messages received until the connection closes"""
+        try:
+            while True:
+                yield await self.recv()
+        except ConnectionClosed:
+            return
+
+    async def close(self, code=1000, reason=''):
+        if self.closed:
+            return
+        try:
+            await self._send_frame(CLOSE, struct.pack('!H', code) + reason.encode('utf-8'))
+        except ConnectionClosed:
+            pass
+        self._closed()
+
+    async def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        try:
+            self.writer.write(header + payload)
+            await self.writer.drain()
+        except (ConnectionError, RuntimeError) as e:
+            self._closed()
+            raise ConnectionClosed() from e
+
+    async def _read_frame(self):
+        first, second = await self.reader.readexactly(2)
+        opcode, length = first & 0x0F, second & 0x7F
+        if length == 126:
+            length, = struct.unpack('!H', await self.reader.readexactly(2))
+        elif length == 127:
+            length, = struct.unpack('!Q', await self.reader.readexactly(8))
+        if length > MAX_MESSAGE_SIZE:
+            raise ValueError(f"WebSocket frame of {length} bytes is too large")
+        mask = await self.reader.readexactly(4) if second & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask and length:
+            key = (mask * (length // 4 + 1))[:length]
+            payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+        return bool(first & 0x80), opcode, payload
+
+    async def _read_frames(self):
+        fragments, message_type = [], None
+        try:
+            while not self.closed:
+                fin, opcode, payload = await self._read_frame()
+                if opcode == PING:
+                    await self._send_frame(PONG, payload)
+                elif opcode == CLOSE:
+                    await self.close(struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else 1000)
+                elif opcode in (TEXT, BINARY, CONTINUATION):
+                    if opcode != CONTINUATION:
+                        fragments, message_type = [], opcode
+                    fragments.append(payload)
+                    if fin:
+                        data = b''.join(fragments)
+                        self._messages.put_nowait(data.decode('utf-8') if message_type == TEXT else data)
+                        fragments = []
+        except (asyncio.IncompleteReadError, ConnectionError, ConnectionClosed, ValueError):
+            pass
+        finally:
+            self._closed()
+
+    def _closed(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._messages.put_nowait(None)
+        self.writer.close()
+
+
+def _next_batch(chunks):
+    """Chunks of a WSGI body joined up to the batch limits, or None once it is exhausted.
+
+    Runs on the response's thread; one call and one socket write per batch
+    keep bodies of many small chunks, such as NDJSON rows, off the loop.
+    """
+    batch, size = [], 0
+    deadline = time.monotonic() + WSGI_BATCH_SECONDS
+    for chunk in chunks:
+        if chunk:
+            batch.append(chunk)
+            size += len(chunk)
+        if size >= WSGI_BATCH_BYTES or time.monotonic() >= deadline:
+            return b''.join(batch)
+    return b''.join(batch) if batch else None
+
+
+class WSGIBody:
+    """A WSGI app's response body as an async iterator of batches.
+
+    The app call, every batch and ``close`` run on one thread owned by
+    the response, because apps may keep per-response state on the thread:
+    Flask's ``stream_with_context`` pushes its context when the body starts
+    and pops it when the body closes, and fails if those are different
+    threads. ``aclose`` closes the body, even if it was never iterated.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wsgi')
+        # The iterable the app returned, whose close() ends the response, and an iterator over it
+        self._result = None
+        self._chunks = None
+        # The first batch, read before the response head is sent
+        self._ready = []
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def start(self, app, environ, start_response):
+        """Call the app and read the first batch, so start_response has run"""
+        try:
+            self._result = await self._run(app, environ, start_response)
+            self._chunks = await self._run(iter, self._result)
+            self._ready.append(await self._run(_next_batch, self._chunks))
+        except BaseException:
+            await self.aclose()
+            raise
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self._chunks is not None:
+            batch = self._ready.pop() if self._ready else await self._run(_next_batch, self._chunks)
+            if batch is None:
+                await self.aclose()
+            elif batch:
+                return batch
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        result, self._result, self._chunks = self._result, None, None
+        try:
+            close = getattr(result, 'close', None)
+            if close:
+                await self._run(close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+
+class AsyncHTTPServer:
+    """HTTP/1.1, WebSocket and static files on one port, served from the event loop.
+
+    Requests are answered, in order, by a WebSocket upgrade to
+    ``websocket_handler``, a coroutine registered with ``route``, a file
+    under ``static_dir`` (with the pre-compressed variants and caching of
+    ``static_server``), ``index.html`` for page loads of the web app's
+    client-side routes, and finally ``wsgi_app`` run on a thread per
+    response so existing Flask routes keep working unchanged.
+    """
+    def __init__(self, static_dir=None, wsgi_app=None, websocket_handler=None):
+        self.static_dir = static_dir
+        self.wsgi_app = wsgi_app
+        self.websocket_handler = websocket_handler
+        self.routes = {}
+        self.server = None
+        self._connections = set()
+
+    def route(self, path, methods=('GET',)):
+        """Register a coroutine taking a Request and returning a Response"""
+        def decorator(handler):
+            for method in methods:
+                self.routes[(method, path)] = handler
+            if 'GET' in methods:
+                self.routes.setdefault(('HEAD', path), handler)
+            return handler
+        return decorator
+
+    async def start(self, host='0.0.0.0', port=5000):
+        """Bind and start serving; returns once the port is listening"""
+        self.server = await asyncio.start_server(self._serve_connection, host, port)
+        logger.info(f"Serving HTTP and WebSocket on {host}:{port}")
+        return self.server
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        for writer in list(self._connections):
+            writer.close()
+
+    async def _read_request(self, reader, remote_address):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise ValueError("Incomplete request") from e
+            return None
+        except asyncio.LimitOverrunError as e:
+            raise ValueError("Request headers too large") from e
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, version = lines[0].split(' ', 2)
+        headers = Headers()
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+        if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            raise ValueError("Chunked request bodies are not supported")
+        length = int(headers.get('Content-Length') or 0)
+        if length > MAX_BODY_SIZE:
+            raise ValueError("Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return Request(method, target, version, headers, body, remote_address)
+
+    async def _serve_connection(self, reader, writer):
+        remote_address = writer.get_extra_info('peername')
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader, remote_address)
+                except ValueError as e:
+                    await self._write_response(writer, None, Response(str(e), HTTPStatus.BAD_REQUEST,
+                                                                      {'Connection': 'close'}))
+                    break
+                if request is None:
+                    break
+                if request.headers.get('Upgrade', '').lower() == 'websocket' and self.websocket_handler:
+                    await self._upgrade(reader, writer, request)
+                    break
+                start = time.perf_counter()
+                try:
+                    response = await self._dispatch(request)
+                except Exception as e:
+                    logger.error(f"Error handling {request.method} {request.path}: {e}")
+                    response = Response('Internal Server Error', HTTPStatus.INTERNAL_SERVER_ERROR)
+                HTTP_LATENCY.labels(request.handler).observe(time.perf_counter() - start)
+                HTTP_REQUESTS.labels(request.method, int(response.status)).inc()
+                if not await self._write_response(writer, request, response) or not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Connection error from {remote_address}: {e}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _upgrade(self, reader, writer, request):
+        key = request.headers.get('Sec-WebSocket-Key')
+        if not key or request.headers.get('Sec-WebSocket-Version') != '13':
+            await self._write_response(writer, request, Response('Bad WebSocket handshake', HTTPStatus.BAD_REQUEST))
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+        websocket = WebSocket(reader, writer, request)
+        WS_CONNECTIONS.inc()
+        WS_CLIENTS.inc()
+        try:
+            await self.websocket_handler(websocket)
+        finally:
+            WS_CLIENTS.dec()
+            await websocket.close()
+            websocket._reading.cancel()
+
+    async def _dispatch(self, request):
+        # Which kind of handler answered, a bounded label for the latency metric
+        request.handler = request.path
+        handler = self.routes.get((request.method, request.path))
+        if handler:
+            return await handler(request)
+        request.handler = 'static'
+        if self.static_dir and request.method in ('GET', 'HEAD'):
+            response = self._static(request)
+            if response:
+                return response
+        if self._is_page_load(request):
+            # The router in the web app resolves the path once index.html has loaded
+            response = self._static(request, '/index.html')
+            if response:
+                request.handler = 'index'
+                return response
+        request.handler = 'wsgi' if self.wsgi_app else 'not_found'
+        if self.wsgi_app:
+            return await self._call_wsgi(request)
+        return Response('Not Found', HTTPStatus.NOT_FOUND)
+
+    def _is_page_load(self, request):
+        """Whether a request is a browser navigating to a client-side route"""
+        return (self.static_dir and request.method in ('GET', 'HEAD')
+                and not request.path.startswith(NON_PAGE_PREFIXES)
+                and 'text/html' in request.headers.get('Accept', ''))
+
+    def _static(self, request, url_path=None):
+        """A Response for a file under static_dir, or None if there is no such file"""
+        url_path = posixpath.normpath(unquote(url_path or request.path))
+        if url_path.endswith('/') or url_path in ('.', '/'):
+            url_path = posixpath.join(url_path, 'index.html')
+        path = os.path.join(self.static_dir, *[part for part in url_path.split('/') if part not in ('', '.', '..')])
+        if not os.path.isfile(path):
+            return None
+        file_path, encoding = select_variant(path, request.headers.get('Accept-Encoding'))
+        stat = os.stat(file_path)
+        etag = make_etag(stat, encoding)
+        headers = {'ETag': etag, 'Cache-Control': cache_control(url_path), 'Vary': 'Accept-Encoding'}
+        if not_modified(request.headers, etag, stat.st_mtime):
+            return Response(status=HTTPStatus.NOT_MODIFIED, headers=headers, content_type=None)
+        headers['Last-Modified'] = formatdate(stat.st_mtime, usegmt=True)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(open(file_path, 'rb'), headers=headers, content_type=content_type(path))
+
+    async def _call_wsgi(self, request):
+        """Run the WSGI app on a thread of its own and stream its body back"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        host, port = (request.remote_address or ('', 0))[:2]
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(request.path),
+            'QUERY_STRING': request.query_string,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': str(self.server.sockets[0].getsockname()[1]) if self.server else '0',
+            'SERVER_PROTOCOL': request.version,
+            'REMOTE_ADDR': host,
+            'REMOTE_PORT': str(port),
+            'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+            'CONTENT_LENGTH': str(len(request.body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(request.body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in request.headers.items():
+            if name not in ('content-type', 'content-length'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        body = WSGIBody()
+        await body.start(self.wsgi_app, environ, start_response)
+        return Response(body, started['status'], started['headers'], content_type=None)
+
+    async def _write_response(self, writer, request, response):
+        """Send a response; returns False if the connection can't be reused"""
+        status = int(response.status)
+        try:
+            phrase = HTTPStatus(status).phrase
+        except ValueError:
+            # A WSGI app may answer with a code http.HTTPStatus doesn't know
+            phrase = ''
+        headers = [(name, value) for name, value in response.headers if name.lower() != 'connection']
+        length = response.has_header('Content-Length')
+        body = response.body
+        # The body is still closed below, which for a WSGI body runs the app's cleanup
+        no_payload = status in (HTTPStatus.NOT_MODIFIED, HTTPStatus.NO_CONTENT)
+        head_only = no_payload or (request is not None and request.method == 'HEAD')
+        chunked = False
+        if no_payload:
+            length = True
+        elif isinstance(body, bytes):
+            headers.append(('Content-Length', str(len(body))))
+            length = True
+        elif hasattr(body, 'fileno'):
+            headers.append(('Content-Length', str(os.fstat(body.fileno()).st_size)))
+            length = True
+        elif not length:
+            headers.append(('Transfer-Encoding', 'chunked'))
+            chunked = True
+        if request is None or not request.keep_alive:
+            headers.append(('Connection', 'close'))
+        lines = [f'HTTP/1.1 {status} {phrase}']
+        lines.extend(f'{name}: {value}' for name, value in headers)
+
+        try:
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            if head_only:
+                pass
+            elif isinstance(body, bytes):
+                writer.write(body)
+            elif hasattr(body, 'fileno'):
+                await writer.drain()
+                await asyncio.get_running_loop().sendfile(writer.transport, body)
+            else:
+                async for chunk in body:
+                    writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                    # Waiting for the socket to drain keeps slow clients from buffering unbounded data
+                    await writer.drain()
+                if chunked:
+                    writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            if hasattr(body, 'close') and hasattr(body, 'fileno'):
+                body.close()
+            elif hasattr(body, 'aclose'):
+                await body.aclose()
+        # A streamed body without a length or chunking ends when the connection does
+        return isinstance(body, bytes) or length or chunked
+
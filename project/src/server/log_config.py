@@ -0,0 +1,133 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from .monitoring import Counter
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Records waiting for the writer thread; past this they are dropped rather than block
+QUEUE_SIZE = 10000
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+# Seconds a repeated warning or error is silenced after it is logged
+RATE_LIMIT_INTERVAL = 10.0
+# Distinct messages tracked by the rate limiter before expired ones are forgotten
+RATE_LIMIT_KEYS = 1024
+
+DROPPED = Counter('log_records_dropped', 'Log records dropped because the log queue was full')
+SUPPRESSED = Counter('log_records_suppressed', 'Repeated warnings and errors suppressed by rate limiting')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            # QueueHandler has already folded any traceback into the message
+            'message': record.getMessage(),
+        }
+        return json.dumps(entry)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets a repeated warning or error through once per ``interval`` seconds.
+
+    A record repeats an earlier one when it comes from the same call site
+    with the same text, so distinct errors from one place, such as
+    failures for different requests or vehicles, are all logged. The next
+    record let through reports how many were suppressed in between.
+    """
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        # (pathname, lineno, message) -> [next allowed time, suppressed count]
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        now = time.monotonic()
+        key = (record.pathname, record.lineno, record.getMessage())
+        with self._lock:
+            if len(self._sites) >= RATE_LIMIT_KEYS and key not in self._sites:
+                self._sites = {k: site for k, site in self._sites.items() if now < site[0]}
+            site = self._sites.get(key)
+            if site is not None and now < site[0]:
+                site[1] += 1
+                SUPPRESSED.inc()
+                return False
+            suppressed = site[1] if site else 0
+            self._sites[key] = [now + self.interval, 0]
+        if suppressed:
+            record.msg = f'{record.msg} ({suppressed} similar messages suppressed)'
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or raising"""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+def add_logging_arguments(parser):
+    group = parser.add_argument_group('logging')
+    group.add_argument('--log-file', default='drone.log', help='Log file (default: drone.log)')
+    group.add_argument('--log-json', action='store_true', help='Write JSON lines instead of text')
+    group.add_argument('--log-rotate', default='size', choices=['size', 'midnight', 'hourly'],
+                       help='Rotate the log file by size (10 MiB) or at midnight or every hour')
+    group.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+
+
+def setup_logging(log_file='drone.log', level=logging.INFO, json_format=False, rotate='size',
+                  backup_count=BACKUP_COUNT, rate_limit=RATE_LIMIT_INTERVAL):
+    """Send all logging through a queue to a single writer thread.
+
+    Logging calls on the video, WebSocket and telemetry paths only format
+    the record and put it on the queue. A QueueListener thread writes to
+    stdout and to a rotating ``log_file``, so a slow disk or terminal
+    never stalls them. Returns the listener, which is stopped at exit.
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    if rotate == 'size':
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=MAX_BYTES, backupCount=backup_count, encoding='utf-8')
+    else:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when='midnight' if rotate == 'midnight' else 'H', backupCount=backup_count, encoding='utf-8')
+    stream_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter(rate_limit))
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+
+    def flush_at_exit():
+        # QueueListener.stop() can't be called twice before Python 3.12
+        if listener._thread is not None:
+            listener.stop()
+    atexit.register(flush_at_exit)
+    return listener
@@ -0,0 +1,21 @@
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class WaypointAction:
+    """Represents an action to be performed at a waypoint"""
+    action_type: str  # 'waypoint', 'takeoff', 'land', 'loiter', 'rtl'
+    altitude: float   # meters
+    duration: Optional[float] = None  # seconds for loiter
+    
+    def __post_init__(self):
+        """Validate action parameters"""
+        valid_types = {'waypoint', 'takeoff', 'land', 'loiter', 'rtl'}
+        if self.action_type not in valid_types:
+            raise ValueError(f"Invalid action type. Must be one of {valid_types}")
+        
+        if self.altitude < 0:
+            raise ValueError("Altitude must be non-negative")
+            
+        if self.action_type == 'loiter' and (self.duration is None or self.duration <= 0):
+            raise ValueError("Loiter action requires positive duration")
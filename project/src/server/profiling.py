@@ -0,0 +1,279 @@
+import asyncio
+import hmac
+import io
+import json
+import logging
+import marshal
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+
+from .http_server import Response
+
+logger = logging.getLogger(__name__)
+
+# Longest profile a single request may ask for, in seconds
+MAX_PROFILE_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+
+# Event loop callbacks running longer than this are attributed to their task during a dump
+SLOW_CALLBACK = 0.002
+
+
+def _frame_label(code, lineno):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{lineno})'
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread.
+
+    Nothing is installed in the profiled threads, so the cost is the
+    sampling itself and only while ``run`` is going. One profile runs at
+    a time.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        # Collapsed stack -> seconds, and per-function pstats entries
+        self.stacks = Counter()
+        self._stats = defaultdict(lambda: [0, 0, 0.0, 0.0, defaultdict(lambda: [0, 0, 0.0, 0.0])])
+
+    def run(self, seconds):
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        try:
+            own = threading.get_ident()
+            deadline = time.perf_counter() + seconds
+            last = time.perf_counter()
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != own:
+                        self._record(names.get(ident, str(ident)), frame, now - last)
+                self.samples += 1
+                last = now
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+        return self
+
+    def _record(self, thread_name, frame, weight):
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[';'.join([thread_name] + [_frame_label(f.f_code, f.f_lineno) for f in stack])] += weight
+
+        keys = [(f.f_code.co_filename, f.f_code.co_firstlineno, f.f_code.co_name) for f in stack]
+        for key in set(keys):
+            entry = self._stats[key]
+            entry[0] += 1
+            entry[1] += 1
+            entry[3] += weight
+        self._stats[keys[-1]][2] += weight
+        for caller, callee in set(zip(keys, keys[1:])):
+            edge = self._stats[callee][4][caller]
+            edge[0] += 1
+            edge[1] += 1
+            edge[3] += weight
+        if len(keys) > 1:
+            self._stats[keys[-1]][4][keys[-2]][2] += weight
+
+    def collapsed(self):
+        """One ``thread;outer;...;inner <milliseconds>`` line per stack, for flame graph tools"""
+        return ''.join(f'{stack} {max(1, round(seconds * 1000))}\n'
+                       for stack, seconds in self.stacks.most_common())
+
+    def pstats(self):
+        """The profile as a marshalled stats dict, loadable with ``pstats.Stats(path)``"""
+        return marshal.dumps({key: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+                              for key, (cc, nc, tt, ct, callers) in self._stats.items()})
+
+
+class MemoryTracer:
+    """tracemalloc snapshots diffed against a baseline.
+
+    Tracing is only switched on by ``start``, so allocations cost nothing
+    extra until somebody goes looking for a leak.
+    """
+    def __init__(self):
+        self.baseline = None
+
+    def start(self, frames=10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.baseline = None
+        tracemalloc.stop()
+
+    def diff(self, limit=25, key_type='lineno'):
+        """Top allocation changes since ``start`` as text, or None if not tracing"""
+        if not tracemalloc.is_tracing() or self.baseline is None:
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        out = io.StringIO()
+        out.write(f'Traced memory: {current / 1024:.1f} KiB now, {peak / 1024:.1f} KiB peak\n')
+        for stat in snapshot.compare_to(self.baseline, key_type)[:limit]:
+            out.write(f'{stat}\n')
+            if key_type == 'traceback':
+                out.writelines(f'    {line}\n' for line in stat.traceback.format())
+        return out.getvalue()
+
+
+async def dump_tasks(window=1.0):
+    """Every asyncio task with its stack, and how long each one held the loop during ``window``.
+
+    For the window the loop runs in debug mode, which reports each
+    callback slower than SLOW_CALLBACK; those reports are summed per task.
+    Loop lag is how late a 10 ms sleep wakes up over the same window.
+    """
+    loop = asyncio.get_running_loop()
+    blocked = defaultdict(lambda: [0, 0.0, 0.0])
+
+    class SlowCallbacks(logging.Handler):
+        def emit(self, record):
+            # asyncio logs 'Executing %s took %.3f seconds'
+            if record.msg.startswith('Executing') and len(record.args) == 2:
+                handle, seconds = record.args
+                for task in asyncio.all_tasks(loop):
+                    if f"name='{task.get_name()}'" in str(handle):
+                        entry = blocked[task.get_name()]
+                        entry[0] += 1
+                        entry[1] += seconds
+                        entry[2] = max(entry[2], seconds)
+                        break
+
+    asyncio_logger = logging.getLogger('asyncio')
+    handler = SlowCallbacks(logging.WARNING)
+    debug, slow_duration, propagate = loop.get_debug(), loop.slow_callback_duration, asyncio_logger.propagate
+    asyncio_logger.addHandler(handler)
+    asyncio_logger.propagate = False
+    loop.slow_callback_duration = SLOW_CALLBACK
+    loop.set_debug(True)
+    lags = []
+    try:
+        deadline = loop.time() + window
+        while loop.time() < deadline:
+            start = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - start - 0.01)
+    finally:
+        loop.set_debug(debug)
+        loop.slow_callback_duration = slow_duration
+        asyncio_logger.removeHandler(handler)
+        asyncio_logger.propagate = propagate
+
+    tasks = []
+    for task in asyncio.all_tasks(loop):
+        coro = task.get_coro()
+        count, total, longest = blocked.get(task.get_name(), (0, 0.0, 0.0))
+        tasks.append({
+            'name': task.get_name(),
+            'coro': getattr(coro, '__qualname__', repr(coro)),
+            'done': task.done(),
+            'slow_callbacks': count,
+            'blocked_seconds': round(total, 4),
+            'max_blocked_seconds': round(longest, 4),
+            'stack': [_frame_label(frame.f_code, frame.f_lineno) for frame in task.get_stack()],
+        })
+    tasks.sort(key=lambda task: task['blocked_seconds'], reverse=True)
+    return {
+        'window_seconds': window,
+        'loop_lag_max_seconds': round(max(lags, default=0.0), 4),
+        'loop_lag_mean_seconds': round(sum(lags) / len(lags), 4) if lags else 0.0,
+        'tasks': tasks,
+    }
+
+
+def _positive(request, name, default):
+    """A finite, positive number from the query string; anything else is a 400"""
+    value = float(request.query.get(name, default))
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f"{name} must be a finite number above zero")
+    return value
+
+
+def add_admin_routes(server, token):
+    """Register the /admin profiling endpoints on an AsyncHTTPServer.
+
+    They answer only requests carrying ``token`` as a bearer token, and
+    are not registered at all without one.
+    """
+    if not token:
+        return
+    tracer = MemoryTracer()
+
+    def authorized(request):
+        supplied = request.headers.get('Authorization', '')
+        return hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+
+    def admin(path, methods=('GET',)):
+        def decorator(handler):
+            async def guarded(request):
+                if not authorized(request):
+                    return Response('Forbidden', 403)
+                try:
+                    return await handler(request)
+                except ValueError as e:
+                    return Response(str(e), 400)
+            return server.route(path, methods)(guarded)
+        return decorator
+
+    @admin('/admin/profile')
+    async def profile(request):
+        """Sample every thread for ?seconds= and return collapsed stacks or ?format=pstats"""
+        seconds = min(_positive(request, 'seconds', 10), MAX_PROFILE_SECONDS)
+        interval = max(_positive(request, 'interval', DEFAULT_INTERVAL), 0.001)
+        profiler = SamplingProfiler(interval)
+        try:
+            # The sampler sleeps between samples on an executor thread, not the loop
+            await asyncio.get_running_loop().run_in_executor(None, profiler.run, seconds)
+        except RuntimeError as e:
+            return Response(str(e), 409)
+        logger.info(f"Profiled all threads for {seconds}s ({profiler.samples} samples)")
+        if request.query.get('format') == 'pstats':
+            return Response(profiler.pstats(), content_type='application/octet-stream',
+                            headers={'Content-Disposition': 'attachment; filename="profile.pstats"'})
+        return Response(profiler.collapsed())
+
+    @admin('/admin/tracemalloc/start', methods=('POST',))
+    async def tracemalloc_start(request):
+        tracer.start(int(request.query.get('frames', 10)))
+        return Response('Tracing allocations; the baseline snapshot was taken now\n')
+
+    @admin('/admin/tracemalloc/diff')
+    async def tracemalloc_diff(request):
+        key_type = request.query.get('group', 'lineno')
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            raise ValueError("group must be lineno, filename or traceback")
+        loop = asyncio.get_running_loop()
+        report = await loop.run_in_executor(None, tracer.diff, int(request.query.get('limit', 25)), key_type)
+        if report is None:
+            return Response('Not tracing; POST /admin/tracemalloc/start first\n', 409)
+        return Response(report)
+
+    @admin('/admin/tracemalloc/stop', methods=('POST',))
+    async def tracemalloc_stop(request):
+        tracer.stop()
+        return Response('Stopped tracing allocations\n')
+
+    @admin('/admin/asyncio/tasks')
+    async def asyncio_tasks(request):
+        window = min(_positive(request, 'window', 1), MAX_PROFILE_SECONDS)
+        return Response(json.dumps(await dump_tasks(window), indent=2), content_type='application/json')
@@ -0,0 +1,378 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever a migration is appended to MIGRATIONS
+SCHEMA_VERSION = 3
+
+# Enum columns are stored as the index of their value in these tuples
+ENUMS = {
+    'arm_status': ('Disarmed', 'Armed'),
+    'landing_station': ('Closed', 'Open'),
+    'mission_status': ('Idle', 'Running', 'Completed', 'Failed'),
+}
+ENUM_CODES = {field: {name: code for code, name in enumerate(names)} for field, names in ENUMS.items()}
+
+# Numeric columns summarised in the rollup tables
+ROLLUP_FIELDS = ['latitude', 'longitude', 'speed', 'signal', 'battery', 'heading', 'altitude']
+
+# Rollup resolutions in seconds, coarsest first
+ROLLUPS = {'1h': 3600, '1m': 60}
+
+# R*Tree coordinates are 32-bit floats, so times are stored as seconds since
+# 2020 to keep them accurate to about 16 seconds
+RTREE_EPOCH = 1577836800
+
+# Waypoint coordinates in either the {lat, lng} or {position: [lat, lng]} form
+WAYPOINT_LAT = "coalesce(json_extract(value, '$.lat'), json_extract(value, '$.position[0]'))"
+WAYPOINT_LNG = ("coalesce(json_extract(value, '$.lng'), json_extract(value, '$.lon'), "
+                "json_extract(value, '$.position[1]'))")
+
+# Current time as epoch milliseconds
+NOW_MS = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+
+def _epoch_ms(column):
+    return f"CAST(round((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def _enum_code(column, field):
+    cases = ' '.join(f"WHEN '{name}' THEN {code}" for name, code in ENUM_CODES[field].items())
+    return f"CASE {column} {cases} END"
+
+
+def encode_enum(field, value):
+    """Integer code for an enum value given by name or code; None if unknown"""
+    if isinstance(value, int) and 0 <= value < len(ENUMS[field]):
+        return value
+    return ENUM_CODES[field].get(value)
+
+
+def decode_enum(field, code):
+    names = ENUMS[field]
+    return names[code] if code is not None and 0 <= code < len(names) else None
+
+
+def _tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _baseline(conn):
+    """Version 1: the TEXT/DATETIME layout created by init_db.py and early DroneDB.
+
+    Older databases may lack some tables or the mission columns, so this
+    only fills those gaps.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS drone_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            latitude REAL,
+            longitude REAL,
+            speed REAL,
+            signal INTEGER,
+            arm_status TEXT CHECK(arm_status IN ('Armed', 'Disarmed')),
+            battery INTEGER,
+            landing_station TEXT CHECK(landing_station IN ('Open', 'Closed')),
+            heading INTEGER,
+            altitude REAL,
+            mission_status TEXT CHECK(mission_status IN ('Idle', 'Running', 'Completed', 'Failed')),
+            current_mission TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    columns = _columns(conn, 'drone_metrics')
+    if 'mission_status' not in columns:
+        conn.execute('ALTER TABLE drone_metrics ADD COLUMN mission_status TEXT')
+    if 'current_mission' not in columns:
+        conn.execute('ALTER TABLE drone_metrics ADD COLUMN current_mission TEXT')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS missions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT CHECK(status IN ('Idle', 'Running', 'Completed', 'Failed')) DEFAULT 'Idle',
+            start_time DATETIME,
+            end_time DATETIME,
+            waypoints TEXT,  -- JSON string of waypoints
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mission_uploads (
+            system_id INTEGER PRIMARY KEY,
+            mission_hash TEXT NOT NULL,
+            item_count INTEGER NOT NULL,
+            opaque_id INTEGER DEFAULT 0,
+            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _rebuild(conn, table, create_sql, select_sql):
+    """Replace a table with a new definition, copying rows through ``select_sql``"""
+    conn.execute(f'DROP TABLE IF EXISTS {table}_new')
+    conn.execute(create_sql.format(table=f'{table}_new'))
+    conn.execute(f'INSERT INTO {table}_new {select_sql}')
+    # Keep AUTOINCREMENT counters so ids of archived rows are never reused
+    if 'sqlite_sequence' in _tables(conn):
+        seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+        if seq:
+            conn.execute('DELETE FROM sqlite_sequence WHERE name = ?', (f'{table}_new',))
+            conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (f'{table}_new', seq[0]))
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+
+def _compact(conn):
+    """Version 2: integer enum codes, epoch-millisecond times and mission foreign keys"""
+    for trigger in ('drone_metrics_rtree_insert', 'drone_metrics_rtree_delete', 'missions_rtree_insert',
+                    'missions_rtree_update', 'missions_rtree_delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+    # Free-text mission names in telemetry become references to missions rows
+    conn.execute('''
+        INSERT INTO missions (name)
+        SELECT DISTINCT current_mission FROM drone_metrics
+        WHERE current_mission IS NOT NULL AND current_mission NOT IN (SELECT name FROM missions)
+    ''')
+
+    _rebuild(conn, 'missions', f'''
+        CREATE TABLE {{table}} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0 CHECK(status BETWEEN 0 AND 3),
+            start_time INTEGER,
+            end_time INTEGER,
+            waypoints TEXT,  -- JSON string of waypoints
+            created_at INTEGER NOT NULL DEFAULT ({NOW_MS})
+        )
+    ''', f'''
+        SELECT id, name, coalesce({_enum_code('status', 'mission_status')}, 0),
+               {_epoch_ms('start_time')}, {_epoch_ms('end_time')}, waypoints,
+               coalesce({_epoch_ms('created_at')}, {NOW_MS})
+        FROM missions
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_missions_name ON missions (name)')
+
+    _rebuild(conn, 'drone_metrics', '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER NOT NULL,  -- epoch milliseconds
+            latitude REAL,
+            longitude REAL,
+            speed REAL,
+            signal INTEGER,
+            arm_status INTEGER CHECK(arm_status IN (0, 1)),
+            battery INTEGER,
+            landing_station INTEGER CHECK(landing_station IN (0, 1)),
+            heading INTEGER,
+            altitude REAL,
+            mission_status INTEGER CHECK(mission_status BETWEEN 0 AND 3),
+            mission_id INTEGER REFERENCES missions(id)
+        )
+    ''', f'''
+        SELECT id, coalesce({_epoch_ms('timestamp')}, 0), latitude, longitude, speed, signal,
+               {_enum_code('arm_status', 'arm_status')}, battery,
+               {_enum_code('landing_station', 'landing_station')}, heading, altitude,
+               {_enum_code('mission_status', 'mission_status')},
+               (SELECT min(id) FROM missions WHERE missions.name = drone_metrics.current_mission)
+        FROM drone_metrics
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_drone_metrics_timestamp ON drone_metrics (timestamp, id)')
+
+    _rebuild(conn, 'mission_uploads', f'''
+        CREATE TABLE {{table}} (
+            system_id INTEGER PRIMARY KEY,
+            mission_hash TEXT NOT NULL,
+            item_count INTEGER NOT NULL,
+            opaque_id INTEGER DEFAULT 0,
+            uploaded_at INTEGER NOT NULL DEFAULT ({NOW_MS})
+        )
+    ''', f'''
+        SELECT system_id, mission_hash, item_count, opaque_id, coalesce({_epoch_ms('uploaded_at')}, {NOW_MS})
+        FROM mission_uploads
+    ''')
+
+    flights = '''
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_time INTEGER NOT NULL,
+            end_time INTEGER,
+            first_metric_id INTEGER,
+            last_metric_id INTEGER,
+            samples INTEGER DEFAULT 0,
+            duration REAL,
+            distance REAL,
+            max_altitude REAL,
+            battery_start REAL,
+            battery_end REAL,
+            battery_used REAL,
+            avg_speed REAL,
+            mission_id INTEGER REFERENCES missions(id),
+            in_progress INTEGER DEFAULT 1,
+            speed_sum REAL DEFAULT 0,
+            speed_samples INTEGER DEFAULT 0,
+            last_latitude REAL,
+            last_longitude REAL
+        )
+    '''
+    if 'flights' in _tables(conn):
+        _rebuild(conn, 'flights', flights, f'''
+            SELECT id, {_epoch_ms('start_time')}, {_epoch_ms('end_time')}, first_metric_id, last_metric_id,
+                   samples, duration, distance, max_altitude, battery_start, battery_end, battery_used,
+                   avg_speed, (SELECT min(id) FROM missions WHERE missions.name = flights.mission),
+                   in_progress, speed_sum, speed_samples, last_latitude, last_longitude
+            FROM flights
+        ''')
+    else:
+        conn.execute(flights.format(table='flights'))
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_flights_start_time ON flights (start_time)')
+
+    # Last drone_metrics id processed by each background job
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_cursors (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+
+    # Per-minute and per-hour aggregates of drone_metrics, keyed by bucket start in seconds
+    for name in ROLLUPS:
+        columns = ''.join(
+            f', {field}_min REAL, {field}_max REAL, {field}_sum REAL,'
+            f' {field}_n INTEGER DEFAULT 0, {field}_last REAL'
+            for field in ROLLUP_FIELDS)
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS drone_metrics_{name} (
+                bucket INTEGER PRIMARY KEY,
+                count INTEGER NOT NULL{columns}
+            )
+        ''')
+
+    _spatial_index(conn)
+
+
+def _spatial_index(conn):
+    """R*Tree indexes over telemetry fixes and mission waypoint bounding boxes"""
+    existing = _tables(conn)
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS telemetry_rtree USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon, min_t, max_t
+        )
+    ''')
+    seconds = f'NEW.timestamp / 1000.0 - {RTREE_EPOCH}'
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS drone_metrics_rtree_insert AFTER INSERT ON drone_metrics
+        WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+             AND NOT (NEW.latitude = 0 AND NEW.longitude = 0)
+        BEGIN
+            INSERT INTO telemetry_rtree VALUES (
+                NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude, {seconds}, {seconds}
+            );
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS drone_metrics_rtree_delete AFTER DELETE ON drone_metrics
+        BEGIN
+            DELETE FROM telemetry_rtree WHERE id = OLD.id;
+        END
+    ''')
+    # Index rows added while the insert trigger was missing: all of them for
+    # a new table, or those bulk loaded with the trigger deferred
+    seconds = f'timestamp / 1000.0 - {RTREE_EPOCH}'
+    conn.execute(f'''
+        INSERT INTO telemetry_rtree
+        SELECT id, latitude, latitude, longitude, longitude, {seconds}, {seconds}
+        FROM drone_metrics
+        WHERE id > (SELECT coalesce(max(id), 0) FROM telemetry_rtree)
+              AND latitude IS NOT NULL AND longitude IS NOT NULL
+              AND NOT (latitude = 0 AND longitude = 0)
+    ''')
+
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS mission_rtree USING rtree(
+            id, min_lat, max_lat, min_lon, max_lon
+        )
+    ''')
+    bbox = f'''
+        SELECT NEW.id, min(lat), max(lat), min(lng), max(lng)
+        FROM (SELECT {WAYPOINT_LAT} AS lat, {WAYPOINT_LNG} AS lng FROM json_each(NEW.waypoints))
+        WHERE lat IS NOT NULL AND lng IS NOT NULL
+        HAVING count(*) > 0
+    '''
+    for name, event in (('insert', 'INSERT'), ('update', 'UPDATE OF waypoints')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS missions_rtree_{name} AFTER {event} ON missions
+            WHEN json_valid(NEW.waypoints)
+            BEGIN
+                DELETE FROM mission_rtree WHERE id = NEW.id;
+                INSERT INTO mission_rtree {bbox};
+            END
+        ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS missions_rtree_delete AFTER DELETE ON missions
+        BEGIN
+            DELETE FROM mission_rtree WHERE id = OLD.id;
+        END
+    ''')
+    # Mission ids are kept across the rebuild, so existing boxes stay valid
+    if 'mission_rtree' not in existing:
+        conn.execute(f'''
+            INSERT INTO mission_rtree
+            SELECT missions.id, min({WAYPOINT_LAT}), max({WAYPOINT_LAT}),
+                   min({WAYPOINT_LNG}), max({WAYPOINT_LNG})
+            FROM missions,
+                 json_each(CASE WHEN json_valid(missions.waypoints) THEN missions.waypoints ELSE '[]' END)
+            WHERE {WAYPOINT_LAT} IS NOT NULL AND {WAYPOINT_LNG} IS NOT NULL
+            GROUP BY missions.id
+        ''')
+
+
+def _vehicles(conn):
+    """Version 3: drone_metrics.system_id, NULL for the primary vehicle"""
+    conn.execute('ALTER TABLE drone_metrics ADD COLUMN system_id INTEGER')
+
+
+def defer_metric_indexes(conn):
+    """Drop the drone_metrics timestamp index and R*Tree trigger ahead of a bulk load"""
+    conn.execute('DROP INDEX IF EXISTS idx_drone_metrics_timestamp')
+    conn.execute('DROP TRIGGER IF EXISTS drone_metrics_rtree_insert')
+
+
+def restore_metric_indexes(conn):
+    """Recreate indexes dropped by ``defer_metric_indexes`` and index the rows they missed"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_drone_metrics_timestamp ON drone_metrics (timestamp, id)')
+    _spatial_index(conn)
+
+
+# (version, migration) pairs, applied in order to databases below that version
+MIGRATIONS = [
+    (1, _baseline),
+    (2, _compact),
+    (3, _vehicles),
+]
+
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction; returns the final version"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than supported {SCHEMA_VERSION}")
+    for target, migration in MIGRATIONS:
+        if version >= target:
+            continue
+        logger.info(f"Migrating database schema to version {target}")
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        version = target
+    return version
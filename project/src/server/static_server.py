@@ -0,0 +1,104 @@
+import email.utils
+import gzip
+import logging
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite emits content-hashed bundles such as /assets/index-BRt3Xk9a.js
+HASHED_ASSET = re.compile(r'^/assets/.+-[A-Za-z0-9_-]{8,}\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Everything else, index.html in particular, is revalidated with its ETag
+REVALIDATE = 'no-cache'
+
+# Pre-built variants by Content-Encoding, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+COMPRESSIBLE = ('.js', '.mjs', '.css', '.html', '.svg', '.json', '.map', '.txt', '.wasm')
+
+MIME_TYPES = {
+    '.js': 'application/javascript',
+    '.mjs': 'application/javascript',
+    '.tsx': 'application/javascript',
+    '.css': 'text/css',
+    '.html': 'text/html',
+    '.svg': 'image/svg+xml',
+    '.json': 'application/json',
+    '.wasm': 'application/wasm',
+}
+
+
+def content_type(path):
+    return MIME_TYPES.get(os.path.splitext(path)[1]) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def cache_control(url_path):
+    return IMMUTABLE if HASHED_ASSET.match(url_path) else REVALIDATE
+
+
+def select_variant(path, accept_encoding):
+    """(file path, content encoding) of the best variant the client accepts"""
+    accepted = {value.split(';')[0].strip() for value in (accept_encoding or '').split(',')}
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def make_etag(stat, encoding):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+
+
+def not_modified(headers, etag, mtime):
+    """Whether the client's cached copy, per its request ``headers``, is still current"""
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def precompress(directory, min_size=1024):
+    """Write .gz (and .br when brotli is installed) next to each compressible file.
+
+    Variants newer than their source are left alone, so re-running after a
+    build only compresses what changed. Returns the number of files written.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+            for encoding, suffix in ENCODINGS:
+                if encoding == 'br' and brotli is None:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                data = brotli.compress(data) if encoding == 'br' else gzip.compress(data, 9, mtime=0)
+                with open(target + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(target + '.tmp', target)
+                written += 1
+    if brotli is None:
+        logger.info("brotli not installed, only gzip variants were written")
+    return written
+
@@ -0,0 +1,151 @@
+import csv
+import json
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import groupby
+
+from .archive import MetricsArchive
+from .database import METRIC_COLUMNS, day_of
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'ndjson', 'columnar')
+
+MISSION_COLUMNS = ['id', 'name', 'status', 'start_time', 'end_time', 'waypoints', 'created_at']
+
+# Fields kept as text when read back from CSV
+TEXT_FIELDS = {'arm_status', 'landing_station', 'mission_status', 'current_mission',
+               'name', 'status', 'waypoints'}
+TIME_FIELDS = {'timestamp', 'start_time', 'end_time', 'created_at'}
+
+
+def detect_format(path):
+    """Format for a path: a directory is columnar, otherwise the file extension"""
+    if os.path.isdir(path):
+        return 'columnar'
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def parse_timestamp(value):
+    """Epoch ms from an epoch-ms number or an ISO 8601 string (UTC unless stated)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(float(value))
+    except ValueError:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp() * 1000)
+
+
+@contextmanager
+def _open_text(path, mode):
+    """Open a text file, with '-' meaning stdin or stdout"""
+    if path == '-':
+        yield sys.stdout if 'w' in mode else sys.stdin
+    else:
+        with open(path, mode, newline='', encoding='utf-8') as file:
+            yield file
+
+
+def _write_rows(rows, path, fmt, columns):
+    count = 0
+    with _open_text(path, 'w') as out:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(['' if row.get(c) is None else row.get(c) for c in columns])
+                count += 1
+        else:
+            for row in rows:
+                out.write(json.dumps(row, separators=(',', ':')) + '\n')
+                count += 1
+    return count
+
+
+def _csv_value(field, value):
+    if value == '':
+        return None
+    if field in TIME_FIELDS:
+        return parse_timestamp(value)
+    if field in TEXT_FIELDS:
+        return value
+    return float(value)
+
+
+def _read_rows(path, fmt):
+    """Yield row dictionaries from a CSV or NDJSON file without loading it whole"""
+    with _open_text(path, 'r') as file:
+        if fmt == 'csv':
+            for row in csv.DictReader(file):
+                yield {field: _csv_value(field, value) for field, value in row.items()}
+        else:
+            for line in file:
+                if line.strip():
+                    row = json.loads(line)
+                    for field in TIME_FIELDS & row.keys():
+                        row[field] = parse_timestamp(row[field])
+                    yield row
+
+
+def export_metrics(db, path, fmt=None, start=None, end=None, fields=None):
+    """Stream drone_metrics rows in a time range to a file or archive directory.
+
+    ``start`` and ``end`` are epoch ms. Rows are read through
+    ``DroneDB.iter_metrics``, so archived days are included and memory stays
+    flat for any range. Returns the number of rows written.
+    """
+    fmt = fmt or detect_format(path)
+    fields = list(fields or METRIC_COLUMNS)
+    rows = db.iter_metrics(start, end, fields)
+    if fmt == 'columnar':
+        archive = MetricsArchive(path)
+        count = 0
+        for day, day_rows in groupby(rows, key=lambda row: day_of(row['timestamp'])):
+            # Each day is staged in chunks and written once, not rewritten per chunk
+            with archive.writer(day, fields) as writer:
+                writer.write(day_rows)
+            count += writer.added
+    elif fmt in FORMATS:
+        count = _write_rows(rows, path, fmt, ['id', 'timestamp'] + fields)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    logger.info(f"Exported {count} metrics rows to {path}")
+    return count
+
+
+def export_missions(db, path, fmt=None):
+    """Stream every mission to a CSV or NDJSON file; returns the number written"""
+    fmt = fmt or detect_format(path)
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f"Missions can only be exported as csv or ndjson, not {fmt}")
+    count = _write_rows(db.iter_missions(), path, fmt, MISSION_COLUMNS)
+    logger.info(f"Exported {count} missions to {path}")
+    return count
+
+
+def import_metrics(db, path, fmt=None, batch_size=50000):
+    """Bulk load drone_metrics rows from a CSV, NDJSON or columnar export"""
+    fmt = fmt or detect_format(path)
+    if fmt == 'columnar':
+        rows = MetricsArchive(path).iter_rows(fields=METRIC_COLUMNS, chunk_size=batch_size)
+    elif fmt in FORMATS:
+        rows = _read_rows(path, fmt)
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+    return db.import_metrics(rows, batch_size)
+
+
+def import_missions(db, path, fmt=None):
+    """Load missions from a CSV or NDJSON export"""
+    fmt = fmt or detect_format(path)
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f"Missions can only be imported from csv or ndjson, not {fmt}")
+    return db.import_missions(_read_rows(path, fmt))
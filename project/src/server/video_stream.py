@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = (640, 480)
+JPEG_QUALITY = 80
+
+# Seconds between reconnection attempts after the stream fails
+RETRY_INTERVAL = 1
+
+
+class FrameBroadcaster:
+    """Latest JPEG frame of one camera, shared by every viewer.
+
+    One thread reads and encodes the camera instead of one per client. It
+    starts with the first viewer and stops once the last one leaves. Viewers
+    that fall behind skip to the newest frame rather than queueing old ones.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.frame = None
+        self.sequence = 0
+        self._waiters = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def _message_frame(text, position):
+        """A black frame with a status message, for when there is no video"""
+        import cv2
+        import numpy as np
+
+        frame = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+        cv2.putText(frame, text, position, cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
+        return cv2.imencode('.jpg', frame)[1].tobytes()
+
+    def _publish(self, frame):
+        with self._lock:
+            self.frame = frame
+            self.sequence += 1
+            waiters = list(self._waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _watched(self):
+        with self._lock:
+            if not self._waiters:
+                self._thread = None
+                return False
+            return True
+
+    def _capture(self):
+        """Read and encode frames until nobody is watching"""
+        # OpenCV is only loaded once a client actually asks for video
+        import cv2
+
+        frame_received = False
+        while self._watched():
+            cap = None
+            try:
+                cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 3)
+                if not cap.isOpened():
+                    logger.error("Failed to open RTSP stream")
+                    time.sleep(RETRY_INTERVAL)
+                    continue
+
+                while self._watched():
+                    ret, frame = cap.read()
+                    if not ret:
+                        if not frame_received:
+                            logger.error("No video frames received")
+                            self._publish(self._message_frame("No Video Signal", (160, 240)))
+                        break
+                    frame_received = True
+                    frame = cv2.resize(frame, FRAME_SIZE)
+                    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                    if ret:
+                        self._publish(buffer.tobytes())
+            except Exception as e:
+                logger.error(f"Camera error: {e}")
+                self._publish(self._message_frame("Camera Error", (200, 240)))
+                time.sleep(RETRY_INTERVAL)
+            finally:
+                if cap is not None:
+                    cap.release()
+        logger.info("Video capture stopped, no viewers left")
+
+    async def frames(self):
+        """Yield each new JPEG frame as it is captured"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            self._waiters.add(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._capture, name='video-capture', daemon=True)
+                self._thread.start()
+        sequence = 0
+        try:
+            while True:
+                await event.wait()
+                event.clear()
+                with self._lock:
+                    frame, latest = self.frame, self.sequence
+                if frame is not None and latest != sequence:
+                    sequence = latest
+                    yield frame
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    async def mjpeg(self):
+        """``frames`` as multipart/x-mixed-replace parts"""
+        async for frame in self.frames():
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
@@ -11,6 +11,13 @@ export default defineConfig({
       'Access-Control-Allow-Origin': '*',
       'Access-Control-Allow-Methods': 'GET, OPTIONS',
       'Access-Control-Allow-Headers': '*',
+    },
+    // In development the API, video and WebSocket come from the Python server
+    proxy: {
+      '/api': 'http://localhost:5000',
+      '/health': 'http://localhost:5000',
+      '/video_feed': 'http://localhost:5000',
+      '/ws': { target: 'ws://localhost:5000', ws: true },
     }
   },
   build: {
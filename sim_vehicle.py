@@ -0,0 +1,266 @@
+"""
+Simulated MAVLink Vehicle
+Speaks MAVLink over local UDP to the ground station so ingestion throughput,
+command round-trip latency and CPU use can be measured without SITL or
+hardware.
+"""
+
+import argparse
+import math
+import random
+import time
+import zlib
+import logging
+from typing import Dict, List, Optional
+
+from pymavlink import mavutil
+
+from mavlink_reader import DEFAULT_MESSAGE_RATES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOME = [31.482080, 74.302944]
+
+# Shortest sleep between scheduling passes; bursts catch up on anything due
+MIN_SLEEP = 0.0005
+# Longest sleep, so commands and mission item requests are answered promptly
+MAX_SLEEP = 0.005
+
+# Newer dialects carry a mission opaque id in MISSION_COUNT and MISSION_ACK
+HAS_OPAQUE_ID = 'opaque_id' in mavutil.mavlink.MAVLink_mission_ack_message.fieldnames
+
+
+class SimulatedVehicle:
+    """One synthetic autopilot emitting heartbeats and telemetry."""
+    def __init__(self, endpoint: str = 'udpout:127.0.0.1:14550', system_id: int = 1,
+                 message_rates: Optional[Dict[str, float]] = None,
+                 fixed_rates: bool = False, ack_loss: float = 0.0, loss: float = 0.0):
+        self.connection = mavutil.mavlink_connection(
+            endpoint, source_system=system_id, source_component=mavutil.mavlink.MAV_COMP_ID_AUTOPILOT1)
+        self.system_id = system_id
+        self.message_rates = dict(DEFAULT_MESSAGE_RATES if message_rates is None else message_rates)
+        self.message_rates['HEARTBEAT'] = 1
+        # Ignore MAV_CMD_SET_MESSAGE_INTERVAL so benchmark rates stay fixed
+        self.fixed_rates = fixed_rates
+        self.ack_loss = ack_loss
+        # Fraction of telemetry messages dropped to emulate a lossy radio
+        self.loss = loss
+        self.armed = False
+        self.mode = 0
+        self.boot_time = time.monotonic()
+        self.battery = 100.0
+        self.altitude = 0.0
+        self.angle = random.uniform(0, 2 * math.pi)
+        self.sent = 0
+        self.commands_received = 0
+        # Mission held by the vehicle and any upload in progress
+        self.mission_items = []
+        self.mission_id = 0
+        self._upload = None
+        self._upload_count = 0
+        self._sent_by_type = {name: 0 for name in self.message_rates}
+        self._rate_start = {name: self.boot_time for name in self.message_rates}
+
+    def time_boot_ms(self) -> int:
+        return int((time.monotonic() - self.boot_time) * 1000) & 0xFFFFFFFF
+
+    def step(self, now: float) -> float:
+        """Send every message that is due and return when the next one is."""
+        self._handle_incoming()
+        next_due = now + 1
+        for name, rate_hz in self.message_rates.items():
+            if rate_hz <= 0:
+                continue
+            due = int((now - self._rate_start[name]) * rate_hz) + 1
+            while self._sent_by_type[name] < due:
+                self._send(name)
+                self._sent_by_type[name] += 1
+            next_due = min(next_due, self._rate_start[name] + due / rate_hz)
+        return next_due
+
+    def _send(self, name: str):
+        """Encode and send one message of the given type."""
+        mav = self.connection.mav
+        m = mavutil.mavlink
+        if self.loss and name != 'HEARTBEAT' and random.random() < self.loss:
+            # Consume a sequence number without sending, like a packet lost in the air
+            mav.seq = (mav.seq + 1) % 256
+            return
+        if name == 'HEARTBEAT':
+            self._update_dynamics()
+            base_mode = m.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+            if self.armed:
+                base_mode |= m.MAV_MODE_FLAG_SAFETY_ARMED
+            mav.heartbeat_send(m.MAV_TYPE_QUADROTOR, m.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                               base_mode, self.mode, m.MAV_STATE_ACTIVE if self.armed else m.MAV_STATE_STANDBY)
+        elif name == 'GLOBAL_POSITION_INT':
+            lat = DEFAULT_HOME[0] + 0.001 * math.sin(self.angle)
+            lon = DEFAULT_HOME[1] + 0.001 * math.cos(self.angle)
+            mav.global_position_int_send(
+                self.time_boot_ms(), int(lat * 1e7), int(lon * 1e7),
+                int(self.altitude * 1000), int(self.altitude * 1000),
+                int(500 * math.cos(self.angle)), int(-500 * math.sin(self.angle)), 0,
+                int(math.degrees(self.angle) * 100) % 36000)
+        elif name == 'SYS_STATUS':
+            mav.sys_status_send(0, 0, 0, 500, int(11100 + self.battery * 15), -1,
+                                int(self.battery), 0, 0, 0, 0, 0, 0)
+        elif name == 'VFR_HUD':
+            mav.vfr_hud_send(5.0, 5.0 if self.armed else 0.0, int(math.degrees(self.angle)) % 360,
+                             50 if self.armed else 0, self.altitude, 0.0)
+        elif name == 'ATTITUDE':
+            mav.attitude_send(self.time_boot_ms(), 0.05 * math.sin(self.angle), 0.02, self.angle, 0, 0, 0)
+        else:
+            return
+        self.sent += 1
+
+    def _update_dynamics(self):
+        """Advance the simple flight model once per heartbeat."""
+        if self.armed:
+            self.angle = (self.angle + 0.05) % (2 * math.pi)
+            self.altitude = min(50.0, self.altitude + 2.0)
+            self.battery = max(0.0, self.battery - 0.05)
+        else:
+            self.altitude = max(0.0, self.altitude - 2.0)
+
+    def _handle_incoming(self):
+        """Acknowledge commands and serve the mission protocol."""
+        while True:
+            msg = self.connection.recv_match(blocking=False)
+            if msg is None:
+                return
+            if getattr(msg, 'target_system', 0) not in (0, self.system_id):
+                continue
+            msg_type = msg.get_type()
+            if msg_type == 'COMMAND_LONG':
+                self._handle_command(msg)
+            elif msg_type == 'MISSION_COUNT':
+                self._upload = []
+                self._request_mission_item(msg, 0, msg.count)
+            elif msg_type == 'MISSION_ITEM_INT':
+                self._handle_mission_item(msg)
+            elif msg_type == 'TIMESYNC' and msg.tc1 == 0:
+                self.connection.mav.timesync_send(time.monotonic_ns(), msg.ts1)
+            elif msg_type in ('MISSION_REQUEST_INT', 'MISSION_REQUEST'):
+                self._send_mission_item(msg)
+            elif msg_type == 'MISSION_REQUEST_LIST':
+                self.connection.mav.mission_count_send(
+                    msg.get_srcSystem(), msg.get_srcComponent(), len(self.mission_items),
+                    mavutil.mavlink.MAV_MISSION_TYPE_MISSION, *self._opaque_id())
+
+    def _request_mission_item(self, msg, seq: int, count: int):
+        self._upload_count = count
+        self.connection.mav.mission_request_int_send(
+            msg.get_srcSystem(), msg.get_srcComponent(), seq,
+            mavutil.mavlink.MAV_MISSION_TYPE_MISSION)
+
+    def _handle_mission_item(self, msg):
+        """Store an uploaded item, then request the next one or accept the mission."""
+        if self._upload is None:
+            return
+        if msg.seq == len(self._upload):
+            self._upload.append((msg.seq, msg.frame, msg.command, msg.current, msg.autocontinue,
+                                 msg.param1, msg.param2, msg.param3, msg.param4, msg.x, msg.y, msg.z))
+        if len(self._upload) < self._upload_count:
+            self._request_mission_item(msg, len(self._upload), self._upload_count)
+            return
+        self.mission_items = self._upload
+        self.mission_id = zlib.crc32(repr(self.mission_items).encode('utf-8'))
+        self._upload = None
+        self.connection.mav.mission_ack_send(
+            msg.get_srcSystem(), msg.get_srcComponent(),
+            mavutil.mavlink.MAV_MISSION_ACCEPTED,
+            mavutil.mavlink.MAV_MISSION_TYPE_MISSION, *self._opaque_id())
+
+    def _send_mission_item(self, msg):
+        """Send a stored item back to a ground station downloading the mission."""
+        if msg.seq >= len(self.mission_items):
+            return
+        self.connection.mav.mission_item_int_send(
+            msg.get_srcSystem(), msg.get_srcComponent(), *self.mission_items[msg.seq],
+            mavutil.mavlink.MAV_MISSION_TYPE_MISSION)
+
+    def _opaque_id(self) -> tuple:
+        return (self.mission_id,) if HAS_OPAQUE_ID else ()
+
+    def _handle_command(self, msg):
+        self.commands_received += 1
+        m = mavutil.mavlink
+        if msg.command == m.MAV_CMD_COMPONENT_ARM_DISARM:
+            self.armed = msg.param1 == 1
+        elif msg.command == m.MAV_CMD_SET_MESSAGE_INTERVAL and not self.fixed_rates:
+            self._set_interval(int(msg.param1), msg.param2)
+        if self.ack_loss and random.random() < self.ack_loss:
+            return
+        self.connection.mav.command_ack_send(msg.command, m.MAV_RESULT_ACCEPTED)
+
+    def _set_interval(self, message_id: int, interval_us: float):
+        """Apply a MAV_CMD_SET_MESSAGE_INTERVAL request."""
+        msg_class = mavutil.mavlink.mavlink_map.get(message_id)
+        if msg_class is None:
+            return
+        name = msg_class.msgname
+        rate_hz = 0 if interval_us < 0 else (1e6 / interval_us if interval_us > 0 else DEFAULT_MESSAGE_RATES.get(name, 1))
+        self.message_rates[name] = rate_hz
+        self._sent_by_type[name] = 0
+        self._rate_start[name] = time.monotonic()
+
+
+def run(vehicles: List[SimulatedVehicle], duration: Optional[float] = None, report_interval: float = 5):
+    """Drive all vehicles from one loop and report the achieved send rate."""
+    start = last_report = time.monotonic()
+    last_sent = 0
+    try:
+        while duration is None or time.monotonic() - start < duration:
+            now = time.monotonic()
+            next_due = min(vehicle.step(now) for vehicle in vehicles)
+
+            if now - last_report >= report_interval:
+                sent = sum(vehicle.sent for vehicle in vehicles)
+                commands = sum(vehicle.commands_received for vehicle in vehicles)
+                logger.info(f"Sent {(sent - last_sent) / (now - last_report):.0f} msg/s, "
+                            f"{commands} commands received")
+                last_sent, last_report = sent, now
+
+            time.sleep(min(MAX_SLEEP, max(MIN_SLEEP, next_due - time.monotonic())))
+    except KeyboardInterrupt:
+        logger.info("Stopping simulated vehicles...")
+    finally:
+        for vehicle in vehicles:
+            vehicle.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated MAVLink vehicle')
+    parser.add_argument('--endpoint', default='udpout:127.0.0.1:14550',
+                        help='MAVLink endpoint of the ground station')
+    parser.add_argument('--rate', type=float,
+                        help='Fixed rate in Hz for every telemetry message type')
+    parser.add_argument('--count', type=int, default=1,
+                        help='Number of vehicles, with system ids starting at 1')
+    parser.add_argument('--ack-loss', type=float, default=0.0,
+                        help='Fraction of COMMAND_ACKs to drop, to exercise retries')
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help='Fraction of telemetry messages to drop, to emulate a lossy link')
+    parser.add_argument('--duration', type=float,
+                        help='Seconds to run before exiting')
+    args = parser.parse_args()
+
+    rates = None
+    if args.rate:
+        rates = {name: args.rate for name in DEFAULT_MESSAGE_RATES}
+    vehicles = [
+        SimulatedVehicle(args.endpoint, system_id, rates,
+                         fixed_rates=args.rate is not None, ack_loss=args.ack_loss,
+                         loss=args.loss)
+        for system_id in range(1, args.count + 1)
+    ]
+    logger.info(f"Simulating {len(vehicles)} vehicle(s) towards {args.endpoint}")
+    run(vehicles, args.duration)
+
+
+if __name__ == "__main__":
+    main()
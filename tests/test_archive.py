@@ -0,0 +1,25 @@
+import numpy as np
+
+from project.src.server.database import DroneDB, decode_cursor, encode_cursor
+
+DAY_MS = 86_400_000
+
+
+def test_archived_rows_keep_integer_keys_and_page_by_cursor(tmp_path):
+    db = DroneDB(str(tmp_path / 'drone.db'))
+    start = (db.now_ms() // DAY_MS - 40) * DAY_MS
+    db.import_metrics({'timestamp': start + i * 1000, 'battery': i} for i in range(10))
+    assert db.archive_metrics(retention_days=30) == 10
+
+    day = db.archive.days()[0]
+    columns = db.archive.load_day(day)
+    assert columns['id'].dtype == np.int64
+    assert columns['timestamp'].dtype == np.int64
+
+    first = list(db.iter_metrics(limit=4))
+    assert [row['timestamp'] for row in first] == [start + i * 1000 for i in range(4)]
+    cursor = encode_cursor(first[-1])
+    assert decode_cursor(cursor) == (first[-1]['timestamp'], first[-1]['id'])
+    rest = list(db.iter_metrics(cursor=cursor))
+    assert [row['battery'] for row in rest] == list(range(4, 10))
+    db.close()
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from project.src.server import database
+from project.src.server.database import DroneDB
+
+DAY_MS = 86_400_000
+
+
+def test_bbox_reports_decimation_of_archived_points(tmp_path):
+    db = DroneDB(str(tmp_path / 'drone.db'))
+    start = (db.now_ms() // DAY_MS - 40) * DAY_MS
+    db.import_metrics({'timestamp': start + i * 1000, 'latitude': 45 + (i % 50) / 1000,
+                       'longitude': -93 + (i // 50) / 1000, 'altitude': 10} for i in range(2000))
+    assert db.archive_metrics(retention_days=30) == 2000
+
+    result = db.get_telemetry_in_bbox(44.9, -93.1, 45.1, -92.9, max_points=100)
+    assert result['decimated']
+    assert 0 < len(result['points']) <= 100
+
+    result = db.get_telemetry_in_bbox(44.9, -93.1, 45.1, -92.9, max_points=5000)
+    assert not result['decimated']
+    assert len(result['points']) == 2000
+    db.close()
+
+
+def test_metrics_series_point_count_matches_request(tmp_path):
+    db = DroneDB(str(tmp_path / 'drone.db'))
+    end = db.now_ms() // 1000
+    start = end - 4 * 86400
+    # A row a minute, then a row a second over the last hour, so raw and rollup reads have data
+    epochs = list(range(start, end - 3600, 60)) + list(range(end - 3600, end))
+    db.import_metrics({'timestamp': epoch * 1000, 'battery': epoch % 100} for epoch in epochs)
+    for span, points in [(3000, 2000), (3600, 500), (7200, 100), (86400, 500), (4 * 86400, 1000)]:
+        series = db.get_metrics_series(end - span, end, points, ['battery'])
+        assert abs(len(series['points']) - points) <= 1, (span, points, len(series['points']))
+    db.close()
+
+
+def test_missions_imported_after_metrics_fill_in_placeholders(tmp_path):
+    source = DroneDB(str(tmp_path / 'source.db'))
+    source.create_mission('Survey', '[{"lat": 45.0, "lng": -93.0}]', 'Completed')
+    source.create_mission('Patrol', '[{"lat": 45.1, "lng": -93.1}]')
+    source.import_metrics({'timestamp': 1_700_000_000_000 + i * 1000, 'battery': 90,
+                           'current_mission': 'Patrol' if i % 2 else 'Survey'} for i in range(10))
+    missions = list(source.iter_missions())
+    metrics = list(source.iter_metrics())
+    source.close()
+
+    target = DroneDB(str(tmp_path / 'target.db'))
+    target.import_metrics(metrics)
+    assert target.import_missions(missions) == 2
+    assert target.import_missions(missions) == 2
+    imported = list(target.iter_missions())
+    assert [(m['name'], m['status'], m['waypoints'], m['created_at']) for m in imported] == \
+        [(m['name'], m['status'], m['waypoints'], m['created_at']) for m in missions]
+    assert [row['current_mission'] for row in target.iter_metrics()] == \
+        [row['current_mission'] for row in metrics]
+    target.close()
+
+
+def test_background_jobs_load_numpy_only_when_there_is_work(tmp_path):
+    # A fresh interpreter, since other tests have already imported numpy
+    script = f'''
+import sys, time
+from project.src.server import database
+from project.src.server.database import DroneDB
+db = DroneDB({str(tmp_path / 'drone.db')!r}, flush_interval=0.05)
+db.update_metrics_many([{{'battery': 90, 'system_id': 2}}])
+time.sleep(0.3)
+db.update_flights()
+db.archive_metrics()
+print('numpy' in sys.modules)
+db.update_metrics()
+db.update_flights()
+print('numpy' in sys.modules)
+db.close()
+'''
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    assert result.stdout.split() == ['False', 'True']
+
+
+def test_rows_trimmed_from_a_full_queue_leave_the_rollups_too(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'MAX_PENDING', 5)
+    db = DroneDB(str(tmp_path / 'drone.db'), batch_size=1000, flush_interval=60)
+    db._writer.execute('PRAGMA busy_timeout = 0')
+    blocker = sqlite3.connect(db.db_path)
+    blocker.execute('BEGIN EXCLUSIVE')
+    for battery in range(5):
+        db.update_metrics({'battery': battery})
+    # Other vehicles' rows are stored without adding to the rollups
+    db.update_metrics_many([{'battery': 50, 'system_id': 2}] * 3)
+    assert db.flush() == 0
+    blocker.rollback()
+    # The three oldest writes, primary rows, were dropped
+    assert db.flush() == 5
+
+    stored = db._reader().execute('SELECT count(*) FROM drone_metrics WHERE system_id IS NULL').fetchone()[0]
+    counted = db._reader().execute('SELECT sum(count) FROM drone_metrics_1m').fetchone()[0]
+    assert stored == counted == 2
+    db.close()
@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+
+import app
+from project.src.server.database import DroneDB
+from project.src.server.http_server import AsyncHTTPServer
+
+
+def test_streamed_wsgi_history_arrives_whole(tmp_path, monkeypatch):
+    db = DroneDB(str(tmp_path / 'drone.db'))
+    monkeypatch.setattr(app, 'DroneDB', lambda: db)
+    start = int(time.time() * 1000) - 3_600_000
+    # Enough rows for the body to take many batches
+    db.import_metrics({'timestamp': start + i, 'battery': i % 100, 'mission_status': 'Idle'}
+                      for i in range(3000))
+    system = app.DroneSystem(headless=False)
+
+    async def fetch():
+        server = AsyncHTTPServer(wsgi_app=system.app)
+        await server.start('127.0.0.1', 0)
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            url = f'http://127.0.0.1:{port}/api/metrics/history'
+            return await asyncio.get_running_loop().run_in_executor(
+                None, lambda: urllib.request.urlopen(url, timeout=10).read())
+        finally:
+            server.close()
+
+    body = asyncio.run(fetch())
+    rows = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert [row['timestamp'] for row in rows] == [start + i for i in range(3000)]
+    db.close()
+
+
+class ClosingBody:
+    """A WSGI body recording whether the server closed it"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def serve_wsgi(wsgi_app, path='/'):
+    """Status line, headers and body of one request to wsgi_app through AsyncHTTPServer"""
+    async def fetch():
+        server = AsyncHTTPServer(wsgi_app=wsgi_app)
+        await server.start('127.0.0.1', 0)
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+            response = await reader.read()
+            writer.close()
+            return response
+        finally:
+            server.close()
+
+    head, _, body = asyncio.run(fetch()).partition(b'\r\n\r\n')
+    status, *headers = head.decode('latin-1').split('\r\n')
+    return status, headers, body
+
+
+def test_not_modified_wsgi_response_closes_its_body():
+    bodies = []
+
+    def wsgi_app(environ, start_response):
+        start_response('304 NOT MODIFIED', [('ETag', '"abc"')])
+        bodies.append(ClosingBody([b'ignored']))
+        return bodies[0]
+
+    status, headers, body = serve_wsgi(wsgi_app)
+    assert status == 'HTTP/1.1 304 Not Modified'
+    assert 'ETag: "abc"' in headers
+    assert body == b''
+    assert bodies[0].closed
+    # The response's worker thread exits once its executor is shut down
+    deadline = time.monotonic() + 1
+    while any(thread.name.startswith('wsgi') for thread in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(thread.name.startswith('wsgi') for thread in threading.enumerate())
+
+
+def test_wsgi_response_with_unknown_status():
+    def wsgi_app(environ, start_response):
+        start_response('599 Network Timeout', [('Content-Type', 'text/plain')])
+        return [b'late']
+
+    status, _, body = serve_wsgi(wsgi_app)
+    assert status == 'HTTP/1.1 599 '
+    assert body == b'4\r\nlate\r\n0\r\n\r\n'
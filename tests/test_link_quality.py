@@ -0,0 +1,55 @@
+from link_quality import RESYNC_AFTER, LinkQuality
+
+
+class FakeMessage:
+    def __init__(self, seq, system=1, component=1):
+        self.seq = seq
+        self.system = system
+        self.component = component
+
+    def get_srcSystem(self):
+        return self.system
+
+    def get_srcComponent(self):
+        return self.component
+
+    def get_seq(self):
+        return self.seq
+
+    def get_msgbuf(self):
+        return b'\0' * 20
+
+
+def observe(quality, *seqs, component=1):
+    for seq in seqs:
+        quality.observe(FakeMessage(seq, component=component))
+    return quality.systems[1]
+
+
+def test_sequence_wraparound_is_not_loss():
+    stats = observe(LinkQuality(None), 253, 254, 255, 0, 1)
+    assert (stats.received, stats.lost, stats.duplicates) == (5, 0, 0)
+
+
+def test_gap_across_wraparound_counts_the_skipped_messages():
+    stats = observe(LinkQuality(None), 254, 255, 2)
+    assert stats.lost == 2
+
+
+def test_duplicates_and_reordering_are_not_loss():
+    stats = observe(LinkQuality(None), 10, 11, 11, 9, 12)
+    assert (stats.lost, stats.duplicates) == (0, 2)
+
+
+def test_sender_restart_resyncs_the_sequence():
+    # Restarting from behind the last sequence looks like reordering until RESYNC_AFTER packets in a row
+    stats = observe(LinkQuality(None), 100, 101, *range(50, 50 + RESYNC_AFTER + 1))
+    assert stats.lost == 0
+    assert stats.duplicates == 0
+
+
+def test_components_have_separate_sequences():
+    quality = LinkQuality(None)
+    observe(quality, 5, 6, component=1)
+    stats = observe(quality, 100, 101, component=2)
+    assert stats.lost == 0
@@ -0,0 +1,79 @@
+import pytest
+from pymavlink import mavutil
+
+from mavlink_commands import CommandManager, CommandTimeout
+
+MAV_CMD_ARM = mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM
+
+
+class FakeMav:
+    def __init__(self):
+        self.sent = []
+
+    def command_long_send(self, target_system, target_component, command, confirmation, *params):
+        self.sent.append((target_system, target_component, command, confirmation, params))
+
+
+class FakeConnection:
+    target_system = 1
+    target_component = 1
+
+    def __init__(self):
+        self.mav = FakeMav()
+
+
+class FakeAck:
+    def __init__(self, command, result, system=1, component=1):
+        self.command = command
+        self.result = result
+        self._system = system
+        self._component = component
+
+    def get_srcSystem(self):
+        return self._system
+
+    def get_srcComponent(self):
+        return self._component
+
+
+@pytest.fixture
+def connection():
+    return FakeConnection()
+
+
+def test_ack_resolves_the_matching_command(connection):
+    manager = CommandManager(connection, timeout=5)
+    arm = manager.send(MAV_CMD_ARM, 1)
+    land = manager.send(mavutil.mavlink.MAV_CMD_NAV_LAND)
+    manager.handle_ack(FakeAck(MAV_CMD_ARM, mavutil.mavlink.MAV_RESULT_DENIED))
+    assert arm.result(timeout=1) == mavutil.mavlink.MAV_RESULT_DENIED
+    assert not land.done()
+    # A router may rewrite the component; the command id on the same system still matches
+    manager.handle_ack(FakeAck(mavutil.mavlink.MAV_CMD_NAV_LAND, mavutil.mavlink.MAV_RESULT_ACCEPTED, component=0))
+    assert land.result(timeout=1) == mavutil.mavlink.MAV_RESULT_ACCEPTED
+    assert manager.in_flight() == 0
+    manager.close()
+
+
+def test_unacknowledged_command_is_retried_with_incremented_confirmation(connection):
+    manager = CommandManager(connection, timeout=0.05, retries=2)
+    future = manager.send(MAV_CMD_ARM, 1)
+    with pytest.raises(CommandTimeout):
+        future.result(timeout=2)
+    assert [sent[3] for sent in connection.mav.sent] == [0, 1, 2]
+    assert all(sent[4] == (1.0,) + (0.0,) * 6 for sent in connection.mav.sent)
+    manager.close()
+
+
+def test_identical_in_flight_command_is_sent_once(connection):
+    manager = CommandManager(connection, timeout=5)
+    first = manager.send(MAV_CMD_ARM, 1)
+    assert manager.send(MAV_CMD_ARM, 1) is first
+    assert len(connection.mav.sent) == 1
+    # Different parameters supersede the command in flight
+    second = manager.send(MAV_CMD_ARM, 0)
+    assert second is not first
+    with pytest.raises(CommandTimeout):
+        first.result(timeout=1)
+    assert len(connection.mav.sent) == 2
+    manager.close()
@@ -0,0 +1,39 @@
+import sqlite3
+
+from project.src.server.database import DroneDB
+from project.src.server.schema import SCHEMA_VERSION, _baseline
+
+
+def test_legacy_text_database_is_migrated(tmp_path):
+    path = str(tmp_path / 'drone.db')
+    conn = sqlite3.connect(path)
+    with conn:
+        _baseline(conn)
+        conn.execute("INSERT INTO missions (name, status, start_time, created_at) "
+                     "VALUES ('Survey', 'Running', '2024-05-01 12:00:00', '2024-05-01 11:00:00')")
+        conn.execute('''
+            INSERT INTO drone_metrics (latitude, longitude, arm_status, battery, landing_station,
+                                       mission_status, current_mission, timestamp)
+            VALUES (45.0, -93.0, 'Armed', 80, 'Open', 'Running', 'Survey', '2024-05-01 12:00:01'),
+                   (45.1, -93.1, 'Disarmed', 70, 'Closed', 'Completed', 'Patrol', '2024-05-01 12:00:02.500')
+        ''')
+    conn.close()
+
+    db = DroneDB(path, retention_days=None)
+    reader = db._reader()
+    assert reader.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    rows = reader.execute('''
+        SELECT arm_status, landing_station, mission_status, timestamp, mission_id, system_id
+        FROM drone_metrics ORDER BY id
+    ''').fetchall()
+    missions = dict(reader.execute('SELECT name, id FROM missions').fetchall())
+    assert rows == [
+        (1, 1, 1, 1714564801000, missions['Survey'], None),
+        (0, 0, 2, 1714564802500, missions['Patrol'], None),
+    ]
+    assert reader.execute("SELECT status, start_time, created_at FROM missions WHERE name = 'Survey'").fetchone() \
+        == (1, 1714564800000, 1714561200000)
+    # Read back through DroneDB with names restored
+    assert [(row['arm_status'], row['current_mission']) for row in db.iter_metrics()] == \
+        [('Armed', 'Survey'), ('Disarmed', 'Patrol')]
+    db.close()
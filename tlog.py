@@ -0,0 +1,158 @@
+"""
+MAVLink Telemetry Logs
+Records the incoming MAVLink stream to a tlog file and replays recorded
+tlogs through the normal ingestion path.
+"""
+
+import struct
+import threading
+import time
+import logging
+from typing import Optional
+
+from pymavlink import mavutil
+
+logger = logging.getLogger(__name__)
+
+
+class TlogRecorder:
+    """Writes received MAVLink messages to a tlog file.
+
+    Each record is a big-endian 64-bit microsecond timestamp followed by the
+    raw message bytes, the same format pymavlink and ground stations read.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+        logger.info(f"Recording MAVLink stream to {path}")
+
+    def write(self, msg):
+        """Append one message with its receive timestamp."""
+        timestamp = getattr(msg, '_timestamp', None) or time.time()
+        usec = int(timestamp * 1.0e6) & ~3
+        with self._lock:
+            if self._file:
+                self._file.write(struct.pack('>Q', usec) + msg.get_msgbuf())
+                self.count += 1
+
+    def close(self):
+        """Flush and close the tlog file."""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        logger.info(f"Stopped recording {self.count} messages to {self.path}")
+
+
+class _NullWriter:
+    """Discards anything the replayed link tries to send."""
+    def write(self, buf):
+        pass
+
+
+class TlogReplaySource:
+    """Replays a tlog file as if it were a live vehicle connection.
+
+    Provides the subset of the pymavlink connection interface used by
+    MavlinkReader. ``speed`` is a multiple of real time; 0 replays as fast
+    as the reader can consume messages.
+    """
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.log = mavutil.mavlink_connection(path)
+        self._reset_loss()
+        # Commands sent during replay go nowhere
+        self.mav = mavutil.mavlink.MAVLink(_NullWriter(), srcSystem=255, srcComponent=0)
+        self.target_system = 0
+        self.target_component = 0
+        self.finished = False
+        self.replayed = 0
+        self._pending = None
+        self._log_start = None
+        self._wall_start = None
+
+    @property
+    def mav_loss(self) -> int:
+        return self.log.mav_loss
+
+    def wait_heartbeat(self, blocking: bool = True, timeout: Optional[float] = None):
+        """Lock onto the first vehicle heartbeat in the log."""
+        while True:
+            msg = self.recv_match(blocking=blocking, timeout=timeout)
+            if msg is None or msg.get_type() == 'HEARTBEAT':
+                return msg
+
+    def recv_match(self, condition=None, type=None, blocking: bool = False,
+                   timeout: Optional[float] = None):
+        """Return the next message once its replay time has come."""
+        if type is not None and not isinstance(type, (list, set, tuple)):
+            type = [type]
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            msg = self._pending or self._next_message()
+            self._pending = None
+            if msg is None:
+                # End of log: behave like an idle link
+                if blocking and deadline is not None:
+                    time.sleep(max(0.0, deadline - time.monotonic()))
+                return None
+
+            delay = self._delay(msg)
+            if delay > 0:
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    time.sleep(max(0.0, deadline - time.monotonic()))
+                    self._pending = msg
+                    return None
+                time.sleep(delay)
+
+            self.replayed += 1
+            if type is None or msg.get_type() in type:
+                return msg
+            if not blocking:
+                return None
+
+    def close(self):
+        self.finished = True
+        self.log.close()
+
+    def _next_message(self):
+        """Read the next message from the log, rewinding when looping."""
+        if self.finished:
+            return None
+        msg = self.log.recv_msg()
+        if msg is None and self.loop:
+            self.log.rewind()
+            self.log.last_seq = {}
+            self._log_start = None
+            msg = self.log.recv_msg()
+        if msg is None:
+            self.finished = True
+            logger.info(f"Replay of {self.path} finished after {self.replayed} messages")
+            return None
+
+        if (not self.target_system and msg.get_type() == 'HEARTBEAT'
+                and msg.type != mavutil.mavlink.MAV_TYPE_GCS):
+            self.target_system = msg.get_srcSystem()
+            self.target_component = msg.get_srcComponent()
+        return msg
+
+    def _reset_loss(self):
+        """Forget sequence numbers seen while pymavlink indexed the file."""
+        self.log.last_seq = {}
+        self.log.mav_loss = 0
+
+    def _delay(self, msg) -> float:
+        """Seconds to wait before releasing a message at the replay speed."""
+        if not self.speed or self.speed <= 0:
+            return 0.0
+        if self._log_start is None:
+            self._log_start = msg._timestamp
+            self._wall_start = time.monotonic()
+            return 0.0
+        due = self._wall_start + (msg._timestamp - self._log_start) / self.speed
+        return due - time.monotonic()
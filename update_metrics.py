@@ -1,9 +1,11 @@
-import sqlite3
-import random
+import argparse
 import time
 import os
 import logging
 from datetime import datetime
+from project.src.server.clock import SimClock
+from project.src.server.database import DroneDB
+from project.src.server.fleet import FleetSimulator, load_missions
 
 # Configure logging
 logging.basicConfig(
@@ -13,19 +15,23 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class DroneMetricsUpdater:
-    def __init__(self):
+    def __init__(self, clock=None):
         self.db_path = os.path.join(os.getcwd(), "project", "database", "drone.db")
+        # The clock paces updates and supplies timestamps and random values
+        self.clock = clock or SimClock()
+        self.random = self.clock.random
+        self.db = DroneDB(self.db_path, clock=self.clock)
         self.last_values = None
         self.update_interval = 1  # seconds
-        self.mission_duration = random.randint(30, 60)  # Random mission duration
+        self.mission_duration = self.random.randint(30, 60)  # Random mission duration
         self.mission_timer = 0
 
     def get_realistic_random_values(self):
         """Generate random values with realistic changes from last values"""
         if not self.last_values:
             self.last_values = {
-                'latitude': random.uniform(31.4509, 31.4511),
-                'longitude': random.uniform(74.2931, 74.2933),
+                'latitude': self.random.uniform(31.4509, 31.4511),
+                'longitude': self.random.uniform(74.2931, 74.2933),
                 'speed': 0,
                 'signal': 95,
                 'arm_status': 'Disarmed',
@@ -41,7 +47,7 @@ class DroneMetricsUpdater:
         self.mission_timer += 1
         if self.mission_timer >= self.mission_duration:
             self.mission_timer = 0
-            self.mission_duration = random.randint(30, 60)
+            self.mission_duration = self.random.randint(30, 60)
             
         # Determine mission status based on timer
         if self.mission_timer == 0:
@@ -49,20 +55,20 @@ class DroneMetricsUpdater:
         elif self.mission_timer == 1:
             mission_status = 'Running'
         elif self.mission_timer == self.mission_duration:
-            mission_status = random.choice(['Completed', 'Failed'])
+            mission_status = self.random.choice(['Completed', 'Failed'])
         else:
             mission_status = self.last_values['mission_status']
         
         new_values = {
-            'latitude': self.last_values['latitude'] + random.uniform(-0.0001, 0.0001),
-            'longitude': self.last_values['longitude'] + random.uniform(-0.0001, 0.0001),
-            'speed': max(0, min(30, self.last_values['speed'] + random.uniform(-2, 2))),
-            'signal': max(0, min(100, self.last_values['signal'] + random.uniform(-5, 5))),
+            'latitude': self.last_values['latitude'] + self.random.uniform(-0.0001, 0.0001),
+            'longitude': self.last_values['longitude'] + self.random.uniform(-0.0001, 0.0001),
+            'speed': max(0, min(30, self.last_values['speed'] + self.random.uniform(-2, 2))),
+            'signal': max(0, min(100, self.last_values['signal'] + self.random.uniform(-5, 5))),
             'arm_status': 'Armed' if mission_status == 'Running' else 'Disarmed',
-            'battery': max(0, self.last_values['battery'] - random.uniform(0, 0.1)),
+            'battery': max(0, self.last_values['battery'] - self.random.uniform(0, 0.1)),
             'landing_station': 'Open' if mission_status == 'Running' else 'Closed',
-            'heading': (self.last_values['heading'] + random.uniform(-10, 10)) % 360,
-            'altitude': max(0, min(100, self.last_values['altitude'] + random.uniform(-1, 1))),
+            'heading': (self.last_values['heading'] + self.random.uniform(-10, 10)) % 360,
+            'altitude': max(0, min(100, self.last_values['altitude'] + self.random.uniform(-1, 1))),
             'mission_status': mission_status,
             'current_mission': 'Sample Mission'
         }
@@ -71,74 +77,88 @@ class DroneMetricsUpdater:
         return new_values
 
     def update_database(self):
-        """Update database with new random values"""
+        """Queue new random values for the database's next batch commit"""
         try:
+            previous_status = self.last_values['mission_status'] if self.last_values else None
             metrics = self.get_realistic_random_values()
-            
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Update drone metrics
-                cursor.execute('''
-                    INSERT INTO drone_metrics 
-                    (latitude, longitude, speed, signal, arm_status, battery, 
-                     landing_station, heading, altitude, mission_status, current_mission)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    metrics['latitude'],
-                    metrics['longitude'],
-                    metrics['speed'],
-                    metrics['signal'],
-                    metrics['arm_status'],
-                    metrics['battery'],
-                    metrics['landing_station'],
-                    metrics['heading'],
-                    metrics['altitude'],
-                    metrics['mission_status'],
-                    metrics['current_mission']
-                ))
-                
-                # Update mission status if changed
-                if metrics['mission_status'] != self.last_values.get('mission_status'):
-                    cursor.execute('''
-                        UPDATE missions 
-                        SET status = ?,
-                            start_time = CASE 
-                                WHEN status = 'Running' THEN CURRENT_TIMESTAMP 
-                                ELSE start_time 
-                            END,
-                            end_time = CASE 
-                                WHEN status IN ('Completed', 'Failed') THEN CURRENT_TIMESTAMP 
-                                ELSE end_time 
-                            END
-                        WHERE name = ?
-                    ''', (metrics['mission_status'], metrics['current_mission']))
-                
-                conn.commit()
-                
+
+            # Update drone metrics
+            self.db.update_metrics(metrics)
+
+            # Update mission status if changed
+            if metrics['mission_status'] != previous_status:
+                self.db.update_mission_status(metrics['current_mission'], metrics['mission_status'])
+
             return True
         except Exception as e:
             logger.error(f"Failed to update metrics: {e}")
             return False
 
-    def run(self):
-        """Run continuous updates"""
-        logger.info("Starting drone metrics updater...")
+    def run(self, duration=None):
+        """Run updates, for ``duration`` clock seconds when given"""
+        logger.info(f"Starting drone metrics updater on {self.clock}...")
+        start = self.clock.time()
         try:
-            while True:
+            while duration is None or self.clock.time() - start < duration:
                 if self.update_database():
-                    logger.info("Updated metrics successfully")
+                    logger.debug("Updated metrics successfully")
                 else:
                     logger.error("Failed to update metrics")
-                time.sleep(self.update_interval)
+                self.clock.sleep(self.update_interval)
         except KeyboardInterrupt:
             logger.info("Stopping drone metrics updater...")
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
+        finally:
+            self.db.close()
+
+class FleetMetricsUpdater:
+    """Feeds a whole simulated fleet into the database, one batch per tick"""
+    def __init__(self, count, clock=None):
+        self.db_path = os.path.join(os.getcwd(), "project", "database", "drone.db")
+        self.clock = clock or SimClock()
+        # One tick of the fleet fits in a single batch commit
+        self.db = DroneDB(self.db_path, batch_size=max(50, count), clock=self.clock)
+        self.fleet = FleetSimulator(count, load_missions(self.db), seed=self.clock.seed)
+        self.update_interval = 1  # seconds
+
+    def run(self, duration=None):
+        """Run ticks on a fixed clock schedule, reporting rows per real second"""
+        logger.info(f"Starting fleet simulator with {self.fleet.count} drones on "
+                    f"{len(self.fleet.mission_names)} routes, {self.clock}...")
+        start = next_tick = self.clock.time()
+        real_start = time.monotonic()
+        rows = 0
+        try:
+            while duration is None or self.clock.time() - start < duration:
+                self.fleet.step(self.update_interval)
+                rows += self.db.update_metrics_many(self.fleet.rows())
+                if self.fleet.ticks % 10 == 0:
+                    logger.info(f"Tick {self.fleet.ticks}: "
+                                f"{rows / max(time.monotonic() - real_start, 1e-9):.0f} rows/s")
+                next_tick += self.update_interval
+                self.clock.sleep(max(0, next_tick - self.clock.time()))
+        except KeyboardInterrupt:
+            logger.info("Stopping fleet simulator...")
+        finally:
+            self.db.close()
 
 def main():
-    updater = DroneMetricsUpdater()
-    updater.run()
+    parser = argparse.ArgumentParser(description='Simulated drone metrics updater')
+    parser.add_argument('--drones', type=int, default=0,
+                        help='Simulate a fleet of this many drones instead of a single one')
+    parser.add_argument('--duration', type=float, help='Simulated seconds to run before exiting')
+    parser.add_argument('--seed', type=int, help='Random seed, for reproducible runs')
+    parser.add_argument('--speed', type=float,
+                        help='Run on a virtual clock at this multiple of real time (0 = as fast as possible)')
+    args = parser.parse_args()
+
+    clock = SimClock(args.speed, args.seed)
+    if args.drones:
+        FleetMetricsUpdater(args.drones, clock).run(args.duration)
+    else:
+        updater = DroneMetricsUpdater(clock)
+        updater.run(args.duration)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
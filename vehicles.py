@@ -0,0 +1,92 @@
+"""
+Vehicle Registry
+Tracks every vehicle seen on a MAVLink link and its telemetry state.
+"""
+
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+
+from pymavlink import mavutil
+
+logger = logging.getLogger(__name__)
+
+
+class Vehicle:
+    """Telemetry state and addressing for one vehicle on the link."""
+    def __init__(self, system_id: int, component_id: int, state: Optional[dict] = None):
+        self.system_id = system_id
+        self.component_id = component_id
+        self.state = state if state is not None else {}
+        self.state['Status'] = 'Connected'
+        self.last_heartbeat = None
+
+    def to_dict(self) -> dict:
+        """Serializable view of the vehicle for the REST and WebSocket APIs."""
+        return {
+            'id': self.system_id,
+            'component': self.component_id,
+            'state': dict(self.state),
+        }
+
+
+class VehicleRegistry:
+    """Demultiplexes one MAVLink link into per-vehicle state by system id.
+
+    The primary vehicle (the one the connection locked onto) shares the
+    state dictionary passed in, so single-vehicle consumers of DRONE_STATE
+    keep working unchanged.
+    """
+    def __init__(self, primary_state: dict, on_register: Optional[Callable[[Vehicle], None]] = None):
+        self.primary_state = primary_state
+        self.on_register = on_register
+        self.primary_system = None
+        self._vehicles: Dict[int, Vehicle] = {}
+        self._lock = threading.Lock()
+
+    def get(self, system_id: int) -> Optional[Vehicle]:
+        return self._vehicles.get(system_id)
+
+    def route(self, msg, primary_system: int = 0) -> Optional[Vehicle]:
+        """Return the vehicle a message belongs to, registering new vehicles on heartbeat."""
+        vehicle = self._vehicles.get(msg.get_srcSystem())
+        if vehicle is not None or msg.get_type() != 'HEARTBEAT':
+            return vehicle
+        # Only autopilot heartbeats create vehicles; ground stations,
+        # cameras and gimbals on the same link are skipped.
+        if (msg.type == mavutil.mavlink.MAV_TYPE_GCS
+                or msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID):
+            return None
+        return self.register(msg.get_srcSystem(), msg.get_srcComponent(), primary_system)
+
+    def register(self, system_id: int, component_id: int, primary_system: int = 0) -> Vehicle:
+        """Add a vehicle; the connection's target system gets the primary state."""
+        with self._lock:
+            vehicle = self._vehicles.get(system_id)
+            if vehicle is not None:
+                return vehicle
+            is_primary = self.primary_system is None and system_id == (primary_system or system_id)
+            if is_primary:
+                self.primary_system = system_id
+            vehicle = Vehicle(system_id, component_id, self.primary_state if is_primary else None)
+            self._vehicles[system_id] = vehicle
+        logger.info(f"New vehicle on link: system {system_id}, component {component_id}"
+                    f"{' (primary)' if is_primary else ''}")
+        if self.on_register:
+            self.on_register(vehicle)
+        return vehicle
+
+    def all(self) -> List[Vehicle]:
+        with self._lock:
+            return list(self._vehicles.values())
+
+    def ids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._vehicles)
+
+    def snapshot(self) -> Dict[int, dict]:
+        """Copy of every vehicle's state keyed by system id."""
+        return {vehicle.system_id: dict(vehicle.state) for vehicle in self.all()}
+
+    def __len__(self) -> int:
+        return len(self._vehicles)
@@ -2,6 +2,14 @@ import sqlite3
 import time
 import os
 
+from project.src.server.schema import decode_enum
+
+def format_ms(timestamp):
+    """Local time string for an epoch-ms timestamp"""
+    if timestamp is None:
+        return None
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp / 1000))
+
 def monitor_metrics():
     try:
         # Get the absolute path to the database
@@ -19,8 +27,11 @@ def monitor_metrics():
             
             # Get latest drone metrics
             cursor.execute('''
-                SELECT * FROM drone_metrics 
-                ORDER BY timestamp DESC 
+                SELECT m.latitude, m.longitude, m.speed, m.signal, m.arm_status, m.battery,
+                       m.landing_station, m.heading, m.altitude, m.mission_status, m.timestamp,
+                       s.name, s.status, s.start_time, s.end_time, s.waypoints
+                FROM drone_metrics m LEFT JOIN missions s ON s.id = m.mission_id
+                ORDER BY m.timestamp DESC
                 LIMIT 1
             ''')
             
@@ -28,35 +39,29 @@ def monitor_metrics():
             if row:
                 print("\nCurrent Drone Metrics:")
                 print("=" * 50)
-                print(f"Latitude:        {row[1]:.6f}°")
-                print(f"Longitude:       {row[2]:.6f}°")
-                print(f"Speed:           {row[3]:.1f} m/s")
-                print(f"Signal:          {row[4]}%")
-                print(f"Arm Status:      {row[5]}")
-                print(f"Battery:         {row[6]}%")
-                print(f"Landing Station: {row[7]}")
-                print(f"Heading:         {row[8]}°")
-                print(f"Altitude:        {row[9]:.1f} m")
-                print(f"Mission Status:  {row[10]}")
+                print(f"Latitude:        {row[0]:.6f}°")
+                print(f"Longitude:       {row[1]:.6f}°")
+                print(f"Speed:           {row[2]:.1f} m/s")
+                print(f"Signal:          {row[3]}%")
+                print(f"Arm Status:      {decode_enum('arm_status', row[4])}")
+                print(f"Battery:         {row[5]}%")
+                print(f"Landing Station: {decode_enum('landing_station', row[6])}")
+                print(f"Heading:         {row[7]}°")
+                print(f"Altitude:        {row[8]:.1f} m")
+                print(f"Mission Status:  {decode_enum('mission_status', row[9])}")
                 print(f"Current Mission: {row[11]}")
-                print(f"Timestamp:       {row[12]}")
+                print(f"Timestamp:       {format_ms(row[10])}")
                 print("=" * 50)
                 
-                # Get mission details
-                cursor.execute('''
-                    SELECT * FROM missions
-                    WHERE name = ?
-                ''', (row[11],))
-                
-                mission = cursor.fetchone()
-                if mission:
+                # Mission details
+                if row[11]:
                     print("\nMission Details:")
                     print("=" * 50)
-                    print(f"Name:       {mission[1]}")
-                    print(f"Status:     {mission[2]}")
-                    print(f"Started:    {mission[3] or 'Not started'}")
-                    print(f"Completed:  {mission[4] or 'In progress'}")
-                    print(f"Waypoints:  {mission[5]}")
+                    print(f"Name:       {row[11]}")
+                    print(f"Status:     {decode_enum('mission_status', row[12])}")
+                    print(f"Started:    {format_ms(row[13]) or 'Not started'}")
+                    print(f"Completed:  {format_ms(row[14]) or 'In progress'}")
+                    print(f"Waypoints:  {row[15]}")
                     print("=" * 50)
             else:
                 print("\nNo data in database yet")